@@ -19,6 +19,24 @@ import sys
 import os
 import argparse
 import imghdr
+import time
+
+METHODS = ["MMGS", "INSTANT", "QUADRIFLOW", "MESHLAB", "DEIMATE", "ITERATIVE", "DECIMATE"]
+#Executable of the external remeshers, and their name in the error messages
+EXECUTABLES = {
+    "MMGS":       ("mmgs",          "MMGS"),
+    "INSTANT":    ("instant",       "Instant Meshes"),
+    "QUADRIFLOW": ("quadriflow",    "Quadriflow"),
+    "MESHLAB":    ("meshlabserver", "Meshlabserver"),
+}
+
+def check_method(method):
+    """Returns why a remeshing method can not be used, None if it can"""
+    if method not in METHODS:
+        return "invalid method name"
+    if method in EXECUTABLES and bpy.types.Scene.executables[EXECUTABLES[method][0]] == "":
+        return "%s is not configured in the user preferences" % EXECUTABLES[method][1]
+    return None
 
 def get_args():
     """Processes the command line arguments"""
@@ -92,37 +110,43 @@ def get_args():
     args.emission     = check_valid_file(args.emission, _image=True)
     args.opacity      = check_valid_file(args.opacity, _image=True)
 
-    if args.method not in ["MMGS", "INSTANT", "QUADRIFLOW", "MESHLAB", "DEIMATE", "ITERATIVE", "DECIMATE"]:
-        parser.print_help()
-        print('ERROR: invalid method name')
-        sys.exit(5)
-    if args.method == "MMGS" and bpy.types.Scene.executables["mmgs"] == "":
-        print("MMGS is not configured in the user preferences")
-        sys.exit(6)
-    if args.method == "INSTANT" and bpy.types.Scene.executables["instant"] == "":
-        print("Instant Meshes is not configured in the user preferences")
-        sys.exit(7)
-    if args.method == "QUADRIFLOW" and bpy.types.Scene.executables["quadriflow"] == "":
-        print("Quadriflow is not configured in the user preferences")
-        sys.exit(8)
-    if args.method == "MESHLAB" and bpy.types.Scene.executables["meshlabserver"] == "":
-        print("Meshlabserver is not configured in the user preferences")
-        sys.exit(9)
+    error = check_method(args.method)
+    if error is not None:
+        if args.method not in METHODS:
+            parser.print_help()
+            print('ERROR: ' + error)
+            sys.exit(5)
+        print(error)
+        sys.exit(6 + list(EXECUTABLES).index(args.method))
 
     return args
 
-if __name__ == "__main__":
-
-    #Parse the arguments
-    args = get_args()
-
-    #Setup
-    bpy.ops.object.select_all(action='SELECT')
-    bpy.ops.object.delete(use_global=False)
+def reset():
+    """Removes all the objects and the datablocks they leave unused"""
+    if bpy.context.object is not None and bpy.context.object.mode != "OBJECT":
+        bpy.ops.object.mode_set(mode="OBJECT")
+    #Remove the objects directly, as the delete operator skips the hidden ones
+    for obj in list(bpy.data.objects):
+        bpy.data.objects.remove(obj, do_unlink=True)
+    #Removing a datablock can leave others unused (nested groups, images), loop until nothing is left
+    removed = True
+    while removed:
+        removed = False
+        for collection in [bpy.data.meshes, bpy.data.materials, bpy.data.node_groups, bpy.data.textures, bpy.data.images]:
+            for block in [b for b in collection if b.users == 0]:
+                collection.remove(block)
+                removed = True
     bpy.context.scene.render.engine = "CYCLES"
 
+def process(args, timings=None):
+    """Imports, cleans, remeshes, unwraps, bakes and exports one model, recording the duration of each step in timings"""
+    timings = {} if timings is None else timings
+
     #Import
+    t = time.time()
     bpy.ops.bakemyscan.import_scan(filepath = args.input)
+    timings["import"] = time.time() - t
+    t = time.time()
     bpy.ops.bakemyscan.clean_object()
     original = bpy.context.active_object
 
@@ -142,8 +166,10 @@ if __name__ == "__main__":
     assign("height", args.displacement)
     assign("emission", args.emission)
     assign("opacity", args.opacity)
+    timings["clean"] = time.time() - t
 
     #Remesh
+    t = time.time()
     if args.method == "MMGS":
         bpy.ops.bakemyscan.remesh_mmgs(hausd=args.target)
     elif args.method == "INSTANT":
@@ -158,12 +184,16 @@ if __name__ == "__main__":
         bpy.ops.bakemyscan.remesh_quads(ratio=args.target)
     elif args.method == "DECIMATE":
         bpy.ops.bakemyscan.remesh_decimate(limit=args.target)
+    timings["remesh"] = time.time() - t
 
     #Unwrap and smooth
+    t = time.time()
     bpy.ops.bakemyscan.unwrap(method="smarter")
     bpy.ops.object.shade_smooth()
+    timings["unwrap"] = time.time() - t
 
     #Bake
+    t = time.time()
     original.select_set(True)
     bpy.ops.bakemyscan.bake_textures(
         resolution    = args.resolution,
@@ -176,8 +206,23 @@ if __name__ == "__main__":
         bake_emission = args.emission is not None,
         bake_opacity  = args.opacity is not None,
     )
+    timings["bake"] = time.time() - t
 
     #Export
+    t = time.time()
     original.select_set(False)
     bpy.ops.bakemyscan.remove_all_but_selected()
     bpy.ops.bakemyscan.export(filepath=args.output, compress=args.zip)
+    timings["export"] = time.time() - t
+    return timings
+
+if __name__ == "__main__":
+
+    #Parse the arguments
+    args = get_args()
+
+    #Setup
+    reset()
+
+    #Process the model
+    process(args)
@@ -0,0 +1,127 @@
+"""
+Reprocess many models to lowpoly versions in a single Blender session
+
+Examples:
+blender -b -P bakemyscan_batch.py -- manifest.json
+blender -b -P bakemyscan_batch.py -- manifest.csv -l timings.json
+
+The manifest is either a .json list of objects or a .csv file with a header
+line, each item using the long option names of bakemyscan.py:
+input, output, zip, method, target, resolution, color, metallic, roughness,
+glossiness, ao, normal, displacement, emission, opacity
+Only input and output are required, relative paths are relative to the manifest.
+
+[
+    {"input": "statue/scan.obj", "output": "out/statue.fbx", "color": "statue/albedo.jpg", "method": "QUADRIFLOW", "target": 3000},
+    {"input": "rock/scan.ply",   "output": "out/rock.fbx",   "resolution": 2048}
+]
+
+Each model goes through import -> clean -> remesh -> unwrap -> bake -> export,
+and the scene is purged in between so that memory stays flat. The timings of
+every step are appended to the JSON log after each model.
+"""
+
+import sys
+import os
+import csv
+import json
+import time
+import argparse
+import traceback
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+import bakemyscan
+
+DEFAULTS = {
+    "zip": False,
+    "method": "ITERATIVE",
+    "target": 1500,
+    "resolution": 1024,
+    "color": None,
+    "metallic": None,
+    "roughness": None,
+    "glossiness": None,
+    "ao": None,
+    "normal": None,
+    "displacement": None,
+    "emission": None,
+    "opacity": None
+}
+FILES = ["input", "output", "color", "metallic", "roughness", "glossiness", "ao", "normal", "displacement", "emission", "opacity"]
+
+def get_args():
+    """Processes the command line arguments"""
+    argv = sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else []
+    parser = argparse.ArgumentParser(description="Remesh many scans to lowpoly models in one blender session")
+    parser.prog = "blender -b -P /path/to/bakemyscan_batch.py --"
+    parser.add_argument("manifest", type=str, help="Manifest of the models to process (.json or .csv)")
+    parser.add_argument("-l", "--log", type=str, default=None, help="JSON log of the timings (defaults to the manifest name with a _log.json suffix)")
+    args = parser.parse_args(argv)
+    if not os.path.exists(args.manifest) or os.path.splitext(args.manifest)[1].lower() not in [".json", ".csv"]:
+        parser.print_help()
+        print('ERROR: "%s" is not a .json or .csv manifest' % args.manifest)
+        sys.exit(1)
+    if args.log is None:
+        args.log = os.path.splitext(args.manifest)[0] + "_log.json"
+    return args
+
+def read_manifest(path):
+    """Returns the manifest items as argparse namespaces, with the defaults filled, absolute paths and the method checked"""
+    if path.lower().endswith(".json"):
+        with open(path) as f:
+            rows = json.load(f)
+    else:
+        with open(path, newline="") as f:
+            rows = [{k: v for k, v in row.items() if v not in ["", None]} for row in csv.DictReader(f)]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    items = []
+    for row in rows:
+        item = dict(DEFAULTS)
+        item.update(row)
+        for k in FILES:
+            if item.get(k) is not None:
+                item[k] = os.path.join(directory, item[k])
+        item["zip"]        = str(item["zip"]).lower() in ["1", "true", "yes"]
+        item["target"]     = int(item["target"])
+        item["resolution"] = int(item["resolution"])
+        #Remeshing method which can not be used, failing the item
+        item["error"]      = bakemyscan.check_method(item["method"])
+        items.append(argparse.Namespace(**item))
+    return items
+
+if __name__ == "__main__":
+
+    #Parse the arguments and the manifest
+    args  = get_args()
+    items = read_manifest(args.manifest)
+
+    log = []
+    for i, item in enumerate(items):
+        print("%d / %d - %s -> %s" % (i+1, len(items), item.input, item.output))
+        entry = {"input": item.input, "output": item.output, "status": "done", "timings": {}}
+        t = time.time()
+        try:
+            if item.error is not None:
+                raise ValueError("%s: %s" % (item.method, item.error))
+            missing = [k for k in FILES if getattr(item, k) is not None and k != "output" and not os.path.exists(getattr(item, k))]
+            if len(missing):
+                raise FileNotFoundError("Missing files for %s" % ", ".join(missing))
+            bakemyscan.reset()
+            bakemyscan.process(item, entry["timings"])
+        except Exception as e:
+            traceback.print_exc()
+            entry["status"] = "failed"
+            entry["error"]  = str(e)
+        entry["total"] = time.time() - t
+
+        #Write the log after each model, so that it is usable if the batch is interrupted
+        log.append(entry)
+        with open(args.log, "w") as f:
+            json.dump(log, f, indent=4)
+
+    #Purge the last model and summarize
+    bakemyscan.reset()
+    print("\nSUMMARY:")
+    for entry in log:
+        print("%6s %8.1fs %s" % (entry["status"], entry["total"], entry["input"]))
@@ -2,20 +2,29 @@
 Remesh multiple scans in a directory to lowpoly assets
 
 Usage:
-python3.5 bakeAll.py -i INDIR -o OUTDIR -p PREFIX [-t TARGETFACES] [-r RESOLUTION]
+python3 blender_bake_mulitple_models.py -i INDIR -o OUTDIR -p PREFIX [-t TARGETFACES] [-r RESOLUTION] [-j JOBS] [--retries N] [--non-interactive]
 
 For instance, to rename all models in the /home/loic/Downloads directory into /media/loic/assets/ 1500 triangles / 512px assets, each new model being called statue01.fbx:
-python3.5 bakeAll.py -i /home/loic/Downloads -o /media/loic/assets/ -p statue -t 1500 -r 512
+python3 blender_bake_mulitple_models.py -i /home/loic/Downloads -o /media/loic/assets/ -p statue -t 1500 -r 512
+
+The models are processed by several blender workers at once, their number
+depending on the available cores and memory unless set with -j. The jobs
+and their states are kept in OUTDIR/jobs.db, with one log per job, so that
+running the same command again after a crash or an interruption only
+processes the models which are not done yet.
 """
 
 import sys
 import os
 import argparse
 import imghdr
+import subprocess
+import threading
 
-src = os.path.join( os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "src")
+src = os.path.join( os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))), "src")
 sys.path.append(src)
 import fn_match
+import jobs
 
 #colors for the terminal
 class bcolors:
@@ -35,9 +44,16 @@ parser.add_argument("-o", "--output",     dest="output",     type=str, metavar='
 parser.add_argument("-p", "--prefix",     dest="prefix",     type=str, required=True,  help="Prefix for the reprocessed files")
 parser.add_argument("-t", "--target",     dest="target",     type=int, default=1500,   help="Target number of faces")
 parser.add_argument("-r", "--resolution", dest="resolution", type=int, default=1024,   help="Baked textures resolution")
+parser.add_argument("-j", "--jobs",       dest="jobs",       type=int, default=0,      help="Number of concurrent blender workers (defaults to what the cores and memory allow)")
+parser.add_argument("-m", "--memory",     dest="memory",     type=float, default=4.,   help="Memory needed by one worker in GB, to compute the default number of workers")
+parser.add_argument("--retries",          dest="retries",    type=int, default=1,      help="Number of times a failed model is retried")
+parser.add_argument("--timeout",          dest="timeout",    type=float, default=None, help="Time limit of one model in seconds")
+parser.add_argument("--retry-failed",     dest="retry_failed", action="store_true",    help="Also retry the models which failed in previous runs")
+parser.add_argument("--non-interactive",  dest="interactive", action="store_false",    help="Skip the models without matching textures instead of asking")
+parser.add_argument("--blender",          dest="blender",    type=str, default="blender", help="Blender executable")
 
 #Get the path to the baking script
-bakeScript = os.path.join(os.path.dirname(os.path.realpath(__file__)), "bakeOne.py")
+bakeScript = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "bakemyscan.py")
 
 #Parse the arguments and check them
 args = parser.parse_args(sys.argv[1:])
@@ -125,6 +141,60 @@ def manually_set_textures(model, textures):
         normal = textures[nor-1]
     return albedo, normal, 0
 
+def available_workers(memory):
+    """Number of workers the cores and the available memory allow"""
+    n = os.cpu_count() or 1
+    try:
+        available = os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") / 1024.**3
+        n = min(n, int(available / memory))
+    except (ValueError, OSError, AttributeError):
+        pass
+    return max(1, n)
+
+def command(job):
+    """Blender command line processing one job"""
+    cmd = [args.blender, "--background", "--python-exit-code", "1", "--python", bakeScript, "--", job["model"], job["destination"], "-X", str(args.target), "-R", str(args.resolution)]
+    if job["albedo"] is not None:
+        cmd += ["--color", job["albedo"]]
+    if job["normal"] is not None:
+        cmd += ["--normal", job["normal"]]
+    return cmd
+
+def worker(db):
+    """Runs the pending jobs one after the other until there is none left"""
+    while True:
+        job = db.next()
+        if job is None:
+            return
+        log = os.path.splitext(job["destination"])[0] + "_log_%d.txt" % job["attempts"]
+        error = None
+        try:
+            with open(log, "w") as f:
+                subprocess.run(command(job), stdout=f, stderr=subprocess.STDOUT, timeout=args.timeout, check=True)
+            if not os.path.exists(job["destination"]):
+                error = "no output file"
+        except subprocess.TimeoutExpired:
+            error = "timeout"
+        except subprocess.CalledProcessError as e:
+            error = "exit status %d" % e.returncode
+        except OSError as e:
+            error = str(e)
+        state = db.finish(job, log, error, retries=args.retries)
+        color = bcolors.OKGREEN if state == jobs.DONE else bcolors.WARNING if state == jobs.PENDING else bcolors.FAIL
+        print(color + state.upper() + ": " + job["model"][len(args.input)+1:] + " -> " + job["destination"][len(args.output)+1:] + ("" if error is None else " (" + error + ")") + bcolors.ENDC)
+
+#The jobs database, resuming the jobs a crash left running
+db = jobs.JobDatabase(os.path.join(args.output, "jobs.db"))
+db.recover(failed=args.retry_failed)
+
+#Import the progress of the previous versions of this script, which only kept a list.csv
+log = os.path.join(args.output, "list.csv")
+if os.path.exists(log):
+    with open(log, "r") as f:
+        for a in [l.strip().split(",") for l in f.readlines() if len(l.strip())]:
+            if os.path.exists(a[1]):
+                db.add(a[0], a[1], state=jobs.DONE)
+
 #Will contain the models we must process as a list of {model, albedo, normal}
 toDo = []
 #Will contain the models we have to check as a list of {model, textures}
@@ -135,25 +205,16 @@ notToDo = []
 #Prepare the counts
 nAutomatic, nToConfirm, nConfirmed, nFailed, nAlready = 0, 0, 0, 0, 0
 
-#Check if some models were already processed
-#Remove from the file the models which should exist but were deleted or moved
-log     = os.path.join(args.output, "list.csv")
-already = []
-if os.path.exists(log):
-    with open(log, "r") as f:
-        already = [l.strip().split(",") for l in f.readlines()]
-if len(already)>0:
-    with open(log, "w") as f:
-        for a in already:
-            if os.path.exists(a[1]):
-                f.write(",".join(a) + "\n")
-already = [a for a in already if os.path.exists(a[1])]
+#Models already in the database are resumed, not matched again
+known = set([j["model"] for j in db.jobs()])
 
 #First, try to automatically match the texture files with the models
 for i,d in enumerate(directories):
     model    = get_3d_model_in(d, extensions=["obj","ply","stl","fbx","dae","wrl","x3d"])
-    #If the model was not previously processed
-    if model not in [a[0] for a in already]:
+    if model is None:
+        continue
+    #If the model was not previously queued
+    if model not in known:
         textures = get_textures_in(d)
         albedo, normal = separate_albedo_and_normals(textures)
         if something_looks_wrong(albedo, normal, textures):
@@ -162,21 +223,25 @@ for i,d in enumerate(directories):
         else:
             nAutomatic += 1
             toDo.append({"model": model, "albedo":albedo, "normal":normal})
-    #If the model was processed before
+    #If the model was queued before
     else:
         nAlready += 1
 
 if nAlready > 0:
-    print("\nWARNING:\n" + bcolors.WARNING + str(nAlready) + " out of " + str(len(directories)) + " models have been processed previously and will be ignored" + bcolors.ENDC)
+    print("\nWARNING:\n" + bcolors.WARNING + str(nAlready) + " out of " + str(len(directories)) + " models were queued previously and will be resumed" + bcolors.ENDC)
 
-#If some textures did not match, ask for the user confirmation
+#If some textures did not match, ask for the user confirmation, or skip them
 if nToConfirm > 0:
     print("\nWARNING:\n" + bcolors.WARNING + str(nToConfirm) + " out of " + str(len(directories)) + " models do not have matching textures:" + bcolors.ENDC)
     for case in toConfirm:
+        if not args.interactive:
+            nFailed += 1
+            notToDo.append(case['model'])
+            continue
         albedo, normal, error = manually_set_textures(case['model'], case['textures'])
         if error:
             nFailed += 1
-            notToDo.append(model)
+            notToDo.append(case['model'])
         else:
             nConfirmed += 1
             toDo.append({"model": case['model'], "albedo":albedo, "normal":normal})
@@ -191,53 +256,34 @@ if len(toDo)>0:
     if nFailed>0:
         print(bcolors.FAIL + str(nFailed) + " models were discarded" + bcolors.ENDC)
 
-#Do not take into account the models were deleted or moved in between
-already = [a for a in already if os.path.exists(a[1])]
-
-#Process the models for which we found texture matches
-with open(log, "a") as f:
-    for i,case in enumerate(toDo):
-
-        #Destination file
-        destination = os.path.join(args.output, args.prefix + "_" + str(i+1).zfill(3) + ".fbx" )
-
-        #Check that the numbering does not already exist
-        j = i
-        while os.path.exists(destination):
-            j+=1
-            destination = os.path.join(args.output, args.prefix + "_" + str(j+1).zfill(3) + ".fbx" )
-
-        #Create the appropriate command line
-        cmd = ("blender --background --python " + bakeScript + " --"
-        + " -i " + case["model"]
-        + " -o " + destination
-        + " -t " + str(args.target)
-        + " -r " + str(args.resolution))
-        if case["albedo"] is not None:
-            cmd += " -a " + case["albedo"]
-        if case["normal"] is not None:
-            cmd += " -n " + case["normal"]
-        cmd += " > " + os.path.join(args.output, "blender_log_" + str(j).zfill(3) + ".txt")
-
-        print(cmd)
-        sys.exit(0)
-
-        #launch the command in a shell
-        print(str(i+1).zfill(3) + " / " + str(len(toDo)).zfill(3) + " - " + case["model"][len(args.input)+1:] + " -> " + destination[len(args.output)+1:])
-        err = os.system(cmd)
-        if err:
-            notToDo.append(case["model"])
-        else:
-            #Write the processed file to the log
-            f.write(case["model"] + "," + destination + "\n")
+#Queue the new models, numbering their destinations after the existing ones
+destinations = set([j["destination"] for j in db.jobs()])
+j = 0
+for case in toDo:
+    destination = os.path.join(args.output, args.prefix + "_" + str(j+1).zfill(3) + ".fbx" )
+    while os.path.exists(destination) or destination in destinations:
+        j+=1
+        destination = os.path.join(args.output, args.prefix + "_" + str(j+1).zfill(3) + ".fbx" )
+    destinations.add(destination)
+    db.add(case["model"], destination, case["albedo"], case["normal"])
 
-#Say that we did not process some models
+#Process the pending models with concurrent blender workers
+nWorkers = args.jobs if args.jobs > 0 else available_workers(args.memory)
+nPending = len(db.jobs(jobs.PENDING))
+print("\nRunning " + str(nPending) + " models on " + str(min(nWorkers, max(nPending, 1))) + " workers")
+workers = [threading.Thread(target=worker, args=(db,)) for i in range(min(nWorkers, nPending))]
+for w in workers:
+    w.start()
+for w in workers:
+    w.join()
+
+#Summarize the state of every model
 print("\nSUMMARY:")
-for c in toDo:
-    if c["model"] not in notToDo:
-        print(bcolors.OKGREEN + "OK: " + c["model"][len(args.input)+1:] + bcolors.ENDC)
-for a in already:
-    print(bcolors.WARNING + "OK: " + a[0][len(args.input)+1:] + bcolors.ENDC)
+for job in db.jobs():
+    if job["state"] == jobs.DONE:
+        print(bcolors.OKGREEN + "OK: " + job["model"][len(args.input)+1:] + bcolors.ENDC)
+    else:
+        print(bcolors.FAIL + job["state"].upper() + ": " + job["model"][len(args.input)+1:] + ("" if job["log"] is None else " (see " + job["log"] + ")") + bcolors.ENDC)
 for m in notToDo:
-    print(bcolors.FAIL + "ERROR: " + m[len(args.input)+1:] + bcolors.ENDC)
+    print(bcolors.FAIL + "SKIPPED: " + m[len(args.input)+1:] + bcolors.ENDC)
 print("")
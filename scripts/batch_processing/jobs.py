@@ -0,0 +1,79 @@
+"""
+Persistent job queue for the batch processing scripts
+
+Jobs are stored in a SQLite database, one row per model, and go through the
+states pending -> running -> done, or back to pending on failure until the
+retries are exhausted, then failed. Jobs left running by a crashed driver are
+put back to pending by recover(), so that a new run resumes where the previous
+one stopped without redoing the finished models.
+"""
+
+import sqlite3
+import threading
+import time
+
+PENDING, RUNNING, DONE, FAILED = "pending", "running", "done", "failed"
+
+class JobDatabase:
+    columns = ["model", "destination", "albedo", "normal", "state", "attempts", "log", "error", "started", "finished"]
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db   = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+            id          INTEGER PRIMARY KEY AUTOINCREMENT,
+            model       TEXT UNIQUE NOT NULL,
+            destination TEXT NOT NULL,
+            albedo      TEXT,
+            normal      TEXT,
+            state       TEXT NOT NULL DEFAULT 'pending',
+            attempts    INTEGER NOT NULL DEFAULT 0,
+            log         TEXT,
+            error       TEXT,
+            started     REAL,
+            finished    REAL
+        )""")
+
+    def execute(self, query, params=()):
+        with self.lock:
+            return self.db.execute(query, params).fetchall()
+
+    def add(self, model, destination, albedo=None, normal=None, state=PENDING):
+        """Adds a job, ignored if the model is already known"""
+        self.execute("INSERT OR IGNORE INTO jobs (model, destination, albedo, normal, state) VALUES (?,?,?,?,?)", (model, destination, albedo, normal, state))
+
+    def recover(self, failed=False):
+        """Puts the jobs interrupted by a crash back to pending, and the failed ones too if failed is True"""
+        self.execute("UPDATE jobs SET state=? WHERE state=?", (PENDING, RUNNING))
+        if failed:
+            self.execute("UPDATE jobs SET state=?, attempts=0 WHERE state=?", (PENDING, FAILED))
+
+    def next(self):
+        """Atomically marks the oldest pending job as running and returns it, None if there is none left"""
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            row = self.db.execute("SELECT %s FROM jobs WHERE state=? ORDER BY id LIMIT 1" % ",".join(self.columns), (PENDING,)).fetchone()
+            if row is not None:
+                self.db.execute("UPDATE jobs SET state=?, attempts=attempts+1, started=? WHERE model=?", (RUNNING, time.time(), row[0]))
+            self.db.execute("COMMIT")
+        if row is None:
+            return None
+        job = dict(zip(self.columns, row))
+        job["attempts"] += 1
+        return job
+
+    def finish(self, job, log, error=None, retries=0):
+        """Marks a job as done, or as pending again (failed if it has no retries left) when error is not None"""
+        if error is None:
+            state = DONE
+        else:
+            state = PENDING if job["attempts"] <= retries else FAILED
+        self.execute("UPDATE jobs SET state=?, log=?, error=?, finished=? WHERE model=?", (state, log, error, time.time(), job["model"]))
+        return state
+
+    def jobs(self, state=None):
+        """Returns all the jobs, or the ones in a given state, as dictionnaries"""
+        query = "SELECT %s FROM jobs" % ",".join(self.columns)
+        rows  = self.execute(query + " ORDER BY id") if state is None else self.execute(query + " WHERE state=? ORDER BY id", (state,))
+        return [dict(zip(self.columns, r)) for r in rows]
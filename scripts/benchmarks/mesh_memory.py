@@ -0,0 +1,107 @@
+"""
+Compare the peak memory of fn_msh.Mesh with in-memory and memory-mapped arrays
+
+Usage:
+python3 mesh_memory.py [-n 10000000] [-d /tmp]
+
+A .meshb file with N vertices and 2N triangles is generated, then loaded in
+two fresh processes, one keeping the arrays in RAM and one mapping them to a
+cache directory. Each process runs computeBBox, scale, fitTo, replaceRef and
+removeRef, and reports its peak RSS (VmHWM) as well as the peak of anonymous
+memory (RssAnon), which excludes the file-backed pages the kernel can evict.
+Linux only, as the numbers are read from /proc/self/status.
+"""
+
+import sys
+import os
+import time
+import json
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+import numpy as np
+
+sys.path.append( os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "src") )
+import fn_msh
+
+def status(field):
+    with open("/proc/self/status") as f:
+        for l in f:
+            if l.startswith(field):
+                return int(l.split()[1]) / 1024.
+    return 0.
+
+def generate(path, n):
+    """Writes a random mesh without holding it in RAM"""
+    cache = tempfile.mkdtemp()
+    mesh  = fn_msh.Mesh(cache=cache)
+    mesh.verts = mesh.allocate("Vertices", (n, 4), float)
+    mesh.tris  = mesh.allocate("Triangles", (2*n, 4), int)
+    for sl in mesh.chunks(n):
+        mesh.verts[sl,:3] = np.random.rand(sl.stop - sl.start, 3)
+        mesh.verts[sl,3]  = 0
+    for sl in mesh.chunks(2*n):
+        mesh.tris[sl,:3] = np.random.randint(0, n, (sl.stop - sl.start, 3))
+        mesh.tris[sl,3]  = np.random.randint(1, 5, sl.stop - sl.start)
+    mesh.write(path)
+    del mesh
+    shutil.rmtree(cache)
+
+def run(path, memmap):
+    """Loads the mesh and runs the chunked operations, sampling anonymous memory"""
+    peak = [0.]
+    done = threading.Event()
+    def sample():
+        while not done.is_set():
+            peak[0] = max(peak[0], status("RssAnon"))
+            time.sleep(0.01)
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+
+    cache = tempfile.mkdtemp() if memmap else None
+    timings = {}
+    t = time.time()
+    mesh = fn_msh.Mesh(path, cache=cache)
+    timings["read"] = time.time() - t
+    for name, op in [
+        ("computeBBox", lambda: mesh.computeBBox()),
+        ("scale",       lambda: mesh.scale(0.5)),
+        ("fitTo",       lambda: mesh.fitTo(fn_msh.Mesh(cube=[0,1,0,1,0,1]))),
+        ("replaceRef",  lambda: mesh.replaceRef(3, 2)),
+        ("removeRef",   lambda: mesh.removeRef(4)),
+    ]:
+        t = time.time()
+        op()
+        timings[name] = time.time() - t
+
+    done.set()
+    sampler.join()
+    del mesh
+    if cache is not None:
+        shutil.rmtree(cache)
+    return {"peak_rss": status("VmHWM"), "peak_anon": peak[0], "timings": timings}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the memory-mapped Mesh arrays")
+    parser.add_argument("-n", "--vertices", type=int, default=10000000, help="Number of vertices")
+    parser.add_argument("-d", "--directory", type=str, default=".", help="Where to write the temporary mesh")
+    parser.add_argument("--run", type=str, choices=["ram", "memmap"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    #Child process: measure one mode and print the results as json
+    if args.run is not None:
+        print(json.dumps(run(args.path, args.run == "memmap")))
+        sys.exit(0)
+
+    path = os.path.join(args.directory, "benchmark_%d.meshb" % args.vertices)
+    generate(path, args.vertices)
+    print("%8s %16s %16s   %s" % ("mode", "peak RSS (MB)", "peak anon (MB)", "timings (s)"))
+    for mode in ["ram", "memmap"]:
+        out = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--run", mode, "--path", path])
+        res = json.loads(out.decode("utf-8").strip().split("\n")[-1])
+        timings = ", ".join(["%s %.2f" % (k, res["timings"][k]) for k in res["timings"]])
+        print("%8s %16.1f %16.1f   %s" % (mode, res["peak_rss"], res["peak_anon"], timings))
+    os.remove(path)
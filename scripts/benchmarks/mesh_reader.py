@@ -0,0 +1,105 @@
+"""
+Benchmark the .mesh reader of fn_msh against the previous multi-pass reader
+
+Usage:
+python3 mesh_reader.py [-s 100000 1000000 5000000 20000000] [--legacy-limit 1000000] [-d /tmp]
+
+Synthetic meshes with N triangles (and N/2 vertices) are written to the
+working directory, read back with both readers, and removed afterwards.
+The legacy reader is skipped above --legacy-limit elements, as it gets
+prohibitively slow on large files.
+"""
+
+import sys
+import os
+import time
+import argparse
+import itertools
+import tracemalloc
+import numpy as np
+
+sys.path.append( os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "src") )
+import fn_msh
+
+#Reader as it was before the single-pass parser, kept here for comparison
+class LegacyMesh:
+    keywords = ["Vertices", "Triangles", "Quadrilaterals","Tetrahedra","SolAtVertices"]
+    def __init__(self, path):
+        self.done     = []
+        self.found    = [False for k in self.keywords]
+        self.begin    = [0 for k in self.keywords]
+        self.numItems = [0 for k in self.keywords]
+        self.offset   = 0
+        self.get_infos(path)
+        with open(path) as f:
+            self.verts = self.readArray(f,0,4,float)
+            self.tris  = self.readArray(f,1,4,int)
+            self.tris[:,:3]-=1
+    def analyse(self, index, line):
+        for k,kwd in enumerate(self.keywords):
+            if self.found[k] and kwd not in self.done:
+                self.numItems[k] = int(line)
+                self.offset += self.numItems[k]
+                self.found[k] = False
+                self.done.append(kwd)
+                return 1
+            if kwd in line:
+                if kwd not in self.done and line[0]!="#":
+                    self.begin[k] = index+3 if kwd=="SolAtVertices" else index+2
+                    self.found[k] = True
+    def get_infos(self, path):
+        for j in range(len(self.keywords)):
+            with open(path) as f:
+                for i,l in enumerate(f):
+                    if i>self.offset:
+                        if self.analyse(i,l):
+                            break
+    def readArray(self, f, ind, dim, dt):
+        for i in range(20):
+            f.seek(0)
+            if f.readlines()[self.begin[ind]].strip() == "":
+                self.begin[ind]+=1
+            else:
+                break
+        f.seek(0)
+        X = " ".join([l for l in itertools.islice(f, self.begin[ind], self.begin[ind] + self.numItems[ind])])
+        return np.fromstring(X, sep=" ", dtype=dt).reshape((self.numItems[ind],dim))
+
+def synthetic_mesh(path, nTris):
+    mesh = fn_msh.Mesh()
+    nVerts = max(3, nTris//2)
+    mesh.verts = np.insert(np.random.rand(nVerts, 3), 3, 0, axis=1)
+    mesh.tris  = np.insert(np.random.randint(0, nVerts, (nTris, 3)), 3, 1, axis=1)
+    mesh.write(path)
+    return mesh
+
+def measure(reader, path):
+    tracemalloc.start()
+    t = time.time()
+    mesh = reader(path)
+    t = time.time() - t
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return mesh, t, peak / 1024.**2
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the .mesh readers")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=[100000, 1000000, 5000000, 20000000], help="Numbers of triangles")
+    parser.add_argument("-d", "--directory", type=str, default=".", help="Where to write the temporary meshes")
+    parser.add_argument("--legacy-limit", type=int, default=1000000, help="Do not run the legacy reader above this size")
+    args = parser.parse_args()
+
+    print("%12s %12s %14s %12s %14s" % ("triangles", "new (s)", "new peak (MB)", "legacy (s)", "legacy peak (MB)"))
+    for n in args.sizes:
+        path = os.path.join(args.directory, "benchmark_%d.mesh" % n)
+        ref  = synthetic_mesh(path, n)
+        mesh, tNew, mNew = measure(fn_msh.Mesh, path)
+        assert(np.array_equal(mesh.tris, ref.tris))
+        del mesh
+        tOld, mOld = float("nan"), float("nan")
+        if n <= args.legacy_limit:
+            mesh, tOld, mOld = measure(LegacyMesh, path)
+            assert(np.array_equal(mesh.tris, ref.tris))
+            del mesh
+        print("%12d %12.2f %14.1f %12.2f %14.1f" % (n, tNew, mNew, tOld, mOld))
+        os.remove(path)
@@ -0,0 +1,85 @@
+"""
+Microbenchmarks of Mesh.discardUnused and Mesh.writeVertsRef against the previous loops
+
+Usage:
+python3 mesh_remap.py [-s 10000 100000 1000000] [--legacy-limit 100000]
+
+Random meshes are built with half of their vertices unused, and both
+implementations are checked to produce the same arrays.
+"""
+
+import sys
+import os
+import time
+import argparse
+import numpy as np
+
+sys.path.append( os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "src") )
+import fn_msh
+
+#Implementations as they were before vectorization, kept here for comparison
+def legacy_discardUnused(mesh):
+    used = np.zeros(shape=(len(mesh.verts)),dtype="bool_")
+    used[np.ravel(mesh.tris[:,:3])]=True
+    used[np.ravel(mesh.tets[:,:4])]=True
+    newUsed = np.cumsum(used)
+    mesh.verts = mesh.verts[used==True]
+    newTris = np.zeros(shape=(len(mesh.tris),4),dtype=int)
+    newTris[:,-1] = mesh.tris[:,-1]
+    for i,triangle in enumerate(mesh.tris):
+        for j,t in enumerate(triangle[:-1]):
+            newTris[i,j] = newUsed[t]-1
+    mesh.tris = newTris
+    newTets = np.zeros(shape=(len(mesh.tets),5),dtype=int)
+    newTets[:,-1] = mesh.tets[:,-1]
+    for i,tet in enumerate(mesh.tets):
+        for j,t in enumerate(tet[:-1]):
+            newTets[i][j] = newUsed[t]-1
+    mesh.tets = newTets
+def legacy_writeVertsRef(mesh):
+    mesh.tets = mesh.tets[mesh.tets[:,-1].argsort()]
+    for i, t in enumerate(mesh.tets):
+        for iPt in t[:-1]:
+            mesh.verts[iPt][-1] = t[-1]
+    mesh.tris = mesh.tris[mesh.tris[:,-1].argsort()]
+    for i, t in enumerate(mesh.tris):
+        for iPt in t[:-1]:
+            mesh.verts[iPt][-1] = t[-1]
+
+def random_mesh(n):
+    mesh = fn_msh.Mesh()
+    mesh.verts = np.insert(np.random.rand(2*n, 3), 3, 0, axis=1)
+    mesh.tris  = np.insert(np.random.randint(0, n, (n, 3)), 3, np.random.randint(1, 10, n), axis=1)
+    mesh.tets  = np.insert(np.random.randint(0, n, (n//2, 4)), 4, np.random.randint(1, 10, n//2), axis=1)
+    return mesh
+
+def copy_mesh(mesh):
+    other = fn_msh.Mesh()
+    other.verts, other.tris, other.tets = mesh.verts.copy(), mesh.tris.copy(), mesh.tets.copy()
+    return other
+
+def timeit(function, mesh):
+    t = time.time()
+    function(mesh)
+    return time.time() - t
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the vectorized Mesh remapping")
+    parser.add_argument("-s", "--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="Numbers of triangles")
+    parser.add_argument("--legacy-limit", type=int, default=100000, help="Do not run the legacy loops above this size")
+    args = parser.parse_args()
+
+    print("%10s %16s %12s %9s" % ("triangles", "function", "vectorized", "legacy"))
+    for n in args.sizes:
+        ref = random_mesh(n)
+        for name, legacy in [("discardUnused", legacy_discardUnused), ("writeVertsRef", legacy_writeVertsRef)]:
+            new = copy_mesh(ref)
+            tNew = timeit(getattr(fn_msh.Mesh, name), new)
+            tOld = float("nan")
+            if n <= args.legacy_limit:
+                old = copy_mesh(ref)
+                tOld = timeit(legacy, old)
+                assert(np.array_equal(new.tris[:,:-1], old.tris[:,:-1]))
+                if name == "writeVertsRef":
+                    assert(np.array_equal(new.verts, old.verts))
+            print("%10d %16s %11.3fs %8.3fs" % (n, name, tNew, tOld))
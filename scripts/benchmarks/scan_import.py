@@ -0,0 +1,81 @@
+"""
+Compare the NumPy fast path of bakemyscan.import_scan with the stock Blender importers
+
+Usage:
+blender --addons BakeMyScan -b -P scan_import.py -- [-n 5000000] [-d /tmp]
+
+A synthetic scan with N triangles is written as binary .stl and binary .ply,
+then imported with the import_scan operator (fast path) and with the stock
+import_mesh.stl / import_mesh.ply operators, clearing the scene in between.
+"""
+
+import sys
+import os
+import time
+import argparse
+import bpy
+import numpy as np
+
+def synthetic_scan(n):
+    """A noisy grid of about n triangles, stored as the corners of each facet"""
+    side  = int(np.sqrt(n / 2)) + 1
+    x, y  = np.meshgrid(np.arange(side, dtype=np.float32), np.arange(side, dtype=np.float32))
+    verts = np.stack([x.ravel(), y.ravel(), np.random.rand(side*side).astype(np.float32)], axis=1)
+    ids   = np.arange(side*side).reshape((side, side))
+    a, b, c, d = ids[:-1,:-1].ravel(), ids[:-1,1:].ravel(), ids[1:,1:].ravel(), ids[1:,:-1].ravel()
+    faces = np.concatenate((np.stack([a, b, c], axis=1), np.stack([a, c, d], axis=1)))[:n]
+    return verts, faces
+
+def write_stl(path, verts, faces):
+    record = np.dtype([("normal", "<f4", (3,)), ("verts", "<f4", (3,3)), ("attribute", "<u2")])
+    data = np.zeros(len(faces), dtype=record)
+    data["verts"] = verts[faces]
+    with open(path, "wb") as f:
+        f.write(b"benchmark".ljust(80) + np.array([len(faces)], dtype="<u4").tobytes())
+        data.tofile(f)
+
+def write_ply(path, verts, faces):
+    header  = "ply\nformat binary_little_endian 1.0\n"
+    header += "element vertex %d\nproperty float x\nproperty float y\nproperty float z\n" % len(verts)
+    header += "element face %d\nproperty list uchar int vertex_indices\nend_header\n" % len(faces)
+    data = np.zeros(len(faces), dtype=[("size", "u1"), ("index", "<i4", (3,))])
+    data["size"], data["index"] = 3, faces
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        verts.astype("<f4").tofile(f)
+        data.tofile(f)
+
+def clear():
+    for o in list(bpy.data.objects):
+        bpy.data.objects.remove(o)
+    for m in list(bpy.data.meshes):
+        bpy.data.meshes.remove(m)
+
+def timeit(function, path):
+    clear()
+    t = time.time()
+    function(filepath=path)
+    t = time.time() - t
+    faces = sum([len(o.data.polygons) for o in bpy.data.objects if o.type == "MESH"])
+    return t, faces
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the binary scan importers")
+    parser.add_argument("-n", "--faces", type=int, default=5000000, help="Number of triangles")
+    parser.add_argument("-d", "--directory", type=str, default=".", help="Where to write the temporary scans")
+    args = parser.parse_args(sys.argv[sys.argv.index("--") + 1:] if "--" in sys.argv else [])
+
+    verts, faces = synthetic_scan(args.faces)
+    print("%6s %12s %12s %12s" % ("format", "faces", "fast (s)", "operator (s)"))
+    for ext, write, operator in [
+        (".stl", write_stl, bpy.ops.import_mesh.stl),
+        (".ply", write_ply, bpy.ops.import_mesh.ply),
+    ]:
+        path = os.path.join(args.directory, "benchmark_%d%s" % (args.faces, ext))
+        write(path, verts, faces)
+        tFast, nFast = timeit(bpy.ops.bakemyscan.import_scan, path)
+        tOld, nOld   = timeit(operator, path)
+        assert(nFast == nOld)
+        print("%6s %12d %12.2f %12.2f" % (ext, nFast, tFast, tOld))
+        os.remove(path)
+    clear()
@@ -0,0 +1,231 @@
+"""
+Benchmark the texture sets matching of fn_match against the previous matcher
+
+Usage:
+python3 texture_matching.py [-n 50000] [--legacy-limit 20000] [-d /tmp]
+
+A synthetic library of N image files (8 bytes png headers) is written in a
+temporary directory, with resolution variants, numbered "_var" variations and
+a few unmatched files, spread over nested sub-directories. The listing and the
+matching are timed separately, the legacy matcher (O(n²) on the variations) is
+run on the same images up to --legacy-limit files, and both must give the same
+materials. The persistent index is timed on a first scan and on a rescan
+with nothing changed.
+"""
+
+import sys
+import os
+import time
+import copy
+import random
+import argparse
+import tempfile
+
+sys.path.append( os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "src") )
+import fn_match
+
+PNG = b"\211PNG\r\n\032\n"
+
+#Matcher as it was before the single-pass rewrite, kept here for comparison
+def legacy_ignore_trailing_variations(images):
+    imageVariations = [i for i in images if "_var" in i["name"]]
+    toIgnore = []
+    a,b,c,d = 0,0,0,0
+    for i1 in imageVariations:
+        for i2 in imageVariations:
+            i1Splitted = "".join([x for x in i1["file"].split("_") if "var" not in x.lower()])
+            i2Splitted = "".join([x for x in i2["file"].split("_") if "var" not in x.lower()])
+            if i1Splitted == i2Splitted and i1!=i2:
+                a+=1
+                try:
+                    n1 = int(i1["name"][-1])
+                    n2 = int(i2["name"][-1])
+                    if n1<n2:
+                        toIgnore.append(i2)
+                        i1["name"] = i1["name"].replace("_var","")[:-1]
+                        break
+                    else:
+                        toIgnore.append(i1)
+                        i2["name"] = i2["name"].replace("_var","")[:-1]
+                        break
+                except:
+                    pass
+    for i in images:
+        if "_var" in i["name"]:
+            for i2 in toIgnore:
+                if i["file"] == i2["file"]:
+                    images.remove(i)
+    for i in images:
+        if "_var" in i["name"]:
+            i["name"] = i["name"].replace("_var","")[:-1]
+    for i in images:
+        try:
+            n = int(i["name"][-1])
+            try:
+                x = int(i["name"][-2])
+            except:
+                i["name"] = i["name"][:-1]
+        except:
+            pass
+    return images
+
+def legacy_find_pattern_in_image(f):
+    patterns = {
+        "albedo"      : ["albedo", "diffuse", "dif", "alb", "base_color", "basecolor", "color", "_d", "_col","tex"],
+        "ao"          : ["ao", "ambient_occlusion", "occlusion", "occ"],
+        "metallic"    : ["metallic", "metal", "metalness"],
+        "roughness"   : ["roughness", "rou", "rough", "_r"],
+        "glossiness"  : ["specular", "ref", "spec", "glossiness", "reflect", "refl", "gloss"],
+        "normal"      : ["normal", "normals", "nor", "_n", "norm", "nrm"],
+        "height"      : ["height", "dis", "disp", "displacement"],
+        "emission"    : ["emission", "emit", "emissive"],
+        "opacity"     : ["alpha", "transparent", "opacity", "transp", "mask"],
+    }
+    for slot in patterns:
+        for suffix in patterns[slot]:
+            name = os.path.splitext(f)[0].lower().strip()
+            if name.endswith(suffix):
+                name = fn_match.rreplace(name, suffix,"")#This fixes a case like "greasy_metal_roughness"
+                while name.endswith("_"):
+                    name = name[:-1]
+                return slot, name
+    return None, None
+
+def legacy_material_names_in_images(images):
+    for i in images:
+        slot, name = legacy_find_pattern_in_image(i["name"])
+        i["type"] = slot
+        i["material"] = name
+    return images
+def legacy_material_dictionnary(images):
+    materials = {}
+    for i in images:
+        if i["material"] is not None:
+            #Create the material if it does not exist
+            if i["material"] not in materials:
+                materials[i["material"]] = {}
+            #Check if the texture slot already exists
+            if i["type"] in materials[i["material"]]:
+                existing = materials[i["material"]][i["type"]]
+                #If it is a diffuse vs albedo conflict
+                if ("Dif" in i["file"] or "Dif" in existing) and ("Alb" in i["file"] or "Alb" in existing):
+                    if "Alb" in i["file"]:
+                        materials[i["material"]][i["type"]] = i
+                    else:
+                        images.remove(i)
+                        continue
+                #if it is a JaoPaulo "SD" vs normal conflict, keep the normal
+                if "SD" in i["file"] or "SD" in existing:
+                    if "SD" in existing:
+                        materials[i["material"]][i["type"]] = i
+                    else:
+                        images.remove(i)
+                        continue
+                #if the ends are _3K and _6K for instance, keep the _6K
+                end3letters = i["file"].split(".")[-2][-3:]
+                if end3letters[0] == "_" and end3letters[2] == "K":
+                    old = materials[i["material"]][i["type"]]
+                    oldend3letters = old.split(".")[-2][-3:]
+                    if int(oldend3letters[1])<int(end3letters[1]):
+                        materials[i["material"]][i["type"]] = i
+                    else:
+                        images.remove(i)
+                        continue
+                else:
+                    print("ERROR on %s" % (i["file"]))
+                    print("\tthe slot %s is already in use by %s" % (i["type"], materials[i["material"]][i["type"]]))
+            materials[i["material"]][i["type"]] = i["file"]
+
+    return materials
+
+def legacy_match(images):
+    images = legacy_ignore_trailing_variations(images)
+    images = legacy_material_names_in_images(images)
+    return legacy_material_dictionnary(images)
+
+def match(images):
+    images = fn_match.ignore_trailing_variations(images)
+    images = fn_match.material_names_in_images(images)
+    return fn_match.material_dictionnary(images)
+
+def synthetic_library(directory, n, seed=0):
+    """Writes about n images of texture sets, returns the number of files written"""
+    random.seed(seed)
+    slots = [fn_match.PATTERNS[s] for s in fn_match.PATTERNS]
+    count, m = 0, 0
+    while count < n:
+        folder = os.path.join(directory, "category%02d" % (m % 37), "set%03d" % (m % 101))
+        os.makedirs(folder, exist_ok=True)
+        name = "material%06d" % m
+        resolutions = ["_2K", "_4K"] if m % 7 == 0 else [""]
+        for suffixes in random.sample(slots, random.randint(2, 6)):
+            suffix = random.choice([s for s in suffixes if not s.startswith("_")])
+            variations = ["_var1", "_var2"] if m % 11 == 0 and len(resolutions) == 1 else [""]
+            for resolution in resolutions:
+                for variation in variations:
+                    with open(os.path.join(folder, "%s_%s%s%s.png" % (name, suffix, resolution, variation)), "wb") as f:
+                        f.write(PNG)
+                    count += 1
+        if m % 97 == 0:
+            with open(os.path.join(folder, "preview_%06d.png" % m), "wb") as f:
+                f.write(PNG)
+            count += 1
+        m += 1
+    return count
+
+def list_images(directory):
+    images = []
+    for root, subFolders, files in os.walk(directory):
+        for f in files:
+            images.append({
+                "file": os.path.join(root, f),
+                "dir":  root,
+                "name": fn_match.normalize_name(os.path.splitext(f)[0].lower().strip())
+            })
+    images.sort(key = lambda image : image["file"])
+    return images
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the texture sets matching")
+    parser.add_argument("-n", "--files", type=int, nargs="+", default=[5000, 50000], help="Numbers of files")
+    parser.add_argument("-d", "--directory", type=str, default=None, help="Where to write the temporary library")
+    parser.add_argument("--legacy-limit", type=int, default=20000, help="Do not run the legacy matcher above this size")
+    args = parser.parse_args()
+
+    print("%10s %10s %12s %12s %12s %12s %12s %12s" % ("files", "materials", "listing (s)", "matching (s)", "legacy (s)", "total (s)", "indexed (s)", "rescan (s)"))
+    for n in args.files:
+        #The index lies outside of the library, which it would otherwise list
+        with tempfile.TemporaryDirectory(dir=args.directory) as directory, tempfile.TemporaryDirectory() as indexDirectory:
+            n = synthetic_library(directory, n)
+
+            t = time.time()
+            images = list_images(directory)
+            tList = time.time() - t
+
+            copied = copy.deepcopy(images)
+            t = time.time()
+            materials = match(copied)
+            tMatch = time.time() - t
+
+            tOld = float("nan")
+            if n <= args.legacy_limit:
+                copied = copy.deepcopy(images)
+                t = time.time()
+                legacy = legacy_match(copied)
+                tOld = time.time() - t
+                assert(legacy == materials)
+
+            t = time.time()
+            fn_match.findMaterials(directory)
+            tTotal = time.time() - t
+
+            index = os.path.join(indexDirectory, "materials.db")
+            t = time.time()
+            indexed = fn_match.findMaterials(directory, index=index)
+            tIndex = time.time() - t
+            t = time.time()
+            rescanned = fn_match.findMaterials(directory, index=index)
+            tRescan = time.time() - t
+            assert(indexed == rescanned == {m: dict(materials[m]) for m in materials})
+
+            print("%10d %10d %12.2f %12.2f %12.2f %12.2f %12.2f %12.2f" % (n, len(materials), tList, tMatch, tOld, tTotal, tIndex, tRescan))
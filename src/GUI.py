@@ -99,6 +99,7 @@ class PIPELINE_PT_Panel(BakeMyScanPanel):
 
         self.layout.label(text="Retopology")
         self.layout.operator("bakemyscan.full_pipeline", icon="MOD_DECIM", text="Remesh")
+        self.layout.operator("bakemyscan.lod_chain",     icon="MOD_DECIM", text="LOD chain")
         self.layout.operator("bakemyscan.unwrap",            icon="GROUP_UVS",  text="Unwrap")
 
         self.layout.label(text="Post-process")
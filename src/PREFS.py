@@ -59,8 +59,13 @@ def find_openmvs_executables(self, context):
 
 def updatepath(self, context):
     print("Reading in materials from %s" % self.texturepath)
+    previous = bpy.types.Scene.pbrtextures
     bpy.ops.bakemyscan.create_library(filepath=self.texturepath)
     path = os.path.join(bpy.utils.resource_path('USER'), "materials.json")
+    #Only rewrite the .json file if the library changed
+    if bpy.types.Scene.pbrtextures == previous and os.path.exists(path):
+        absolute_paths(self, context)
+        return None
     try:
         with open(path, 'w') as fp:
             json.dump(bpy.types.Scene.pbrtextures, fp, sort_keys=True, indent=4)
@@ -1,37 +1,46 @@
 # coding: utf8
 import bpy
+import bmesh
+from mathutils.bvhtree import BVHTree
 from . import fn_nodes
+from . import fn_io
 import numpy as np
 
+import os
 import tempfile
+import hashlib
+import json
+
+def node_graph(tree, socket=None):
+    """Returns the downstream and upstream adjacency of a node tree as {name: set of names}, optionally following only the links from outputs named socket"""
+    _after  = {n.name: set() for n in tree.nodes}
+    _before = {n.name: set() for n in tree.nodes}
+    for _link in tree.links:
+        if socket is None or _link.from_socket.name == socket:
+            _after[_link.from_node.name].add(_link.to_node.name)
+            _before[_link.to_node.name].add(_link.from_node.name)
+    return _after, _before
+
+def reachable_nodes(adjacencies, starts):
+    """Returns the names of the nodes reachable from the starts (included) through any of the adjacencies, in O(nodes + links)"""
+    _seen  = set(starts)
+    _stack = list(_seen)
+    while len(_stack):
+        _name = _stack.pop()
+        for _adjacency in adjacencies:
+            for _neigh in _adjacency[_name]:
+                if _neigh not in _seen:
+                    _seen.add(_neigh)
+                    _stack.append(_neigh)
+    return _seen
+
+def nodes_attached_to_normalmap(tree):
+    """Returns the names of the nodes whose "Color" outputs lead to a normal map node"""
+    _after, _before = node_graph(tree, socket="Color")
+    return reachable_nodes([_before], [n.name for n in tree.nodes if n.type=="NORMAL_MAP"])
 
 def is_attached_to_normalmap_somehow(node):
-    def get_after_nodes(node):
-        """Returns a list of the node's immediate neighbors"""
-        _neighs = []
-        for _output in [x for x in node.outputs if x.name=="Color"]:
-            if len(_output.links)>0:
-                for _link in _output.links:
-                    _neighs.append(_link.to_node)
-        return _neighs
-    def get_linked_nodes(node):
-        """Returns a list of all the node's connected nodes"""
-        _linkedNodes = [node]
-        _neighs = [node]
-        while len(_neighs):
-            _newNeighs = []
-            for _node in _neighs:
-                for _neigh in get_after_nodes(_node):
-                    if _neigh not in _linkedNodes:
-                        _newNeighs.append(_neigh)
-                        _linkedNodes.append(_neigh)
-            _neighs = _newNeighs
-        return _linkedNodes
-    AFTER = get_linked_nodes(node)
-    for a in AFTER:
-        if a.type=="NORMAL_MAP":
-            return True
-    return False
+    return node.name in nodes_attached_to_normalmap(node.id_data)
 
 def copy_cycles_material(material, name=None):
 
@@ -48,57 +57,35 @@ def copy_cycles_material(material, name=None):
     return _new_material
 
 def remove_unused_nodes(node, tree, channel):
-    def get_neighbor_nodes(node):
-        """Returns a list of the node's immediate neighbors"""
-        _neighs = []
-        for _input in node.inputs:
-            if len(_input.links)>0:
-                for _link in _input.links:
-                    _neighs.append(_link.from_node)
-        for _output in node.outputs:
-            if len(_output.links)>0:
-                for _link in _output.links:
-                    _neighs.append(_link.to_node)
-        return _neighs
-    def get_linked_nodes(node):
-        """Returns a list of all the node's connected nodes"""
-        _linkedNodes = [node]
-        _neighs = [node]
-        while len(_neighs):
-            _newNeighs = []
-            for _node in _neighs:
-                for _neigh in get_neighbor_nodes(_node):
-                    if _neigh not in _linkedNodes:
-                        _newNeighs.append(_neigh)
-                        _linkedNodes.append(_neigh)
-            _neighs = _newNeighs
-        return _linkedNodes
     #Remove the links not connected to the input
     for i in node.inputs:
         if i.name!=channel:
-            for l in i.links:
+            for l in list(i.links):
                 tree.links.remove(l)
     #Remove the newly isolated nodes
-    _isolated = [n for n in tree.nodes if n not in get_linked_nodes(node)]
-    for n in _isolated:
+    _linked = reachable_nodes(node_graph(tree), [node.name])
+    for n in [n for n in tree.nodes if n.name not in _linked]:
         tree.nodes.remove(n)
 
 def get_all_nodes_in_material(material, node_type=None):
 
-    def find_groups_in_node_tree(_node_tree):
-        _groups = []
-        for _n in _node_tree.nodes:
-            if _n.type == "GROUP":
-                _groups.append(_n)
-                _groups = _groups + find_groups_in_node_tree(_n.node_tree)
-        return _groups
+    def find_group_trees(_node_tree):
+        """Returns the node trees of the groups nested in _node_tree, each one once"""
+        _trees = []
+        _seen  = set()
+        _stack = [_node_tree]
+        while len(_stack):
+            for _n in _stack.pop().nodes:
+                if _n.type == "GROUP" and _n.node_tree is not None and _n.node_tree.name not in _seen:
+                    _seen.add(_n.node_tree.name)
+                    _trees.append(_n.node_tree)
+                    _stack.append(_n.node_tree)
+        return _trees
 
     _nodes = [{"node": n, "tree":material.node_tree} for n in material.node_tree.nodes]
 
-    _groups = find_groups_in_node_tree(material.node_tree)
-
-    for _group in _groups:
-        _nodes = _nodes + [{"node": n, "tree":_group.node_tree} for n in _group.node_tree.nodes]
+    for _tree in find_group_trees(material.node_tree):
+        _nodes.extend([{"node": n, "tree":_tree} for n in _tree.nodes])
 
     if node_type is None:
         return _nodes
@@ -149,6 +136,201 @@ def convert_principled_to_emission(node, tree, input_node):
         tree.links.new(_emit.outputs["Emission"], l.to_socket)
     tree.nodes.remove(node)
 
+#Session cache of the emission variants: {(tree hash, channel): material name}, and the last hash of each source material
+BAKING_MATERIALS = {}
+SOURCE_HASHES    = {}
+#Node properties which do not change the shading
+UI_PROPERTIES = ["name", "label", "location", "width", "width_hidden", "height", "dimensions", "select", "hide", "show_options", "show_preview", "show_texture", "use_custom_color", "color"]
+
+def image_signature(image):
+    """Identifies the content of an image: size and mtime of its file, or a digest of its pixels when packed, generated or edited"""
+    if image.source == "FILE" and image.packed_file is None and not image.is_dirty:
+        try:
+            _stat = os.stat(bpy.path.abspath(image.filepath, library=image.library))
+            return (image.name, image.filepath, _stat.st_size, _stat.st_mtime)
+        except OSError:
+            pass
+    return (image.name, image.filepath, hashlib.sha1(fn_io.get_pixels(image).tobytes()).hexdigest())
+
+def node_tree_hash(tree, names=None, channel=None, content=False):
+    """Structural hash of a node tree: node types and settings, unlinked input values and links, recursing into groups
+    Restricted to the nodes in names and, for the Principled nodes, to the channel input. With content, the pixels of the images count too"""
+    def _value(v):
+        if isinstance(v, set):
+            return tuple(sorted(v))
+        if hasattr(v, "__len__") and not isinstance(v, str):
+            return tuple(v)
+        return v
+    def _used(_socket, _node):
+        return channel is None or _node.type != "BSDF_PRINCIPLED" or channel not in _node.inputs or _socket.name == channel
+    _items = []
+    for _n in sorted(tree.nodes, key=lambda n: n.name):
+        if names is not None and _n.name not in names:
+            continue
+        _props = []
+        for _p in _n.bl_rna.properties:
+            if _p.is_readonly or _p.identifier in UI_PROPERTIES or _p.type not in ["BOOLEAN", "INT", "FLOAT", "ENUM", "STRING"]:
+                continue
+            _props.append((_p.identifier, _value(getattr(_n, _p.identifier))))
+        if _n.type == "TEX_IMAGE" and _n.image is not None:
+            _props.append(("image",) + (image_signature(_n.image) if content else (_n.image.name, _n.image.filepath)))
+        if _n.type == "GROUP" and _n.node_tree is not None:
+            _props.append(("group", node_tree_hash(_n.node_tree, content=content)))
+        _inputs = [(_i.identifier, _value(_i.default_value)) for _i in _n.inputs if not _i.is_linked and hasattr(_i, "default_value") and _used(_i, _n)]
+        _items.append((_n.name, _n.bl_idname, _props, _inputs))
+    _links = sorted([
+        (l.from_node.name, l.from_socket.identifier, l.to_node.name, l.to_socket.identifier) for l in tree.links
+        if (names is None or (l.from_node.name in names and l.to_node.name in names)) and _used(l.to_socket, l.to_node)
+    ])
+    return hashlib.sha1(repr((_items, _links)).encode("utf-8")).hexdigest()
+
+def channel_hash(material, channel):
+    """Hash of the part of a material shading a channel: the nodes upstream of its outputs, following only the channel input of the Principled nodes"""
+    _tree = material.node_tree
+    #The emission and opacity variants keep the whole material
+    if channel in ["Emission", "Opacity"]:
+        return node_tree_hash(_tree, content=True)
+    _names = set()
+    _stack = [n for n in _tree.nodes if n.type == "OUTPUT_MATERIAL"]
+    while len(_stack):
+        _node = _stack.pop()
+        if _node.name in _names:
+            continue
+        _names.add(_node.name)
+        for _input in _node.inputs:
+            for _link in _input.links:
+                if _node.type != "BSDF_PRINCIPLED" or channel not in _node.inputs or _input.name == channel:
+                    _stack.append(_link.from_node)
+    return node_tree_hash(_tree, _names, channel, content=True)
+
+def cached_baking_material(key):
+    """Returns the cached variant for key if it still exists in bpy.data (file reloads and undo discard it)"""
+    _variant = bpy.data.materials.get(BAKING_MATERIALS.get(key, ""))
+    if _variant is not None and _variant.get("bakemyscan_variant") == ":".join(key):
+        return _variant
+    return None
+
+def remove_variants(tag):
+    """Removes the unused variant materials whose tag starts with tag, even the ones the cache lost track of"""
+    for _material in [m for m in bpy.data.materials if m.get("bakemyscan_variant", "").startswith(tag) and m.users == 0]:
+        bpy.data.materials.remove(_material)
+
+def evict_baking_materials(tree_hash):
+    """Removes the variants built from a node tree hash"""
+    for _key in [k for k in BAKING_MATERIALS if k[0] == tree_hash]:
+        del BAKING_MATERIALS[_key]
+    remove_variants(tree_hash + ":")
+
+def clear_baking_materials():
+    """Empties the session cache of emission variants"""
+    for _hash in set([k[0] for k in BAKING_MATERIALS]):
+        evict_baking_materials(_hash)
+    SOURCE_HASHES.clear()
+
+def get_baking_material(material, channel):
+    """Returns the emission variant of material for channel, reusing the cached one if the node tree did not change"""
+    _hash = node_tree_hash(material.node_tree)
+    #The source material changed since its last bake, drop the variants built from its old tree
+    _old = SOURCE_HASHES.get(material.name)
+    SOURCE_HASHES[material.name] = _hash
+    if _old is not None and _old != _hash and _old not in SOURCE_HASHES.values():
+        evict_baking_materials(_old)
+    _variant = cached_baking_material((_hash, channel))
+    if _variant is None:
+        #Drop a variant superseded for the same key (renamed, or lost by the cache)
+        remove_variants(_hash + ":" + channel)
+        _variant = create_source_baking_material(material, channel)
+        _variant.name = material.name + "_" + channel
+        _variant["bakemyscan_variant"] = _hash + ":" + channel
+        BAKING_MATERIALS[(_hash, channel)] = _variant.name
+    return _variant
+
+#Custom property of the targets holding the hashes of their last bake, {slot: {"hash", "image"}}
+MANIFEST = "bakemyscan_manifest"
+
+def object_hash(obj, uvs=False):
+    """Hash of the evaluated geometry of an object in world space, and of its active UVs if uvs is True"""
+    _evaluated = obj.evaluated_get(bpy.context.evaluated_depsgraph_get())
+    _mesh  = _evaluated.to_mesh()
+    _co    = np.empty(3 * len(_mesh.vertices), dtype=np.float32)
+    _loops = np.empty(len(_mesh.loops), dtype=np.int32)
+    _mesh.vertices.foreach_get("co", _co)
+    _mesh.loops.foreach_get("vertex_index", _loops)
+    _sha = hashlib.sha1()
+    _sha.update(np.array(obj.matrix_world, dtype=np.float32).tobytes())
+    _sha.update(_co.tobytes())
+    _sha.update(_loops.tobytes())
+    if uvs and _mesh.uv_layers.active is not None:
+        _uv = np.empty(2 * len(_mesh.loops), dtype=np.float32)
+        _mesh.uv_layers.active.data.foreach_get("uv", _uv)
+        _sha.update(_uv.tobytes())
+    _evaluated.to_mesh_clear()
+    return _sha.hexdigest()
+
+def inputs_hash(inputs):
+    """Hash of a list of hashes and settings"""
+    return hashlib.sha1(repr(inputs).encode("utf-8")).hexdigest()
+
+def load_manifest(obj):
+    """Returns the bake manifest stored on obj, empty if it was never baked"""
+    return json.loads(obj[MANIFEST]) if MANIFEST in obj.keys() else {}
+
+def save_manifest(obj, manifest):
+    obj[MANIFEST] = json.dumps(manifest, sort_keys=True)
+
+def create_adaptive_cage(target, sources, maximum, name="cage", margin=1.1):
+    """Creates a cage object for target, each vertex extruded along its normal just past the sources (at most by maximum)
+    Returns the cage and the longest ray needed from the cage to reach the sources"""
+    _depsgraph = bpy.context.evaluated_depsgraph_get()
+
+    #Build the BVH trees of the sources in world space
+    _trees = []
+    for _source in sources:
+        _bm = bmesh.new()
+        _bm.from_object(_source, _depsgraph)
+        _bm.transform(_source.matrix_world)
+        _trees.append(BVHTree.FromBMesh(_bm))
+        _bm.free()
+
+    def _nearest(_co):
+        _distances = [t.find_nearest(_co, maximum)[3] for t in _trees]
+        return min([d for d in _distances if d is not None] + [maximum])
+    def _hit(_co, _dir):
+        _distances = [t.ray_cast(_co, _dir, maximum)[3] for t in _trees]
+        _distances = [d for d in _distances if d is not None]
+        return min(_distances) if len(_distances) else None
+
+    #Measure, per vertex, how far out and in the sources are
+    _mesh    = bpy.data.meshes.new_from_object(target.evaluated_get(_depsgraph))
+    _matrix  = target.matrix_world
+    _inverse = _matrix.inverted()
+    _normals = _inverse.transposed().to_3x3()
+    _cage    = np.empty((len(_mesh.vertices), 3), dtype=np.float32)
+    _longest = 0.
+    for _v in _mesh.vertices:
+        _co   = _matrix @ _v.co
+        _no   = (_normals @ _v.normal).normalized()
+        _near = _nearest(_co)
+        _out  = _hit(_co, _no)
+        _in   = _hit(_co, -_no)
+        _extrusion = min(maximum, max(0.01 * maximum, margin * (_out if _out is not None else _near)))
+        _longest   = max(_longest, _extrusion + margin * (_in if _in is not None else _near))
+        _cage[_v.index] = _inverse @ (_co + _extrusion * _no)
+    _mesh.vertices.foreach_set("co", np.ravel(_cage))
+    _mesh.update()
+
+    #The cage encloses the sources, so it must stay invisible to the bake rays (ambient occlusion)
+    _obj = bpy.data.objects.new(name, _mesh)
+    _obj.matrix_world = _matrix
+    bpy.context.collection.objects.link(_obj)
+    if hasattr(_obj, "visible_camera"):
+        for _ray in ["camera", "diffuse", "glossy", "transmission", "volume_scatter", "shadow"]:
+            setattr(_obj, "visible_" + _ray, False)
+    else:
+        for _ray in ["camera", "diffuse", "glossy", "transmission", "scatter", "shadow"]:
+            setattr(_obj.cycles_visibility, _ray, False)
+    return _obj, _longest
+
 ################################################################################
 # "API" functions, referenced by the operator
 ################################################################################
@@ -158,25 +340,29 @@ def overlay_normals(image1, image2, name="overlay"):
     assert(image1.size[0] == image2.size[0])
     assert(image1.size[1] == image2.size[1])
     w,h = image1.size[0], image1.size[1]
-    pixels1 = np.array(image1.pixels).reshape((w,h,4))
-    pixels2 = np.array(image2.pixels).reshape((w,h,4))
+    pixels1 = fn_io.get_pixels(image1)
+    pixels2 = fn_io.get_pixels(image2)
+
+    #Blend in place in pixels2, a few rows at a time
+    for _rows in fn_io.pixel_rows(pixels2):
+        _a, _b = pixels1[_rows], pixels2[_rows]
 
-    #Remove the blue channel
-    pixels2[:,:,2]=0.
+        #Remove the blue channel
+        _b[:,:,2] = 0.
 
-    #Get the value from the firdt image
-    value = np.max(pixels1[:,:,:3], axis=2)
-    val = np.zeros((w,h,4))
-    val[:,:,0] = val[:,:,1] = val[:,:,2] = val[:,:,3] = value
+        #Get the value from the first image
+        _low = np.max(_a[:,:,:3], axis=2) < 0.5
 
-    #Compute the overlay
-    mult = pixels1*pixels2
-    comp = 1.0 - 2*(1.-pixels1)*(1.-pixels2)
-    pix = np.where(val<0.5, mult, comp)
-    pix[:,:,3]=1.
+        #Compute the overlay
+        _comp  = (1. - _a) * (1. - _b)
+        _comp *= -2.
+        _comp += 1.
+        _b    *= _a
+        np.copyto(_b, _comp, where=~_low[:,:,None])
+        _b[:,:,3] = 1.
 
     img = bpy.data.images.new(name, w, h)
-    img.pixels = np.ravel(pix)
+    fn_io.set_pixels(img, pixels2)
     return img
 
 def create_source_baking_material(material, channel):
@@ -216,11 +402,15 @@ def create_source_baking_material(material, channel):
 
     #Turn all textures to colors whn baking the normals, except the normals themselves
     _image_nodes = get_all_nodes_in_material(_new_material, "TEX_IMAGE")
-    for n in [x["node"] for x in _image_nodes]:
-        if len(n.outputs["Color"].links)>0:
+    _attached    = {}
+    for n in _image_nodes:
+        if len(n["node"].outputs["Color"].links)>0:
             if channel == "Normal":
-                if not is_attached_to_normalmap_somehow(n):
-                    n.color_space = "COLOR"
+                #Compute the nodes leading to normal maps once per tree
+                if n["tree"].name not in _attached:
+                    _attached[n["tree"].name] = nodes_attached_to_normalmap(n["tree"])
+                if n["node"].name not in _attached[n["tree"].name]:
+                    n["node"].color_space = "COLOR"
 
     #Add a gamma correction for metalness, roughness, transmission...
     if channel!="Normal" and channel!="Base Color":
@@ -234,6 +424,32 @@ def create_source_baking_material(material, channel):
 
     return _new_material
 
+def source_materials(sources):
+    """The node materials in the slots of each source, None for the empty or non-node slots"""
+    return [[slot.material if slot.material is not None and slot.material.use_nodes else None for slot in source.material_slots] for source in sources]
+
+def create_baking_materials(sources, channels):
+    """Gets the emission variant of each node material used by the sources, once per material and channel"""
+    originals, variants = source_materials(sources), {}
+    for materials in originals:
+        for material in [m for m in materials if m is not None]:
+            for channel in channels:
+                if (material.name, channel) not in variants:
+                    variants[(material.name, channel)] = get_baking_material(material, channel)
+    return originals, variants
+
+def assign_baking_materials(sources, originals, variants, channel=None):
+    """Swaps the sources materials to their variants for channel, back to the originals if channel is None, or empties the slots if channel is False"""
+    for source, materials in zip(sources, originals):
+        for i, material in enumerate(materials):
+            if material is not None:
+                if channel is None:
+                    source.material_slots[i].material = material
+                elif channel is False:
+                    source.material_slots[i].material = None
+                else:
+                    source.material_slots[i].material = variants[(material.name, channel)]
+
 def create_target_baking_material(obj):
     #Remove all materials from the target
     while len(obj.material_slots):
@@ -0,0 +1,299 @@
+import bpy
+import numpy as np
+import os
+import re
+
+from . import fn_msh
+
+#NumPy readers for binary scans, and a bulk mesh builder bypassing the import operators
+
+PLY_TYPES = {
+    "char":"i1", "int8":"i1", "uchar":"u1", "uint8":"u1",
+    "short":"i2", "int16":"i2", "ushort":"u2", "uint16":"u2",
+    "int":"i4", "int32":"i4", "uint":"u4", "uint32":"u4",
+    "float":"f4", "float32":"f4", "double":"f8", "float64":"f8",
+}
+#Vertex properties the fast path knows how to transfer, the others go through the operator
+PLY_VERTEX = ["x", "y", "z", "nx", "ny", "nz", "red", "green", "blue", "alpha"]
+
+def dedupe(points):
+    """Merges identical points, returns the unique points and the index of each point in them"""
+    #Hash the bit patterns (+0 merges -0.0 and 0.0), and sort the hashes
+    bits = np.ascontiguousarray(points + np.float32(0), dtype=np.float32).view(np.uint32).astype(np.uint64)
+    key  = bits[:,0] * np.uint64(0x9E3779B97F4A7C15)
+    key ^= bits[:,1] * np.uint64(0xC2B2AE3D27D4EB4F)
+    key ^= bits[:,2] * np.uint64(0x165667B19E3779F9)
+    order = np.argsort(key)
+    key   = key[order]
+    new   = np.empty(len(key), dtype=bool)
+    new[:1] = True
+    np.not_equal(key[1:], key[:-1], out=new[1:])
+    index = np.empty(len(key), dtype=np.int32)
+    index[order] = np.cumsum(new) - 1
+    unique = points[order[new]]
+    #Check for hash collisions, and use an exact sort in the (unlikely) case of one
+    if not np.array_equal(unique[index], points):
+        unique, index = np.unique(points, axis=0, return_inverse=True)
+    return unique, index.reshape(-1)
+
+def remove_degenerate(faces):
+    """Removes the faces using the same vertex twice"""
+    keep = np.ones(len(faces), dtype=bool)
+    for i in range(faces.shape[1]):
+        for j in range(i+1, faces.shape[1]):
+            keep &= faces[:,i] != faces[:,j]
+    return faces[keep]
+
+def read_stl(path):
+    """Reads a binary .stl, returns (verts, faces, colors) or None if the file is not a binary stl"""
+    with open(path, "rb") as f:
+        f.seek(80)
+        count = np.fromfile(f, dtype="<u4", count=1)
+    if len(count)==0 or os.path.getsize(path) != 84 + 50 * int(count[0]):
+        return None
+    record = np.dtype([("normal", "<f4", (3,)), ("verts", "<f4", (3,3)), ("attribute", "<u2")])
+    facets = np.fromfile(path, dtype=record, offset=84)
+    verts, index = dedupe(facets["verts"].reshape((-1,3)))
+    del facets
+    return verts, remove_degenerate(index.reshape((-1,3))), None
+
+def read_ply_header(f):
+    """Returns the format and the list of (element, count, properties) of a .ply header"""
+    if f.readline().strip() != b"ply":
+        return None, []
+    fmt, elements = None, []
+    for line in f:
+        words = line.decode("ascii", "replace").split()
+        if not words or words[0] in ["comment", "obj_info"]:
+            continue
+        if words[0] == "end_header":
+            return fmt, elements
+        if words[0] == "format":
+            fmt = words[1]
+        elif words[0] == "element":
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == "property" and elements:
+            elements[-1][2].append(words[1:])
+    return None, []
+
+def read_ply(path):
+    """Reads a binary little endian .ply, returns (verts, faces, colors) or None if the fast path does not apply"""
+    with open(path, "rb") as f:
+        fmt, elements = read_ply_header(f)
+        if fmt != "binary_little_endian":
+            return None
+        verts, faces, colors = None, None, None
+        for name, count, properties in elements:
+            #Scalar properties map to a structured dtype
+            if all(p[0]!="list" for p in properties):
+                if any(p[0] not in PLY_TYPES for p in properties):
+                    return None
+                dtype = np.dtype([(p[1], "<"+PLY_TYPES[p[0]]) for p in properties])
+                data  = np.fromfile(f, dtype=dtype, count=count)
+                if len(data) != count:
+                    return None
+                if name == "vertex":
+                    if any(p[1] not in PLY_VERTEX for p in properties):
+                        return None
+                    verts = np.stack([data["x"], data["y"], data["z"]], axis=1).astype(np.float32)
+                    if all(c in dtype.names for c in ["red", "green", "blue"]):
+                        rgba   = [data[c] for c in ["red", "green", "blue"]]
+                        rgba  += [data["alpha"] if "alpha" in dtype.names else np.full(count, 255)]
+                        colors = np.stack(rgba, axis=1).astype(np.float32) / 255.
+            #Faces with a single list of vertex indices, all of the same length
+            elif name == "face" and len(properties) == 1 and properties[0][3] in ["vertex_indices", "vertex_index"]:
+                if properties[0][1] not in PLY_TYPES or properties[0][2] not in PLY_TYPES:
+                    return None
+                start = f.tell()
+                size  = np.fromfile(f, dtype="<"+PLY_TYPES[properties[0][1]], count=1)
+                if count == 0 or len(size) == 0:
+                    return None
+                f.seek(start)
+                dtype = np.dtype([("size", "<"+PLY_TYPES[properties[0][1]]), ("index", "<"+PLY_TYPES[properties[0][2]], (int(size[0]),))])
+                data  = np.fromfile(f, dtype=dtype, count=count)
+                if len(data) != count or np.any(data["size"] != size[0]):
+                    return None
+                faces = data["index"].astype(np.int32)
+            #Other list properties (edges, mixed polygons...) are left to the operator
+            else:
+                return None
+    if verts is None or faces is None or faces.shape[1] < 3:
+        return None
+    return verts, remove_degenerate(faces), colors
+
+def read_obj(path):
+    """Reads the geometry of a .obj, returns (verts, faces, colors) with faces grouped by number of sides, or None"""
+    with open(path, "rb") as f:
+        lines = f.read().splitlines()
+    verts = [l[2:] for l in lines if l.startswith(b"v ")]
+    faces = [l[2:] for l in lines if l.startswith(b"f ")]
+    del lines
+    if not verts or not faces:
+        return None
+    #Vertices may carry colors or weights after the coordinates
+    width = len(verts[0].split())
+    verts = np.fromstring(b" ".join(verts), sep=" ")
+    if width < 3 or len(verts) % width:
+        return None
+    verts = verts.reshape((-1,width))[:,:3]
+    #Keep the vertex indices only, and group the polygons by size
+    faces = re.sub(rb"/\S*", b"", b"\n".join(faces)).split(b"\n")
+    sizes = np.array([len(l.split()) for l in faces])
+    groups = []
+    for sides in np.unique(sizes):
+        if sides < 3:
+            continue
+        group = np.fromstring(b" ".join([l for l, n in zip(faces, sizes) if n == sides]), sep=" ", dtype=np.int64)
+        if len(group) != sides * np.sum(sizes == sides) or np.any(group < 1):
+            return None
+        groups.append((group - 1).reshape((-1,sides)))
+    if not groups:
+        return None
+    return verts, groups, None
+
+def write_ply(path, verts, faces):
+    """Writes (n,3) vertices and (m,k) polygons (or a list of them) as a binary little endian .ply"""
+    groups = [f for f in (faces if isinstance(faces, (list, tuple)) else [faces]) if len(f)>0]
+    header  = "ply\nformat binary_little_endian 1.0\n"
+    header += "element vertex %d\nproperty float x\nproperty float y\nproperty float z\n" % len(verts)
+    header += "element face %d\nproperty list uchar int vertex_indices\nend_header\n" % sum([len(f) for f in groups])
+    with open(path, "wb") as f:
+        f.write(header.encode("ascii"))
+        np.ascontiguousarray(verts, dtype="<f4").tofile(f)
+        for group in groups:
+            data = np.empty(len(group), dtype=[("size", "u1"), ("index", "<i4", (group.shape[1],))])
+            data["size"], data["index"] = group.shape[1], group
+            data.tofile(f)
+
+def write_obj(path, verts, faces):
+    """Writes (n,3) vertices and (m,k) polygons (or a list of them) as a .obj"""
+    groups = [f for f in (faces if isinstance(faces, (list, tuple)) else [faces]) if len(f)>0]
+    writer = fn_msh.Mesh()
+    with open(path, "wb") as f:
+        writer.writeBlocks(f, verts, "v %.8f %.8f %.8f\n")
+        for group in groups:
+            writer.writeBlocks(f, group, "f" + " %i" * group.shape[1] + "\n", convert=lambda x: x + 1)
+
+def mesh_from_arrays(name, verts, faces, colors=None, materials=None):
+    """Creates a mesh from (n,3) vertices, (m,k) polygons (or a list of them), optional (n,4) vertex colors and per polygon material indices"""
+    groups = [f for f in (faces if isinstance(faces, (list, tuple)) else [faces]) if len(f)>0]
+    sizes  = np.concatenate([np.full(len(f), f.shape[1], dtype=np.int32) for f in groups])
+    loops  = np.concatenate([np.ravel(f) for f in groups]).astype(np.int32)
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(verts))
+    mesh.vertices.foreach_set("co", np.ascontiguousarray(verts, dtype=np.float32).ravel())
+    mesh.loops.add(len(loops))
+    mesh.loops.foreach_set("vertex_index", loops)
+    mesh.polygons.add(len(sizes))
+    mesh.polygons.foreach_set("loop_start", np.cumsum(sizes, dtype=np.int32) - sizes)
+    mesh.polygons.foreach_set("loop_total", sizes)
+    if materials is not None:
+        mesh.polygons.foreach_set("material_index", np.ascontiguousarray(materials, dtype=np.int32))
+    if colors is not None:
+        layer = mesh.vertex_colors.new()
+        layer.data.foreach_set("color", np.ascontiguousarray(colors[loops], dtype=np.float32).ravel())
+    mesh.update(calc_edges=True)
+    mesh.validate()
+    return mesh
+
+def mesh_to_arrays(mesh):
+    """Returns the (n,3) vertices, the loops vertex indices, and the loop starts, sizes and material indices of the polygons"""
+    verts = np.empty(3 * len(mesh.vertices), dtype=np.float32)
+    mesh.vertices.foreach_get("co", verts)
+    loops = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loops)
+    starts, sizes, materials = [np.empty(len(mesh.polygons), dtype=np.int32) for i in range(3)]
+    mesh.polygons.foreach_get("loop_start", starts)
+    mesh.polygons.foreach_get("loop_total", sizes)
+    mesh.polygons.foreach_get("material_index", materials)
+    return verts.reshape((-1,3)), loops, starts, sizes, materials
+
+def polygons_with_sides(loops, starts, sizes, sides):
+    """Returns the mask and the (n,sides) vertex indices of the polygons with the given number of sides"""
+    mask = sizes == sides
+    return mask, loops[starts[mask][:,None] + np.arange(sides)]
+
+def polygons_by_sides(loops, starts, sizes):
+    """Returns the list of (n,k) vertex indices of the polygons, one array per number of sides k"""
+    return [polygons_with_sides(loops, starts, sizes, k)[1] for k in np.unique(sizes)]
+
+def sharp_edges(mesh):
+    """Returns the (n,2) vertex indices of the edges marked as sharp"""
+    sharp = np.empty(len(mesh.edges), dtype=bool)
+    mesh.edges.foreach_get("use_edge_sharp", sharp)
+    edges = np.empty(2 * len(mesh.edges), dtype=np.int32)
+    mesh.edges.foreach_get("vertices", edges)
+    return edges.reshape((-1,2))[sharp]
+
+def vertex_group_weights(mesh, index):
+    """Returns the weights of the vertex group index for every vertex of mesh, 0 where unassigned"""
+    #The weights are not exposed to foreach_get, gather them in a single pass over the vertices
+    weights = np.zeros(len(mesh.vertices))
+    for v in mesh.vertices:
+        for g in v.groups:
+            if g.group == index:
+                weights[v.index] = g.weight
+    return weights
+
+def vertex_group_from_weights(obj, weights, name="Group", levels=4096):
+    """Creates a vertex group from per vertex weights in [0,1], with one add call per quantized weight"""
+    group   = obj.vertex_groups.new(name=name)
+    buckets = np.round(np.clip(weights, 0, 1) * (levels - 1)).astype(np.int32)
+    order   = np.argsort(buckets, kind="stable")
+    values, starts = np.unique(buckets[order], return_index=True)
+    for value, indices in zip(values, np.split(order, starts[1:])):
+        group.add(indices.tolist(), float(value) / (levels - 1), "REPLACE")
+    return group
+
+def vertex_colors_from_values(mesh, colors, name="Col"):
+    """Creates a vertex color layer from (n,4) per vertex colors"""
+    layer = mesh.vertex_colors.new(name=name)
+    loops = np.empty(len(mesh.loops), dtype=np.int32)
+    mesh.loops.foreach_get("vertex_index", loops)
+    layer.data.foreach_set("color", np.ascontiguousarray(colors[loops], dtype=np.float32).ravel())
+    return layer
+
+def read_scan(path):
+    """Dispatches to the fast readers, returns None for the formats they do not handle"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".stl":
+        return read_stl(path)
+    elif ext == ".ply":
+        return read_ply(path)
+    return None
+
+#Image pixels only support foreach_get and foreach_set from Blender 2.83
+FOREACH_PIXELS = bpy.app.version >= (2, 83, 0)
+
+def get_pixels(image):
+    """Returns the pixels of an image as a (h, w, channels) float32 array, read with a single foreach_get"""
+    w, h, c = image.size[0], image.size[1], image.channels
+    if FOREACH_PIXELS:
+        pixels = np.empty(w * h * c, dtype=np.float32)
+        image.pixels.foreach_get(pixels)
+    else:
+        pixels = np.array(image.pixels[:], dtype=np.float32)
+    return pixels.reshape((h, w, c))
+
+def set_pixels(image, pixels):
+    """Writes a (h, w, channels) array to the pixels of an image with a single foreach_set"""
+    pixels = np.ascontiguousarray(pixels, dtype=np.float32).ravel()
+    if FOREACH_PIXELS:
+        image.pixels.foreach_set(pixels)
+    else:
+        image.pixels[:] = pixels.tolist()
+    image.update()
+
+def fill_pixels(image, color):
+    """Fills an image with a constant color, regenerating it in place when possible"""
+    if image.source == "GENERATED":
+        image.generated_color = color
+    else:
+        pixels = np.empty((image.size[1], image.size[0], image.channels), dtype=np.float32)
+        pixels[:,:] = color[:image.channels]
+        set_pixels(image, pixels)
+
+def pixel_rows(pixels, rows=256):
+    """Yields slices of at most rows lines of a (h, w, channels) array, to bound the size of the temporaries"""
+    for i in range(0, len(pixels), rows):
+        yield slice(i, min(i + rows, len(pixels)))
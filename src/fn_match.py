@@ -1,92 +1,85 @@
 import imghdr
 import os
 import re
+import struct
+import sqlite3
+import concurrent.futures
 
 def rreplace(s, old, new):
     li = s.rsplit(old, 1)
     return new.join(li)
 
+#Parts of the names to remove or replace, as a single alternation compiled once
+#https://stackoverflow.com/questions/6116978/how-to-replace-multiple-substrings-of-a-string
+REPLACEMENTS = {
+    "texturestom_":"",
+    "_1024":"",
+    "2x2_":"",
+    "3x3_":"",
+    "2.5x2.5_":"",
+    " ":"_",
+    "_6k":"",
+    "_4k":"",
+    "_3k":"",
+    "_2k":""
+}
+REPLACEMENTS_PATTERN = re.compile("|".join(re.escape(k) for k in REPLACEMENTS))
+
+#Suffixes of the texture names for each slot, by decreasing priority
+PATTERNS = {
+    "albedo"      : ["albedo", "diffuse", "dif", "alb", "base_color", "basecolor", "color", "_d", "_col","tex"],
+    "ao"          : ["ao", "ambient_occlusion", "occlusion", "occ"],
+    "metallic"    : ["metallic", "metal", "metalness"],
+    "roughness"   : ["roughness", "rou", "rough", "_r"],
+    "glossiness"  : ["specular", "ref", "spec", "glossiness", "reflect", "refl", "gloss"],
+    "normal"      : ["normal", "normals", "nor", "_n", "norm", "nrm"],
+    "height"      : ["height", "dis", "disp", "displacement"],
+    "emission"    : ["emission", "emit", "emissive"],
+    "opacity"     : ["alpha", "transparent", "opacity", "transp", "mask"],
+}
+#Every suffix with its priority and slot, and the lengths to look for at the end of a name
+SUFFIXES = {}
+for _slot in PATTERNS:
+    for _suffix in PATTERNS[_slot]:
+        SUFFIXES.setdefault(_suffix, (len(SUFFIXES), _slot))
+SUFFIX_LENGTHS = sorted(set(len(s) for s in SUFFIXES))
+
+VARIATION_NUMBER = re.compile(r"(?<!\d)\d\Z")
+RESOLUTION       = re.compile(r"_(\d)K\.[^.]*\Z")
+
 def normalize_name(str):
-    #https://stackoverflow.com/questions/6116978/how-to-replace-multiple-substrings-of-a-string
-    _rep     = {
-        "texturestom_":"",
-        "_1024":"",
-        "2x2_":"",
-        "3x3_":"",
-        "2.5x2.5_":"",
-        " ":"_",
-        "_6k":"",
-        "_4k":"",
-        "_3k":"",
-        "_2k":""
-    }
-    _rep     = dict((re.escape(k), _rep[k]) for k in _rep)
-    _pattern = re.compile("|".join(_rep.keys()))
-    _text    = _pattern.sub(lambda m: _rep[re.escape(m.group(0))], str)
-    return _text
+    return REPLACEMENTS_PATTERN.sub(lambda m: REPLACEMENTS[m.group(0)], str)
+def variation_key(image):
+    """Path of an image without its "var" parts, shared by the variations of a texture"""
+    return "".join([x for x in image["file"].split("_") if "var" not in x.lower()])
 def ignore_trailing_variations(images):
-    imageVariations = [i for i in images if "_var" in i["name"]]
-    toIgnore = []
-    a,b,c,d = 0,0,0,0
-    for i1 in imageVariations:
-        for i2 in imageVariations:
-            i1Splitted = "".join([x for x in i1["file"].split("_") if "var" not in x.lower()])
-            i2Splitted = "".join([x for x in i2["file"].split("_") if "var" not in x.lower()])
-            if i1Splitted == i2Splitted and i1!=i2:
-                a+=1
-                try:
-                    n1 = int(i1["name"][-1])
-                    n2 = int(i2["name"][-1])
-                    if n1<n2:
-                        toIgnore.append(i2)
-                        i1["name"] = i1["name"].replace("_var","")[:-1]
-                        break
-                    else:
-                        toIgnore.append(i1)
-                        i2["name"] = i2["name"].replace("_var","")[:-1]
-                        break
-                except:
-                    pass
+    """Keeps the variation with the lowest number of each texture, and removes the trailing numbers of the names"""
+    #Group the numbered variations by texture
+    groups = {}
     for i in images:
-        if "_var" in i["name"]:
-            for i2 in toIgnore:
-                if i["file"] == i2["file"]:
-                    images.remove(i)
+        if "_var" in i["name"] and i["name"][-1:].isdecimal():
+            groups.setdefault(variation_key(i), []).append(i)
+    toIgnore = set()
+    for group in groups.values():
+        if len(group) > 1:
+            kept = min(group, key=lambda i: int(i["name"][-1]))
+            toIgnore.update(id(i) for i in group if i is not kept)
+    images = [i for i in images if id(i) not in toIgnore]
+    #Remove "_var" and the variation number, or a single trailing digit
     for i in images:
         if "_var" in i["name"]:
             i["name"] = i["name"].replace("_var","")[:-1]
-    for i in images:
-        try:
-            n = int(i["name"][-1])
-            try:
-                x = int(i["name"][-2])
-            except:
-                i["name"] = i["name"][:-1]
-        except:
-            pass
+        i["name"] = VARIATION_NUMBER.sub("", i["name"])
     return images
 
 def find_pattern_in_image(f):
-    patterns = {
-        "albedo"      : ["albedo", "diffuse", "dif", "alb", "base_color", "basecolor", "color", "_d", "_col","tex"],
-        "ao"          : ["ao", "ambient_occlusion", "occlusion", "occ"],
-        "metallic"    : ["metallic", "metal", "metalness"],
-        "roughness"   : ["roughness", "rou", "rough", "_r"],
-        "glossiness"  : ["specular", "ref", "spec", "glossiness", "reflect", "refl", "gloss"],
-        "normal"      : ["normal", "normals", "nor", "_n", "norm", "nrm"],
-        "height"      : ["height", "dis", "disp", "displacement"],
-        "emission"    : ["emission", "emit", "emissive"],
-        "opacity"     : ["alpha", "transparent", "opacity", "transp", "mask"],
-    }
-    for slot in patterns:
-        for suffix in patterns[slot]:
-            name = os.path.splitext(f)[0].lower().strip()
-            if name.endswith(suffix):
-                name = rreplace(name, suffix,"")#This fixes a case like "greasy_metal_roughness"
-                while name.endswith("_"):
-                    name = name[:-1]
-                return slot, name
-    return None, None
+    name  = os.path.splitext(f)[0].lower().strip()
+    found = [SUFFIXES[name[-l:]] + (name[-l:],) for l in SUFFIX_LENGTHS if l <= len(name) and name[-l:] in SUFFIXES]
+    if len(found) == 0:
+        return None, None
+    priority, slot, suffix = min(found)
+    name = name[:-len(suffix)].rstrip("_")#This fixes a case like "greasy_metal_roughness"
+    return slot, name
 
 def material_names_in_images(images):
     for i in images:
@@ -97,68 +90,380 @@ def material_names_in_images(images):
 def material_dictionnary(images):
     materials = {}
     for i in images:
-        if i["material"] is not None:
-            #Create the material if it does not exist
-            if i["material"] not in materials:
-                materials[i["material"]] = {}
-            #Check if the texture slot already exists
-            if i["type"] in materials[i["material"]]:
-                existing = materials[i["material"]][i["type"]]
-                #If it is a diffuse vs albedo conflict
-                if ("Dif" in i["file"] or "Dif" in existing) and ("Alb" in i["file"] or "Alb" in existing):
-                    if "Alb" in i["file"]:
-                        materials[i["material"]][i["type"]] = i
-                    else:
-                        images.remove(i)
-                        continue
-                #if it is a JaoPaulo "SD" vs normal conflict, keep the normal
-                if "SD" in i["file"] or "SD" in existing:
-                    if "SD" in existing:
-                        materials[i["material"]][i["type"]] = i
-                    else:
-                        images.remove(i)
-                        continue
-                #if the ends are _3K and _6K for instance, keep the _6K
-                end3letters = i["file"].split(".")[-2][-3:]
-                if end3letters[0] == "_" and end3letters[2] == "K":
-                    old = materials[i["material"]][i["type"]]
-                    oldend3letters = old.split(".")[-2][-3:]
-                    if int(oldend3letters[1])<int(end3letters[1]):
-                        materials[i["material"]][i["type"]] = i
-                    else:
-                        images.remove(i)
-                        continue
-                else:
-                    print("ERROR on %s" % (i["file"]))
-                    print("\tthe slot %s is already in use by %s" % (i["type"], materials[i["material"]][i["type"]]))
-            materials[i["material"]][i["type"]] = i["file"]
+        if i["material"] is None:
+            continue
+        textures = materials.setdefault(i["material"], {})
+        #Check if the texture slot already exists
+        if i["type"] in textures:
+            existing = textures[i["type"]]
+            #If it is a diffuse vs albedo conflict, keep the albedo
+            if ("Dif" in i["file"] or "Dif" in existing) and ("Alb" in i["file"] or "Alb" in existing):
+                if "Alb" not in i["file"]:
+                    continue
+            #if it is a JaoPaulo "SD" vs normal conflict, keep the normal
+            elif "SD" in i["file"] or "SD" in existing:
+                if "SD" not in existing:
+                    continue
+            #if the ends are _3K and _6K for instance, keep the _6K
+            elif RESOLUTION.search(i["file"]):
+                old = RESOLUTION.search(existing)
+                if old is not None and int(old.group(1)) >= int(RESOLUTION.search(i["file"]).group(1)):
+                    continue
+            else:
+                print("ERROR on %s" % (i["file"]))
+                print("\tthe slot %s is already in use by %s" % (i["type"], existing))
+        textures[i["type"]] = i["file"]
 
     return materials
 
-def findMaterials(directory, recursive = True):
-    """Recursively looks for sets of texture in the specified directory"""
+#Header sniffing, reading only the first bytes of the files
+HEADER_SIZE   = 64
+SNIFF_WORKERS = 16
+
+def jpeg_header(f):
+    """Width, height, bit depth and channels from the start of frame segment, skipping the others"""
+    f.seek(2)
+    while True:
+        b = f.read(1)
+        while b and b != b"\xff":
+            b = f.read(1)
+        while b == b"\xff":
+            b = f.read(1)
+        if not b or b[0] in (0xd9, 0xda):
+            return None
+        if b[0] == 0x01 or 0xd0 <= b[0] <= 0xd8:
+            continue
+        length = struct.unpack(">H", f.read(2))[0]
+        if 0xc0 <= b[0] <= 0xcf and b[0] not in (0xc4, 0xc8, 0xcc):
+            depth, height, width, channels = struct.unpack(">BHHB", f.read(6))
+            return width, height, depth, channels
+        f.seek(length - 2, 1)
+def tiff_header(f, h):
+    """Width, height, bit depth and channels from the tags of the first image directory"""
+    e = "<" if h[:2] == b"II" else ">"
+    if struct.unpack(e + "H", h[2:4])[0] != 42:
+        return None
+    f.seek(struct.unpack(e + "I", h[4:8])[0])
+    n       = struct.unpack(e + "H", f.read(2))[0]
+    entries = f.read(12 * n)
+    tags    = {}
+    for k in range(n):
+        tag, kind, count, value = struct.unpack(e + "HHI4s", entries[12*k:12*k+12])
+        if tag in (256, 257, 258, 277):
+            if kind == 3 and count > 2:
+                f.seek(struct.unpack(e + "I", value)[0])
+                tags[tag] = struct.unpack(e + "H", f.read(2))[0]
+            elif kind == 3:
+                tags[tag] = struct.unpack(e + "H", value[:2])[0]
+            elif kind == 4:
+                tags[tag] = struct.unpack(e + "I", value)[0]
+    return tags.get(256), tags.get(257), tags.get(258, 1), tags.get(277, 1)
+def exr_header(f):
+    """Width, height, bit depth and channels from the dataWindow and channels attributes"""
+    f.seek(8)
+    data = f.read(65536)
+    width, height, depth, channels = None, None, None, None
+    pos = 0
+    while data[pos:pos+1] not in (b"", b"\0"):
+        nameEnd = data.index(b"\0", pos)
+        typeEnd = data.index(b"\0", nameEnd + 1)
+        size    = struct.unpack("<i", data[typeEnd+1:typeEnd+5])[0]
+        value   = data[typeEnd+5:typeEnd+5+size]
+        name    = data[pos:nameEnd]
+        if name == b"dataWindow":
+            xmin, ymin, xmax, ymax = struct.unpack("<iiii", value)
+            width, height = xmax - xmin + 1, ymax - ymin + 1
+        elif name == b"channels":
+            types, c = [], 0
+            while value[c:c+1] not in (b"", b"\0"):
+                c = value.index(b"\0", c) + 1
+                types.append(struct.unpack("<i", value[c:c+4])[0])
+                c += 16
+            channels = len(types)
+            depth    = 16 if len(types) and max(types) == 1 else 32
+        pos = typeEnd + 5 + size
+    return width, height, depth, channels
+
+def read_header(path):
+    """Format, width, height, bit depth per channel and channels of an image read from its header only, None if it is not an image"""
+    header = None
+    try:
+        with open(path, "rb") as f:
+            h   = f.read(HEADER_SIZE)
+            fmt = imghdr.what(None, h)
+            if fmt is None:
+                return None
+            header = {"format": fmt, "width": None, "height": None, "depth": None, "channels": None}
+            info = None
+            if fmt == "png" and h[12:16] == b"IHDR":
+                width, height, depth, color = struct.unpack(">IIBB", h[16:26])
+                info = width, height, depth, {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}.get(color)
+            elif fmt == "jpeg":
+                info = jpeg_header(f)
+            elif fmt == "gif":
+                width, height, flags = struct.unpack("<HHB", h[6:11])
+                info = width, height, 8, 3
+            elif fmt == "bmp":
+                if struct.unpack("<I", h[14:18])[0] == 12:
+                    width, height, planes, bits = struct.unpack("<HHHH", h[18:26])
+                else:
+                    width, height, planes, bits = struct.unpack("<iiHH", h[18:30])
+                info = width, abs(height), 8 if bits in (24, 32) or bits <= 8 else 5, 4 if bits == 32 else 3
+            elif fmt == "tiff":
+                info = tiff_header(f, h)
+            elif fmt == "webp":
+                chunk = h[12:16]
+                if chunk == b"VP8 ":
+                    width, height = struct.unpack("<HH", h[26:30])
+                    info = width & 0x3fff, height & 0x3fff, 8, 3
+                elif chunk == b"VP8L":
+                    bits = struct.unpack("<I", h[21:25])[0]
+                    info = (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1, 8, 4 if bits >> 28 & 1 else 3
+                elif chunk == b"VP8X":
+                    info = int.from_bytes(h[24:27], "little") + 1, int.from_bytes(h[27:30], "little") + 1, 8, 4 if h[20] & 0x10 else 3
+            elif fmt == "exr":
+                info = exr_header(f)
+            if info is not None:
+                header["width"], header["height"], header["depth"], header["channels"] = info
+            return header
+    except OSError:
+        return None
+    except (struct.error, ValueError, IndexError):
+        return header
+
+def read_headers(paths, workers=SNIFF_WORKERS):
+    """Reads the headers of files concurrently, as each open is a round trip on network drives, returns them by path"""
+    paths = list(paths)
+    if len(paths) < 2:
+        return {p: read_header(p) for p in paths}
+    #Batches of files per task, to keep the overhead of the pool low on local drives
+    size    = max(1, min(64, len(paths) // (4 * workers)))
+    batches = [paths[i:i+size] for i in range(0, len(paths), size)]
+    headers = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch, results in zip(batches, executor.map(lambda b: [read_header(p) for p in b], batches)):
+            headers.update(zip(batch, results))
+    return headers
+
+def image_record(path, header, name=None):
+    """Dictionnary used to match an image, with its header information"""
+    record = {
+        "file": path,
+        "dir":  os.path.dirname(path),
+        "name": normalize_name(os.path.splitext(os.path.basename(path))[0].lower().strip()) if name is None else name,
+    }
+    record.update(header)
+    return record
+
+class LibraryIndex:
+    """Persistent index of texture libraries, storing the files, their headers and their materials in a SQLite database"""
+    #Version of the tables, they are built again when it changes
+    VERSION = 1
+    HEADER  = ["format", "width", "height", "depth", "channels"]
 
-    #List all availables images in the specified directory
-    images = []
+    def __init__(self, path):
+        self.db = sqlite3.connect(path)
+        #The database and its temporary files may lie in an indexed library
+        self.own = set([os.path.abspath(path) + suffix for suffix in ["", "-journal", "-wal", "-shm"]])
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != self.VERSION:
+            self.db.executescript("DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS materials; PRAGMA user_version=%d;" % self.VERSION)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS dirs (
+                root     TEXT NOT NULL,
+                path     TEXT NOT NULL,
+                parent   TEXT,
+                mtime    REAL,
+                PRIMARY KEY (root, path)
+            );
+            CREATE TABLE IF NOT EXISTS files (
+                root     TEXT NOT NULL,
+                path     TEXT NOT NULL,
+                dir      TEXT NOT NULL,
+                size     INTEGER,
+                mtime    REAL,
+                format   TEXT,
+                width    INTEGER,
+                height   INTEGER,
+                depth    INTEGER,
+                channels INTEGER,
+                name     TEXT,
+                type     TEXT,
+                material TEXT,
+                PRIMARY KEY (root, path)
+            );
+            CREATE INDEX IF NOT EXISTS files_dir ON files(root, dir);
+            CREATE INDEX IF NOT EXISTS files_material ON files(root, material);
+            CREATE TABLE IF NOT EXISTS materials (
+                root     TEXT NOT NULL,
+                material TEXT NOT NULL,
+                slot     TEXT NOT NULL,
+                file     TEXT NOT NULL,
+                PRIMARY KEY (root, material, slot)
+            );
+        """)
+    def close(self):
+        self.db.close()
+
+    def rewritten(self, files):
+        """Whether one of the indexed (path, size, mtime) files changed since, rewriting a file in place leaving its directory mtime as is"""
+        for path, size, mtime in files:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return True
+            if st.st_size != size or st.st_mtime != mtime:
+                return True
+        return False
+
+    def walk(self, root, full=False):
+        """Stats the directories and their indexed files, listing only the directories where something changed (all of them if full), returns the seen and the listed ones"""
+        known    = {}
+        children = {}
+        for path, parent, mtime in self.db.execute("SELECT path, parent, mtime FROM dirs WHERE root=?", (root,)):
+            known[path] = mtime
+            children.setdefault(parent, []).append(path)
+        indexed = {}
+        for path, d, size, mtime in self.db.execute("SELECT path, dir, size, mtime FROM files WHERE root=?", (root,)):
+            indexed.setdefault(d, []).append((path, size, mtime))
+        seen, listed = set(), []
+        stack = [root]
+        while len(stack):
+            d = stack.pop()
+            try:
+                mtime = os.stat(d).st_mtime
+            except OSError:
+                continue
+            seen.add(d)
+            if not full and known.get(d) == mtime and not self.rewritten(indexed.get(d, [])):
+                stack.extend(children.get(d, []))
+                continue
+            files, subdirs = [], []
+            try:
+                for e in os.scandir(d):
+                    if e.name[0] == ".":
+                        continue
+                    if e.is_dir():
+                        if not e.is_symlink():
+                            subdirs.append(e.path)
+                    elif os.path.abspath(e.path) not in self.own:
+                        files.append(e)
+            except OSError:
+                continue
+            stack.extend(subdirs)
+            listed.append((d, mtime, files))
+        return seen, set(known) - seen, listed
+
+    def changed_files(self, root, d, files):
+        """Stats the files of a directory, returns them with their previous header when unchanged, and the materials they had"""
+        columns = ["path", "size", "mtime", "material"] + self.HEADER
+        old     = {r[0]: dict(zip(columns, r)) for r in self.db.execute("SELECT %s FROM files WHERE root=? AND dir=?" % ",".join(columns), (root, d))}
+        entries = []
+        for e in files:
+            try:
+                st = e.stat()
+            except OSError:
+                continue
+            previous = old.get(e.path)
+            if previous is not None and previous["size"] == st.st_size and previous["mtime"] == st.st_mtime:
+                header = {k: previous[k] for k in self.HEADER} if previous["format"] is not None else None
+                entries.append((e.path, st, header, False))
+            else:
+                entries.append((e.path, st, None, True))
+        return entries, set(r["material"] for r in old.values())
+
+    def update_directory(self, root, d, mtime, entries):
+        """Matches the images of a directory again, as variations are grouped by directory, returns their materials"""
+        images  = sorted([image_record(path, header) for path, st, header in entries if header is not None], key = lambda image : image["file"])
+        material_names_in_images(ignore_trailing_variations(images))
+        matched = {i["file"]: i for i in images if "type" in i}
+
+        self.db.execute("DELETE FROM files WHERE root=? AND dir=?", (root, d))
+        rows = []
+        for path, st, header in entries:
+            header = header if header is not None else {k: None for k in self.HEADER}
+            image  = matched.get(path, {})
+            rows.append([root, path, d, st.st_size, st.st_mtime] + [header[k] for k in self.HEADER] + [image.get("name"), image.get("type"), image.get("material")])
+        self.db.executemany("INSERT INTO files (root, path, dir, size, mtime, %s, name, type, material) VALUES (%s)" % (",".join(self.HEADER), ",".join("?" * (8 + len(self.HEADER)))), rows)
+        self.db.execute("INSERT OR REPLACE INTO dirs (root, path, parent, mtime) VALUES (?,?,?,?)", (root, d, os.path.dirname(d), mtime))
+        return set(i.get("material") for i in matched.values())
+
+    def scan(self, directory, full=False):
+        """Updates the index of a library and the materials affected by its changes, then returns its materials"""
+        root = os.path.abspath(directory)
+        seen, removed, listed = self.walk(root, full)
+        affected = set()
+
+        #Read the headers of the new and modified files at once
+        changes = []
+        for d, mtime, files in listed:
+            entries, materials = self.changed_files(root, d, files)
+            affected.update(materials)
+            changes.append((d, mtime, entries))
+        headers = read_headers(path for d, mtime, entries in changes for path, st, header, sniff in entries if sniff)
+
+        with self.db:
+            #Forget the directories which disappeared
+            for d in removed:
+                affected.update(r[0] for r in self.db.execute("SELECT material FROM files WHERE root=? AND dir=?", (root, d)))
+                self.db.execute("DELETE FROM files WHERE root=? AND dir=?", (root, d))
+                self.db.execute("DELETE FROM dirs WHERE root=? AND path=?", (root, d))
+            for d, mtime, entries in changes:
+                entries = [(path, st, headers[path] if sniff else header) for path, st, header, sniff in entries]
+                affected.update(self.update_directory(root, d, mtime, entries))
+            affected.discard(None)
+
+            #Group the images of the affected materials again
+            if len(affected):
+                self.db.execute("CREATE TEMP TABLE IF NOT EXISTS affected (material TEXT PRIMARY KEY)")
+                self.db.execute("DELETE FROM affected")
+                self.db.executemany("INSERT INTO affected VALUES (?)", [(m,) for m in affected])
+                images = [
+                    {"file": r[0], "dir": r[1], "name": r[2], "type": r[3], "material": r[4]}
+                    for r in self.db.execute("SELECT path, dir, name, type, material FROM files JOIN affected USING (material) WHERE root=? ORDER BY path", (root,))
+                ]
+                self.db.execute("DELETE FROM materials WHERE root=? AND material IN (SELECT material FROM affected)", (root,))
+                self.db.executemany(
+                    "INSERT INTO materials (root, material, slot, file) VALUES (?,?,?,?)",
+                    [(root, m, slot, f) for m, textures in material_dictionnary(images).items() for slot, f in textures.items()]
+                )
+        print("Indexed %d directories: %d listed, %d removed, %d files sniffed, %d materials updated" % (len(seen), len(listed), len(removed), len(headers), len(affected)))
+        return self.materials(root)
+
+    def materials(self, directory):
+        materials = {}
+        for m, slot, f in self.db.execute("SELECT material, slot, file FROM materials WHERE root=? ORDER BY material, slot", (os.path.abspath(directory),)):
+            materials.setdefault(m, {})[slot] = f
+        return materials
+    def images(self, directory):
+        """Records of the images of a library, with their header information, by path"""
+        columns = ["file", "dir", "name", "type", "material"] + self.HEADER
+        query   = "SELECT path, dir, name, type, material, %s FROM files WHERE root=? AND format IS NOT NULL" % ",".join(self.HEADER)
+        return {r[0]: dict(zip(columns, r)) for r in self.db.execute(query, (os.path.abspath(directory),))}
+
+def findMaterials(directory, recursive = True, index = None, full = False):
+    """Recursively looks for sets of texture in the specified directory, through the persistent index at the path index if given"""
+
+    #Only look at what changed since the last scan
+    if index is not None and recursive:
+        library = LibraryIndex(index)
+        try:
+            return library.scan(directory, full)
+        finally:
+            library.close()
+
+    #List all availables files in the specified directory
+    paths = []
     if recursive:
         for root, subFolders, files in os.walk(directory):
             files = [f for f in files if not f[0] == '.']
             subFolders[:] = [d for d in subFolders if not d[0] == '.']
-            for f in files:
-                if imghdr.what(os.path.join(root, f)) is not None:
-                    images.append({
-                        "file": os.path.join(root, f),
-                        "dir":  os.path.dirname(os.path.join(root, f)),
-                        "name": normalize_name(os.path.splitext(f)[0].lower().strip())
-                    })
+            paths.extend(os.path.join(root, f) for f in files)
     else:
-        for f in [f for f in os.listdir(directory) if f[0]!="." and not os.path.isdir(os.path.join(directory,f))]:
-            if imghdr.what(os.path.join(directory, f)) is not None:
-                images.append({
-                    "file": os.path.join(directory, f),
-                    "dir":  os.path.dirname(os.path.join(directory, f)),
-                    "name": normalize_name(os.path.splitext(f)[0].lower().strip())
-                })
+        paths = [os.path.join(directory, f) for f in os.listdir(directory) if f[0]!="." and not os.path.isdir(os.path.join(directory,f))]
+
+    #Keep the images, with their headers
+    headers = read_headers(paths)
+    images  = [image_record(p, headers[p]) for p in paths if headers[p] is not None]
 
     images.sort(key = lambda image : image["file"])
     images    = ignore_trailing_variations(images)
@@ -183,10 +488,10 @@ def findMaterialFromTexture(texture):
 
     #All other images in the directory
     candidates = [os.path.join(directory, f) for f in os.listdir(directory) if os.path.isfile(os.path.join(directory, f))]
-    candidates = [f for f in candidates if imghdr.what(f)]
+    headers    = read_headers(candidates)
 
     #Create the appropriate structure to match materials
-    images = [{"file": f, "dir": directory, "name": normalize_name(os.path.splitext(os.path.basename(f))[0])} for f in candidates]
+    images = [image_record(f, headers[f], normalize_name(os.path.splitext(os.path.basename(f))[0])) for f in candidates if headers[f] is not None]
 
     #Sort them
     images.sort(key = lambda image : image["file"])
@@ -223,4 +528,5 @@ def findMaterialFromTexture(texture):
 
 
 def images_in_directory(directory):
-    return [os.path.join(directory, f) for f in os.listdir(directory) if imghdr.what(os.path.join(directory, f)) is not None]
+    headers = read_headers(os.path.join(directory, f) for f in os.listdir(directory))
+    return [f for f in headers if headers[f] is not None]
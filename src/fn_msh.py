@@ -1,6 +1,8 @@
 #!/usr/bin/env python
 #-*- coding: utf-8 -*-
 import sys
+import os
+import contextlib
 import numpy as np
 import itertools
 
@@ -8,110 +10,212 @@ class Mesh:
 
     # .mesh import functions
     keywords = ["Vertices", "Triangles", "Quadrilaterals","Tetrahedra","SolAtVertices"]
-    def analyse(self, index, line):
-        for k,kwd in enumerate(self.keywords):
-            if self.found[k] and kwd not in self.done:
-                self.numItems[k] = int(line)
-                self.offset += self.numItems[k]
-                self.found[k] = False
-                self.done.append(kwd)
-                return 1
-            if kwd in line:
-                if kwd not in self.done and line[0]!="#":
-                    self.begin[k] = index+3 if kwd=="SolAtVertices" else index+2
-                    self.found[k] = True
-    def get_infos(self, path):
-        for j in range(len(self.keywords)):
-            with open(path) as f:
-                f.seek(0)
-                for i,l in enumerate(f):
-                    if i>self.offset:
-                        if self.analyse(i,l):
-                            break
-                f.seek(0)
-    def readArray(self,f, ind, dim, dt=None):
-        #Allows for searching through n empty lines
-        maxNumberOfEmptylines = 20
-        for i in range(maxNumberOfEmptylines):
-            f.seek(0)
-            firstValidLine = f.readlines()[self.begin[ind]].strip()
-            if firstValidLine == "":
-                self.begin[ind]+=1
-            else:
-                break
+    #Number of lines or rows processed at once when streaming or working on memory-mapped arrays
+    chunkSize = 100000
+    def nextTokens(self, f):
+        """Returns the tokens of the next non empty, non commented line"""
+        for l in f:
+            tokens = l.split()
+            if len(tokens) and tokens[0][0]!="#":
+                return tokens
+        raise ValueError("Unexpected end of file")
+    def readArray(self, f, n, dim, dt=float, name=None):
+        """Streams the n next lines of f into a preallocated (n,dim) array"""
+        arr    = self.allocate(name, (n, dim), dt)
+        flat   = arr.reshape(-1)
+        total  = n * dim
+        filled = 0
+        while filled < total:
+            #Blank lines carry no values, so read until enough values are parsed
+            nLines = max(1, min(self.chunkSize, (total - filled) // dim))
+            lines  = list(itertools.islice(f, nLines))
+            if not len(lines):
+                raise ValueError("Unexpected end of file")
+            values = np.fromstring("".join(lines), sep=" ", dtype=dt)
+            if filled + len(values) > total:
+                raise ValueError("Inconsistent number of values")
+            flat[filled:filled+len(values)] = values
+            filled += len(values)
+        return arr
+    def readSections(self, path, wanted):
+        """Reads the wanted keyword sections of a .mesh or .sol file in a single pass"""
+        sections = {}
+        lookup   = set(wanted + ["Dimension"])
+        self.dimension = 3
+        with open(path) as f:
+            for l in f:
+                tokens = l.split()
+                if not len(tokens) or tokens[0] not in lookup:
+                    continue
+                kwd   = tokens[0]
+                value = int(tokens[1]) if len(tokens)>1 else int(self.nextTokens(f)[0])
+                if kwd == "Dimension":
+                    self.dimension = value
+                elif kwd == "Vertices":
+                    sections[kwd] = self.readArray(f, value, self.dimension+1, float, kwd)
+                elif kwd == "Triangles":
+                    sections[kwd] = self.readArray(f, value, 4, int, kwd)
+                elif kwd == "Quadrilaterals" or kwd == "Tetrahedra":
+                    sections[kwd] = self.readArray(f, value, 5, int, kwd)
+                elif kwd == "Edges":
+                    sections[kwd] = self.readArray(f, value, 3, int, kwd)
+                elif kwd == "SolAtVertices":
+                    types = [int(x) for x in self.nextTokens(f)]
+                    self.solTypes = types[1:1+types[0]]
+                    sections[kwd] = self.readArray(f, value, sum([self.solSize(t) for t in self.solTypes]), float, kwd)
+                lookup.discard(kwd)
+                #Stop once all the wanted sections are read, whether the dimension was found or not
+                if not len(lookup - {"Dimension"}):
+                    break
+        return sections
+    def solSize(self, solType):
+        #Scalar, vector or symmetric tensor
+        if solType == 1:
+            return 1
+        elif solType == 2:
+            return self.dimension
+        else:
+            return self.dimension * (self.dimension + 1) // 2
+    def readSol(self,path=None):
+        if path is None and self.path:
+            path = os.path.splitext(self.path)[0] + (".solb" if self.path.endswith(".meshb") else ".sol")
         try:
-            f.seek(0)
-            X = " ".join([l for l in itertools.islice(f, self.begin[ind], self.begin[ind] + self.numItems[ind])])
-            if dt:
-                return np.fromstring(X, sep=" ", dtype=dt).reshape((self.numItems[ind],dim))
+            if path.endswith(".solb"):
+                sections = self.readBinarySections(path, ["SolAtVertices"])
             else:
-                return np.fromstring(X, sep=" ").reshape((self.numItems[ind],dim))
+                sections = self.readSections(path, ["SolAtVertices"])
         except:
-            #print "Invalid format", ind, dim
-            f.seek(0)
-            try:
-                for i in range(self.begin[ind]):
-                    f.readline()
+            print("No .sol file associated with the .mesh file")
+            return
+        self.scalars = np.array([])
+        self.vectors = np.array([])
+        if "SolAtVertices" in sections:
+            sol = sections["SolAtVertices"]
+            col = 0
+            for t in self.solTypes:
+                #Keep the first scalar and the first vector fields
+                if t==1 and not len(self.scalars):
+                    self.scalars = sol[:,col]
+                    self.solMin  = np.min(self.scalars)
+                    self.solMax  = np.max(self.scalars)
+                if t==2 and not len(self.vectors):
+                    self.vectors = sol[:,col:col+3]
+                    self.vecMin  = np.min(np.linalg.norm(self.vectors,axis=1))
+                    self.vecMax  = np.max(np.linalg.norm(self.vectors,axis=1))
+                col += self.solSize(t)
 
-                arr = []
-                for l in f:
-                    if len(l.strip())>0:
-                        arr.append([int(x) for x in l.strip().split()])
+    # .meshb import functions
+    codes = {
+        "Dimension":3,
+        "Vertices":4,
+        "Edges":5,
+        "Triangles":6,
+        "Quadrilaterals":7,
+        "Tetrahedra":8,
+        "RequiredEdges":16,
+        "End":54,
+        "SolAtVertices":62
+    }
+    def readBinarySections(self, path, wanted):
+        """Reads the wanted keyword sections of a .meshb or .solb file"""
+        sections = {}
+        names    = dict((self.codes[k], k) for k in self.codes)
+        self.dimension = 3
+        with open(path, "rb") as f:
+            #The first integer gives the endianness, the second the version
+            bo      = "<" if np.fromfile(f, "<i4", 1)[0] == 1 else ">"
+            version = int(np.fromfile(f, bo+"i4", 1)[0])
+            wrd     = bo + "i4"
+            pos     = bo + ("i8" if version>=3 else "i4")
+            integer = bo + ("i8" if version>=4 else "i4")
+            real    = bo + ("f4" if version==1 else "f8")
+            while True:
+                header = np.fromfile(f, wrd, 1)
+                if not len(header):
+                    break
+                kwd     = names.get(int(header[0]))
+                nextPos = int(np.fromfile(f, pos, 1)[0])
+                if kwd == "End":
+                    break
+                elif kwd == "Dimension":
+                    self.dimension = int(np.fromfile(f, wrd, 1)[0])
+                elif kwd in wanted:
+                    n = int(np.fromfile(f, integer, 1)[0])
+                    if kwd == "Vertices":
+                        rec = np.dtype([("co", real, (self.dimension,)), ("ref", integer)])
+                        sections[kwd] = self.allocate(kwd, (n, self.dimension+1), float)
+                        for sl in self.chunks(n):
+                            block = np.fromfile(f, rec, sl.stop - sl.start)
+                            sections[kwd][sl,:-1] = block["co"]
+                            sections[kwd][sl,-1]  = block["ref"]
                     else:
-                        break
-                return np.array(arr,dtype=dt)
-            except:
-                print("Did not manage to read the array")
-                sys.exit()
-            sys.exit()
-    def readSol(self,path=None):
-        try:
-            if self.path and not path:
-                self.offset=0
-                self.get_infos(self.path[:-5]+".sol")
-                with open(self.path[:-5]+".sol") as f:
-                        if self.numItems[4]:
-                            #Allows for searching through n empty lines
-                            maxNumberOfEmptylines = 20
-                            for i in range(maxNumberOfEmptylines):
-                                f.seek(0)
-                                firstValidLine = f.readlines()[self.begin[4]].strip()
-                                if firstValidLine == "":
-                                    self.begin[4]+=1
-                                else:
-                                    break
-                            f.seek(0)
-                            nItems = len(f.readlines()[self.begin[4]].strip().split())
-                            f.seek(0)
-                            #Read a scalar
-                            if nItems == 1:
-                                self.scalars = np.array([float(l) for l in itertools.islice(f, self.begin[4], self.begin[4] + self.numItems[4])])
-                                self.solMin = np.min(self.scalars)
-                                self.solMax = np.max(self.scalars)
-                                self.vectors = np.array([])
-                            #Read a vector
-                            if nItems == 3:
-                                self.vectors = np.array([ [float(x) for x in l.strip().split()[:3]] for l in itertools.islice(f, self.begin[4], self.begin[4] + self.numItems[4])])
-                                self.vecMin = np.min(np.linalg.norm(self.vectors,axis=1))
-                                self.vecMax = np.min(np.linalg.norm(self.vectors,axis=1))
-                                self.scalars=np.array([])
-                            #Read a scalar after a vector
-                            if nItems == 4:
-                                self.vectors = np.array([ [float(x) for x in l.strip().split()[:3]] for l in itertools.islice(f, self.begin[4], self.begin[4] + self.numItems[4])])
-                                self.vecMin = np.min(np.linalg.norm(self.vectors,axis=1))
-                                self.vecMax = np.min(np.linalg.norm(self.vectors,axis=1))
-                                f.seek(0)
-                                self.scalars = np.array([float(l.split()[3]) for l in itertools.islice(f, self.begin[4], self.begin[4] + self.numItems[4])])
-                                self.solMin = np.min(self.scalars)
-                                self.solMax = np.max(self.scalars)
+                        if kwd == "SolAtVertices":
+                            types = np.fromfile(f, wrd, int(np.fromfile(f, wrd, 1)[0]))
+                            self.solTypes = [int(t) for t in types]
+                            dim, dt, rec = sum([self.solSize(t) for t in self.solTypes]), float, real
                         else:
-                            self.scalars = np.array([])
-                            self.vectors = np.array([])
-        except:
-            print("No .sol file associated with the .mesh file")
+                            dim = {"Edges":3, "Triangles":4, "Quadrilaterals":5, "Tetrahedra":5, "RequiredEdges":1}[kwd]
+                            dt, rec = int, integer
+                        sections[kwd] = self.allocate(kwd, (n, dim), dt)
+                        for sl in self.chunks(n):
+                            sections[kwd][sl] = np.fromfile(f, rec, (sl.stop - sl.start)*dim).reshape((-1, dim))
+                if nextPos == 0:
+                    break
+                f.seek(nextPos)
+        return sections
+
+    # Memory-mapped arrays
+    arrays = {"Vertices":"verts", "Triangles":"tris", "Quadrilaterals":"quads", "Tetrahedra":"tets"}
+    def allocate(self, name, shape, dt):
+        """Returns an empty array, memory-mapped in the cache directory if there is one"""
+        if self.cache is None or name is None:
+            return np.empty(shape, dtype=dt)
+        return np.lib.format.open_memmap(os.path.join(self.cache, name + ".npy"), mode="w+", dtype=dt, shape=shape)
+    def chunks(self, n):
+        """Yields slices covering n rows, chunkSize rows at a time"""
+        for i in range(0, n, self.chunkSize):
+            yield slice(i, min(i + self.chunkSize, n))
+    def memmap(self, directory):
+        """Moves the vertices and elements arrays to memory-mapped files in directory"""
+        self.cache = directory
+        for name in self.arrays:
+            array = getattr(self, self.arrays[name])
+            if len(array) and not isinstance(array, np.memmap):
+                mapped = self.allocate(name, array.shape, array.dtype)
+                for sl in self.chunks(len(array)):
+                    mapped[sl] = array[sl]
+                setattr(self, self.arrays[name], mapped)
+    def openCache(self):
+        """Maps the arrays previously written to the cache directory"""
+        for name in self.arrays:
+            path = os.path.join(self.cache, name + ".npy")
+            if os.path.exists(path):
+                setattr(self, self.arrays[name], np.load(path, mmap_mode="r+"))
+    def shiftIndices(self, array, n, offset):
+        for sl in self.chunks(len(array)):
+            array[sl,:n] += offset
+    def keepRows(self, array, condition):
+        """Keeps the rows of array for which condition(rows) is True, compacting memory-mapped arrays in place"""
+        if not isinstance(array, np.memmap):
+            return array[condition(array)]
+        kept = 0
+        for sl in self.chunks(len(array)):
+            rows = array[sl][condition(array[sl])]
+            array[kept:kept+len(rows)] = rows
+            kept += len(rows)
+        self.resizeCache(array, kept)
+        return array[:kept]
+    def resizeCache(self, array, n):
+        """Rewrites the .npy header of a memory-mapped array so that it is reopened with n rows"""
+        header = "{'descr': %s, 'fortran_order': False, 'shape': %s, }" % (repr(np.lib.format.dtype_to_descr(array.dtype)), repr((n,) + array.shape[1:]))
+        header = header.ljust(array.offset - 11) + "\n"
+        with open(array.filename, "r+b") as f:
+            f.seek(8)
+            f.write(np.array([len(header)], dtype="<u2").tobytes() + header.encode("latin1"))
 
     # Constructor
-    def __init__(self, path=None, cube=None):
+    def __init__(self, path=None, cube=None, cache=None):
+        self.cache = cache
         if cube:
             self.path = None
             self.verts = np.array([
@@ -144,32 +248,21 @@ class Mesh:
             self.tets=np.array([])
             self.computeBBox()
         elif path:
-            self.done     = []
-            self.found    = [False for k in self.keywords]
-            self.begin    = [0 for k in self.keywords]
-            self.numItems = [0 for k in self.keywords]
-            self.offset   = 0
-
             self.path = path
-            self.get_infos(path)
-            with open(path) as f:
-                if self.numItems[0]:
-                    self.verts = self.readArray(f,0,4,np.float)
-                if self.numItems[1]:
-                    self.tris  = self.readArray(f,1,4,np.int)
-                    self.tris[:,:3]-=1
-                else:
-                    self.tris = np.array([])
-                if self.numItems[2]:
-                    self.quads = self.readArray(f,2,5,np.int)
-                    self.quads[:,:4]-=1
-                else:
-                    self.quads = np.array([])
-                if self.numItems[3]:
-                    self.tets  = self.readArray(f,3,5,np.int)
-                    self.tets[:,:4]-=1
-                else:
-                    self.tets = np.array([])
+            if path.endswith(".meshb"):
+                sections = self.readBinarySections(path, self.keywords[:4])
+            else:
+                sections = self.readSections(path, self.keywords[:4])
+            self.verts = sections["Vertices"] if "Vertices" in sections else np.array([])
+            self.tris  = sections["Triangles"] if "Triangles" in sections else np.array([])
+            self.quads = sections["Quadrilaterals"] if "Quadrilaterals" in sections else np.array([])
+            self.tets  = sections["Tetrahedra"] if "Tetrahedra" in sections else np.array([])
+            if len(self.tris):
+                self.shiftIndices(self.tris, 3, -1)
+            if len(self.quads):
+                self.shiftIndices(self.quads, 4, -1)
+            if len(self.tets):
+                self.shiftIndices(self.tets, 4, -1)
             self.computeBBox()
         else:
             self.path = None
@@ -177,6 +270,10 @@ class Mesh:
             self.tris=np.array([])
             self.quads=np.array([])
             self.tets=np.array([])
+            if cache is not None:
+                self.openCache()
+                if len(self.verts):
+                    self.computeBBox()
         self.scalars=np.array([])
         self.vectors=np.array([])
         self.edges=np.array([])
@@ -201,8 +298,8 @@ class Mesh:
         if len(self.vectors):
             print("\tVectors:         ", len(self.vectors))
     def computeBBox(self):
-        self.xmin, self.ymin, self.zmin = np.amin(self.verts[:,:3],axis=0)
-        self.xmax, self.ymax, self.zmax = np.amax(self.verts[:,:3],axis=0)
+        self.xmin, self.ymin, self.zmin = np.amin([np.amin(self.verts[sl,:3],axis=0) for sl in self.chunks(len(self.verts))],axis=0)
+        self.xmax, self.ymax, self.zmax = np.amax([np.amax(self.verts[sl,:3],axis=0) for sl in self.chunks(len(self.verts))],axis=0)
         self.dims = np.array([self.xmax - self.xmin, self.ymax - self.ymin, self.zmax - self.zmin])
         self.center = np.array([self.xmin + (self.xmax - self.xmin)/2, self.ymin + (self.ymax - self.ymin)/2, self.zmin + (self.zmax - self.zmin)/2])
     def fondre(self, otherMesh):
@@ -221,43 +318,41 @@ class Mesh:
             self.verts = np.append(self.verts, otherMesh.verts, axis=0) if len(self.verts)>0 else otherMesh.verts
 
     def replaceRef(self, oldRef, newRef):
-        if len(self.tris)!=0:
-            self.tris[self.tris[:,-1]==oldRef,-1] = newRef
-        if len(self.quads)!=0:
-            self.quads[self.quads[:,-1]==oldRef,-1] = newRef
-        if len(self.tets)!=0:
-            self.tets[self.tets[:,-1]==oldRef,-1] = newRef
+        for array in [self.tris, self.quads, self.tets]:
+            for sl in self.chunks(len(array)):
+                refs = array[sl,-1]
+                refs[refs==oldRef] = newRef
     def removeRef(self, ref, keepTris=False, keepTets=False, keepQuads=False):
         if len(self.tris)!=0 and not keepTris:
-            self.tris = self.tris[self.tris[:,-1]!=ref]
+            self.tris = self.keepRows(self.tris, lambda x: x[:,-1]!=ref)
         if len(self.quads)!=0 and not keepQuads:
-            self.quads = self.quads[self.quads[:,-1]!=ref]
+            self.quads = self.keepRows(self.quads, lambda x: x[:,-1]!=ref)
         if len(self.tets)!=0 and not keepTets:
-            self.tets = self.tets[self.tets[:,-1]!=ref]
+            self.tets = self.keepRows(self.tets, lambda x: x[:,-1]!=ref)
     def writeVertsRef(self):
-        self.tets = self.tets[self.tets[:,-1].argsort()]
-        for i, t in enumerate(self.tets):
-            for iPt in t[:-1]:
-                self.verts[iPt][-1] = t[-1]
-        self.tris = self.tris[self.tris[:,-1].argsort()]
-        for i, t in enumerate(self.tris):
-            for iPt in t[:-1]:
-                self.verts[iPt][-1] = t[-1]
+        #Each vertex takes the highest reference of its tetrahedra, then of its triangles
+        for name in ["tets", "tris"]:
+            elements = getattr(self, name)
+            if len(elements)==0:
+                continue
+            elements = elements[elements[:,-1].argsort()]
+            setattr(self, name, elements)
+            #Scatter the references one sorted group at a time, so that the last one wins
+            for group in np.split(elements, np.flatnonzero(np.diff(elements[:,-1])) + 1):
+                self.verts[np.ravel(group[:,:-1]),-1] = group[0,-1]
     def scale(self,sc,center=[]):
-        if len(center)>0:
-            self.verts[:,:3] -= center
-        else:
-            self.verts[:,:3] -= self.center
-        self.verts[:,:3] *= sc
-        if len(center)>0:
-            self.verts[:,:3] += center
-        else:
-            self.verts[:,:3] += self.center
+        if len(center)==0:
+            center = self.center
+        for sl in self.chunks(len(self.verts)):
+            self.verts[sl,:3] -= center
+            self.verts[sl,:3] *= sc
+            self.verts[sl,:3] += center
         self.computeBBox()
     def inflate(self,sc):
-        self.verts[:,:3] -= self.center
-        self.verts[:,:3] += sc/np.linalg.norm(self.verts[:,:3],axis=1)[:,None] * self.verts[:,:3]
-        self.verts[:,:3] += self.center
+        for sl in self.chunks(len(self.verts)):
+            self.verts[sl,:3] -= self.center
+            self.verts[sl,:3] += sc/np.linalg.norm(self.verts[sl,:3],axis=1)[:,None] * self.verts[sl,:3]
+            self.verts[sl,:3] += self.center
         self.computeBBox()
     def fitTo(self, otherMesh, keepRatio=True):
         otherDim = [
@@ -269,9 +364,10 @@ class Mesh:
             scale = np.min(otherDim)
         else:
             scale = otherDim
-        self.verts[:,:3]-=self.center
-        self.verts[:,:3]*=scale
-        self.verts[:,:3]+=otherMesh.center
+        for sl in self.chunks(len(self.verts)):
+            self.verts[sl,:3]-=self.center
+            self.verts[sl,:3]*=scale
+            self.verts[sl,:3]+=otherMesh.center
         self.computeBBox()
     def discardUnused(self):
         used = np.zeros(shape=(len(self.verts)),dtype="bool_")
@@ -281,26 +377,16 @@ class Mesh:
             used[np.ravel(self.tets[:,:4])]=True
         if len(self.quads)>0:
             used[np.ravel(self.quads[:,:4])]=True
-        newUsed = np.cumsum(used)
-        self.verts = self.verts[used==True]
+        newUsed = np.cumsum(used) - 1
+        self.verts = self.verts[used]
         if len(self.scalars)>0:
-            self.scalars = self.scalars[used==True]
+            self.scalars = self.scalars[used]
         if len(self.vectors)>0:
-            self.vectors = self.vectors[used==True]
-        if len(self.tris)>0:
-            newTris = np.zeros(shape=(len(self.tris),4),dtype=int)
-            newTris[:,-1] = self.tris[:,-1]
-            for i,triangle in enumerate(self.tris):
-                for j,t in enumerate(triangle[:-1]):
-                    newTris[i,j] = newUsed[t]-1
-            self.tris = newTris
-        if len(self.tets)>0:
-            newTets = np.zeros(shape=(len(self.tets),5),dtype=int)
-            newTets[:,-1] = self.tets[:,-1]
-            for i,tet in enumerate(self.tets):
-                for j,t in enumerate(tet[:-1]):
-                    newTets[i][j] = newUsed[t]-1
-            self.tets = newTets
+            self.vectors = self.vectors[used]
+        #Remap the elements through the cumulative sum table
+        for elements in [self.tris, self.quads, self.tets]:
+            for sl in self.chunks(len(elements)):
+                elements[sl,:-1] = newUsed[elements[sl,:-1]]
         self.computeBBox()
 
     def getHull(self):
@@ -359,6 +445,8 @@ class Mesh:
                 print("Error while writing array", head, array)
             f.close()
     def write(self, path):
+        if path.endswith(".meshb"):
+            return self.writeBinary(path)
         dim = "2" if len(self.verts[0]) == 3 else "3"
         fmt = '%.8f %.8f %i' if len(self.verts[0]) == 3 else '%.8f %.8f %.8f %i'
         self.writeArray(path, "MeshVersionFormatted 2\nDimension " + dim + "\n\nVertices\n" + str(len(self.verts)), self.verts, fmt, firstOpening=True)
@@ -370,82 +458,153 @@ class Mesh:
         with open(path,"a") as f:
             f.write("\nEnd")
     def writeSol(self,path):
+        if path.endswith(".solb"):
+            return self.writeBinarySol(path)
         dim = "2" if len(self.verts[0]) == 3 else "3"
         self.writeArray(path,"MeshVersionFormatted 2\nDimension " + dim + "\n\nSolAtVertices\n"+str(len(self.scalars))+"\n1 1", self.scalars, '%.8f', firstOpening=True)
 
+    # .meshb export functions
+    def writeKeyword(self, f, kwd, array=None, header=[], pos="<i4", convert=None):
+        """Writes a binary keyword, with its count, header words and records (converted chunk by chunk)"""
+        convert = convert if convert is not None else (lambda x: np.ascontiguousarray(x))
+        size    = convert(array[:1]).nbytes * len(array) if array is not None and len(array) else 0
+        counts  = np.array([len(array)] if array is not None else [], dtype="<i4")
+        header  = np.array(header, dtype="<i4")
+        end     = f.tell() + 4 + np.dtype(pos).itemsize + counts.nbytes + header.nbytes + size
+        np.array([self.codes[kwd]], dtype="<i4").tofile(f)
+        np.array([0 if kwd=="End" else end], dtype=pos).tofile(f)
+        counts.tofile(f)
+        header.tofile(f)
+        if array is not None:
+            for sl in self.chunks(len(array)):
+                convert(array[sl]).tofile(f)
+    def binaryRecords(self, array):
+        """Converts (n, dim+1) vertices to packed coordinates / reference records"""
+        dim = array.shape[1] - 1
+        rec = np.empty(len(array), dtype=np.dtype([("co", "<f8", (dim,)), ("ref", "<i4")]))
+        rec["co"]  = array[:,:-1]
+        rec["ref"] = array[:,-1]
+        return rec
+    def binaryElements(self, array):
+        """Converts (n, k+1) elements to 1-based 32 bits integers"""
+        array = np.array(array, dtype="<i4")
+        array[:,:-1] += 1
+        return array
+    def binaryVersion(self, nbytes):
+        #Version 3 uses 64 bits positions, needed above 2GB
+        return (3, "<i8") if nbytes > 2**31 - 1024 else (2, "<i4")
+    def writeBinary(self, path):
+        dim = len(self.verts[0]) - 1
+        sections = [("Vertices", self.verts, self.binaryRecords)]
+        for kwd, array in [("Triangles", self.tris), ("Quadrilaterals", self.quads), ("Tetrahedra", self.tets), ("Edges", self.edges)]:
+            if len(array):
+                sections.append((kwd, array, self.binaryElements))
+        if len(self.edges):
+            sections.append(("RequiredEdges", np.arange(1, len(self.edges)+1, dtype="<i4"), None))
+        version, pos = self.binaryVersion(sum([len(s[1]) * (len(s[1][0]) if s[1].ndim>1 else 1) * 8 for s in sections]))
+        with open(path, "wb") as f:
+            np.array([1, version], dtype="<i4").tofile(f)
+            self.writeKeyword(f, "Dimension", header=[dim], pos=pos)
+            for kwd, array, convert in sections:
+                self.writeKeyword(f, kwd, array, pos=pos, convert=convert)
+            self.writeKeyword(f, "End", pos=pos)
+    def writeBinarySol(self, path):
+        dim = len(self.verts[0]) - 1
+        scalars = np.ascontiguousarray(self.scalars, dtype="<f8")
+        version, pos = self.binaryVersion(scalars.nbytes)
+        with open(path, "wb") as f:
+            np.array([1, version], dtype="<i4").tofile(f)
+            self.writeKeyword(f, "Dimension", header=[dim], pos=pos)
+            self.writeKeyword(f, "SolAtVertices", scalars, header=[1, 1], pos=pos)
+            self.writeKeyword(f, "End", pos=pos)
+
     # other export functions
+    def output(self, path):
+        """Opens path for binary writing, or passes an already opened file object through"""
+        if hasattr(path, "write"):
+            return contextlib.nullcontext(path)
+        return open(path, "wb")
+    def writeBlocks(self, f, array, fmt, dt=None, convert=None):
+        """Writes array chunk by chunk, formatted with fmt, or as raw dt values if dt is given"""
+        for sl in self.chunks(len(array)):
+            block = array[sl] if convert is None else convert(array[sl])
+            if dt is None:
+                f.write(((fmt * len(block)) % tuple(np.ravel(block).tolist())).encode("ascii"))
+            else:
+                f.write(np.ascontiguousarray(block, dtype=dt).tobytes())
+    def facetNormals(self, corners):
+        """Unit normals of the triangles given by their (n,3,3) corner coordinates"""
+        u, v = corners[:,1] - corners[:,0], corners[:,2] - corners[:,0]
+        normals = np.empty((len(corners), 3))
+        normals[:,0] = u[:,1] * v[:,2] - u[:,2] * v[:,1]
+        normals[:,1] = u[:,2] * v[:,0] - u[:,0] * v[:,2]
+        normals[:,2] = u[:,0] * v[:,1] - u[:,1] * v[:,0]
+        norms = np.sqrt(np.einsum("ij,ij->i", normals, normals))
+        norms[norms==0] = 1
+        return normals / norms[:,None]
     def writeOBJ(self, path):
-        with open(path, "w") as f:
-            f.write("o MeshExport\n")
-            for v in self.verts:
-                f.write( "v %.8f %.8f %.8f\n" % (v[0], v[1], v[2]) )
-            f.write("\n")
-            f.write("usemtl None\ns off\n")
-            for t in self.tris:
-                f.write( "f %i %i %i\n" % (t[0]+1, t[1]+1, t[2]+1) )
-            for t in self.quads:
-                f.write( "f %i %i %i %i\n" % (t[0]+1, t[1]+1, t[2]+1, t[3]+1) )
-            f.write("\n")
-    def writeSTL(self, path):
-        with open(path, "w") as f:
-            f.write("solid meshExport\n")
-            for t in self.tris:
-                output = "facet normal " + str(1) + " " + str(1) + " " + str(1) + "\n"
-                output+= "   outer loop\n"
-                output+= "     vertex %.8f %.8f %.8f\n" % (self.verts[t[0],0], self.verts[t[0],1], self.verts[t[0],2])
-                output+= "     vertex %.8f %.8f %.8f\n" % (self.verts[t[1],0], self.verts[t[1],1], self.verts[t[1],2])
-                output+= "     vertex %.8f %.8f %.8f\n" % (self.verts[t[2],0], self.verts[t[2],1], self.verts[t[2],2])
-                output+= "   endloop\n"
-                output+= "endfacet\n"
-                f.write(output)
-            f.write("end solid")
-    def writeVTK(self, path):
-        with open(path, "w") as f:
-            header =  "# vtk DataFile Version 2.0\nMesh export\nASCII\n"
+        with self.output(path) as f:
+            f.write(b"o MeshExport\n")
+            self.writeBlocks(f, self.verts, "v %.8f %.8f %.8f\n", convert=lambda x: x[:,:3])
+            f.write(b"\nusemtl None\ns off\n")
+            self.writeBlocks(f, self.tris, "f %i %i %i\n", convert=lambda x: x[:,:3]+1)
+            self.writeBlocks(f, self.quads, "f %i %i %i %i\n", convert=lambda x: x[:,:4]+1)
+            f.write(b"\n")
+    def writeSTL(self, path, binary=False):
+        def facets(tris):
+            #Normal followed by the three vertices of each triangle
+            corners = self.verts[:,:3][tris[:,:3]]
+            return np.concatenate((self.facetNormals(corners), corners.reshape((-1,9))), axis=1)
+        with self.output(path) as f:
+            if binary:
+                record = np.dtype([("normal", "<f4", (3,)), ("verts", "<f4", (9,)), ("attribute", "<u2")])
+                f.write(b"meshExport".ljust(80) + np.array([len(self.tris)], dtype="<u4").tobytes())
+                def records(tris):
+                    rec = np.zeros(len(tris), dtype=record)
+                    data = facets(tris)
+                    rec["normal"], rec["verts"] = data[:,:3], data[:,3:]
+                    return rec
+                self.writeBlocks(f, self.tris, None, dt=record, convert=records)
+            else:
+                f.write(b"solid meshExport\n")
+                fmt  = "facet normal %.8f %.8f %.8f\n   outer loop\n"
+                fmt += "     vertex %.8f %.8f %.8f\n" * 3
+                fmt += "   endloop\nendfacet\n"
+                self.writeBlocks(f, self.tris, fmt, convert=facets)
+                f.write(b"endsolid meshExport\n")
+    def writeVTK(self, path, binary=False):
+        #Legacy VTK binary data is big endian
+        fl, it = (">f4", ">i4") if binary else (None, None)
+        nCells = len(self.tets) + len(self.tris)
+        with self.output(path) as f:
+            header =  "# vtk DataFile Version 2.0\nMesh export\n" + ("BINARY" if binary else "ASCII") + "\n"
             header += "DATASET UNSTRUCTURED_GRID\n\n"
-            f.write(header)
+            f.write(header.encode("ascii"))
             # Writing vertices
-            f.write("POINTS " + str(len(self.verts)) + " float\n")
-            for v in self.verts:
-                f.write('%.8f %.8f %.8f\n' % (v[0],v[1],v[2]))
-            f.write("\n")
+            f.write(("POINTS %d float\n" % len(self.verts)).encode("ascii"))
+            self.writeBlocks(f, self.verts, "%.8f %.8f %.8f\n", fl, lambda x: x[:,:3])
+            f.write(b"\n")
             #Writing the cells
-            f.write("CELLS "
-            #+ str(len(self.tets)) + " "
-            #+ str(5 * len(self.tets)) + "\n"
-            + str(len(self.tets) + len(self.tris)) + " "
-            + str(5 * len(self.tets) + 4 * len(self.tris)) + "\n"
-            )
-            if len(self.tris)>0:
-                for t in self.tris:
-                    f.write("3 %i %i %i\n" % (t[0], t[1], t[2]))
-                f.write("\n")
-            if len(self.tets)>0:
-                for t in self.tets:
-                    f.write("4 %i %i %i %i\n" % (t[0], t[1], t[2], t[3]))
-                f.write("\n")
-            f.write("CELL_TYPES " + str(len(self.tets) + len(self.tris)) + "\n")
-            if len(self.tris)>0:
-                for t in self.tris:
-                    f.write("5\n")
-            if len(self.tets)>0:
-                for t in self.tets:
-                    f.write("10\n")
-            f.write("\n")
+            f.write(("CELLS %d %d\n" % (nCells, 5 * len(self.tets) + 4 * len(self.tris))).encode("ascii"))
+            self.writeBlocks(f, self.tris, "%i %i %i %i\n", it, lambda x: np.insert(x[:,:3], 0, 3, axis=1))
+            self.writeBlocks(f, self.tets, "%i %i %i %i %i\n", it, lambda x: np.insert(x[:,:4], 0, 4, axis=1))
+            f.write(b"\n")
+            f.write(("CELL_TYPES %d\n" % nCells).encode("ascii"))
+            self.writeBlocks(f, self.tris, "%i\n", it, lambda x: np.full(len(x), 5))
+            self.writeBlocks(f, self.tets, "%i\n", it, lambda x: np.full(len(x), 10))
+            f.write(b"\n")
             # Writing the scalar and vector data
             if len(self.scalars)>0 or len(self.vectors)>0:
-                f.write("POINT_DATA " + str(len(self.verts)) + "\n")
+                f.write(("POINT_DATA %d\n" % len(self.verts)).encode("ascii"))
                 #Writing the scalar fields
                 if len(self.scalars)>0:
-                    f.write("SCALARS pressure float\nLOOKUP_TABLE default\n")
-                    for v in self.scalars:
-                        f.write("%.8f\n" % v)
-                    f.write("\n")
+                    f.write(b"SCALARS pressure float\nLOOKUP_TABLE default\n")
+                    self.writeBlocks(f, self.scalars, "%.8f\n", fl)
+                    f.write(b"\n")
                 if len(self.vectors)>0:
-                    f.write("VECTORS velocity float\n")
-                    for v in self.vectors:
-                        f.write("%.8f %.8f %.8f\n" % (v[0],v[1],v[2]))
+                    f.write(b"VECTORS velocity float\n")
+                    self.writeBlocks(f, self.vectors, "%.8f %.8f %.8f\n", fl, lambda x: x[:,:3])
+                    f.write(b"\n")
     def writeXYZ(self, path):
-        with open(path,"w") as f:
-            for v in self.verts:
-                f.write("%.8f %.8f %.8f\n" % (v[0], v[1], v[2]))
+        with self.output(path) as f:
+            self.writeBlocks(f, self.verts, "%.8f %.8f %.8f\n", convert=lambda x: x[:,:3])
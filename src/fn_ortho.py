@@ -1,6 +1,7 @@
 import bpy
 import numpy as np
 import os
+from . import fn_io
 
 #Blender camera and opengl render functions
 def _set_camera_options(camera_data):
@@ -61,40 +62,17 @@ def crop(img):
     #Get the image info and pixels
     w      = img.size[0]
     h      = img.size[1]
-    pixels = np.array(img.pixels, dtype=float).reshape((w,h,4))
+    pixels = fn_io.get_pixels(img)
     path   = os.path.abspath(img.filepath_raw)
     bpy.data.images.remove(img)
 
-    #Crop top and bottom
-    starth,endh = 0,0
-    for i,row in enumerate(pixels):
-        if sum(row[:,3]) == 0.0:
-            pass
-        else:
-            starth = i
-            break
-    for i,row in enumerate(pixels[::-1]):
-        if sum(row[:,3]) == 0.0:
-            pass
-        else:
-            endh = h - i
-            break
-    #Crop left and right
-    startw,endw = 0,0
-    for i,col in enumerate(np.transpose(pixels,(1,0,2))):
-        if sum(col[:,3]) == 0.0:
-            pass
-        else:
-            startw = i
-            break
-    for i,col in enumerate(np.transpose(pixels,(1,0,2))[::-1]):
-        if sum(col[:,3]) == 0.0:
-            pass
-        else:
-            endw = h - i
-            break
-
-    return pixels[starth:endh,startw:endw,:]
+    #Crop to the rows and columns with non transparent pixels
+    alpha = pixels[:,:,3] != 0.
+    rows  = np.flatnonzero(np.any(alpha, axis=1))
+    cols  = np.flatnonzero(np.any(alpha, axis=0))
+    if len(rows) == 0:
+        return pixels[0:0,0:0,:]
+    return pixels[rows[0]:rows[-1]+1,cols[0]:cols[-1]+1,:]
 def create_axio_array(a01, a10, a11, a12, a13, a21, M=50):
     """
     assert(a01.shape[1] == a11.shape[1] == a21.shape[1])
@@ -166,6 +144,6 @@ def array_to_image(arr, path):
     img = bpy.data.images.new("tmp", arr.shape[1], arr.shape[0], alpha=1)
     img.file_format = "PNG"
     img.filepath_raw = path
-    img.pixels = np.ravel(arr)
+    fn_io.set_pixels(img, arr)
     img.save()
     bpy.data.images.remove(img)
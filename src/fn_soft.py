@@ -1,21 +1,103 @@
 import subprocess
 import os
 import shutil
+import signal
+import threading
+import contextlib
+import concurrent.futures
 
 DEBUG = False
 
-def run(cmd):
-
-    print("Running %s" % cmd)
+def kill(process):
+    """Kills a command along with the processes its shell started"""
+    try:
+        if os.name!="nt":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass
 
-    result = subprocess.run(
+def execute(cmd, timeout=None, stream=None, processes=None):
+    """Runs a shell command, passing its stdout lines to stream as they come, killing it after timeout seconds"""
+    process = subprocess.Popen(
         ' '.join(cmd.split()),
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
-        shell=os.name!="nt"
+        shell=os.name!="nt",
+        start_new_session=os.name!="nt"
     )
+    if processes is not None:
+        processes.add(process)
+
+    #Collect stderr on the side so that neither pipe fills up, and kill the command on timeout
+    err = []
+    errReader = threading.Thread(target=lambda: err.append(process.stderr.read()))
+    errReader.start()
+    timer = threading.Timer(timeout, kill, [process]) if timeout is not None else None
+    if timer is not None:
+        timer.start()
+
+    out = []
+    for line in iter(process.stdout.readline, b""):
+        out.append(line)
+        if stream is not None:
+            stream(line.decode('utf-8', 'replace').rstrip("\n"))
+    process.wait()
+    errReader.join()
+    if timer is not None:
+        timer.cancel()
+    if processes is not None:
+        processes.discard(process)
+
+    return b"".join(out).decode('utf-8'), b"".join(err).decode('utf-8'), process.returncode
 
-    return result.stdout.decode('utf-8'), result.stderr.decode('utf-8'), result.returncode
+class Pool:
+    """Runs shell commands on at most workers concurrent subprocesses, submit() returning futures of (stdout, stderr, returncode)"""
+    def __init__(self, workers=None, timeout=None):
+        self.executor  = concurrent.futures.ThreadPoolExecutor(max_workers=workers if workers else os.cpu_count())
+        self.timeout   = timeout
+        self.processes = set()
+        self.futures   = []
+    def submit(self, cmd, stream=None):
+        print("Queuing %s" % cmd)
+        if stream is None and DEBUG:
+            stream = print
+        future = self.executor.submit(execute, cmd, self.timeout, stream, self.processes)
+        #Only keep track of the commands which may still be cancelled
+        self.futures = [f for f in self.futures if not f.done()]
+        self.futures.append(future)
+        return future
+    def cancel(self):
+        """Drops the queued commands and kills the running ones"""
+        for future in self.futures:
+            future.cancel()
+        for process in list(self.processes):
+            kill(process)
+    def shutdown(self, cancel=False):
+        if cancel:
+            self.cancel()
+        self.executor.shutdown(wait=True)
+
+#Commands are submitted to this pool instead of being run when it is set, see submitting()
+POOL = None
+
+@contextlib.contextmanager
+def submitting(pool):
+    """Within this context, the remeshers functions return futures from pool instead of blocking"""
+    global POOL
+    previous, POOL = POOL, pool
+    try:
+        yield pool
+    finally:
+        POOL = previous
+
+def run(cmd):
+    if POOL is not None:
+        return POOL.submit(cmd)
+
+    print("Running %s" % cmd)
+    return execute(cmd)
 
 #Remeshers
 def mmgs(
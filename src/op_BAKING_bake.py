@@ -3,9 +3,26 @@ import os
 from . import fn_nodes
 from . import fn_soft
 from . import fn_bake
+from . import fn_io
 import numpy as np
 import collections
 import time
+import tempfile
+
+#Samples of the ambient occlusion pass, the emission channels only need one
+AO_SAMPLES = 64
+
+#Material slot filled by each emission channel
+CHANNEL_SLOTS = {
+    "Base Color":   "albedo",
+    "Metallic":     "metallic",
+    "Roughness":    "roughness",
+    "Normal":       "normal",
+    "Transmission": "transmission",
+    "Subsurface":   "subsurface",
+    "Emission":     "emission",
+    "Opacity":      "opacity"
+}
 
 def addImageNode(mat, nam, res):
     if bpy.data.images.get(nam):
@@ -18,57 +35,39 @@ def addImageNode(mat, nam, res):
     _imagenode.image           = _image
     return _imagenode
 
-def bakeWithBlender(mat, nam, res, _type="NORMALS"):
-    #To blender internal
-    restore = mat.use_nodes
-    engine  = bpy.context.scene.render.engine
-    bpy.context.scene.render.engine="CYCLES"
-    mat.use_nodes = False
-    # 3/2/19 - ES - Commenting out because can't find equivalent command in 2.8 API
-    # bpy.context.scene.render.use_bake_to_vertex_color = False
+def bakePass(mat, nam, res, _type="NORMAL", samples=1):
+    """Bakes a Cycles pass of the selected objects into a new image of the target material"""
+    _imagenode = addImageNode(mat, nam, res)
+    _bake      = bpy.data.scenes["Scene"].render.bake
+    _samples   = bpy.data.scenes["Scene"].cycles.samples
 
+    #Normals are data, with a neutral background
+    if _type == "NORMAL":
+        _imagenode.image.colorspace_settings.name = "Non-Color"
+        _bake.normal_space = "TANGENT"
+        _bake.use_clear    = False
+        fn_io.fill_pixels(_imagenode.image, (0.5, 0.5, 1, 1))
 
-    if bpy.data.images.get(nam):
-        bpy.data.images.remove(bpy.data.images.get(nam))
-    image = bpy.data.images.new(nam, res, res)
-
-    tex = bpy.data.textures.new( nam, type = 'IMAGE')
-    tex.image = image
-
-    for c in range(3):
-        if mat.texture_slots[c] is not None:
-            mat.texture_slots.clear(c)
-    mtex = mat.texture_slots.add()
-
-    mtex.texture = tex
-    mtex.texture_coords = 'UV'
-
-    bpy.context.scene.render.use_bake_selected_to_active = True
-
-    bpy.ops.object.editmode_toggle()
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.data.screens['UV Editing'].areas[1].spaces[0].image = image
-    mat.use_textures[0] = False
-    bpy.context.scene.render.bake_type = _type
-    bpy.ops.object.bake_image()
-    bpy.ops.object.editmode_toggle()
+    bpy.data.scenes["Scene"].cycles.samples = samples
+    bpy.ops.object.bake(type=_type)
 
     #Do some clean up
-    bpy.data.textures.remove(tex)
-
-    #Back to original
-    mat.use_nodes = restore
-    bpy.context.scene.render.engine=engine
-    return image
-
-
+    _image = _imagenode.image
+    mat.node_tree.nodes.remove(_imagenode)
+    bpy.data.scenes["Scene"].cycles.samples = _samples
+    _bake.use_clear = True
+    return _image
 
 class bake_cycles_textures(bpy.types.Operator):
     bl_idname = "bakemyscan.bake_textures"
     bl_label  = "Textures to textures"
     bl_options = {"REGISTER", "UNDO"}
 
-    resolution: bpy.props.IntProperty( name="resolution",     description="image resolution", default=1024, min=128, max=8192)
+    resolution: bpy.props.IntProperty( name="resolution",     description="image resolution, per tile in tiled mode", default=1024, min=128, max=8192)
+    tiles: bpy.props.IntProperty( name="tiles",     description="number of UDIM tiles per side, 1 to bake single images", default=1, min=1, max=10)
+    adaptive_cage: bpy.props.BoolProperty(name="adaptive_cage", description="extrude a cage per vertex just past the source, the cage ratio becoming the maximum extrusion", default=False)
+    incremental: bpy.props.BoolProperty(name="incremental", description="reuse the images of the channels whose inputs did not change since the last bake", default=True)
+    tiles_directory: bpy.props.StringProperty(name="tiles_directory", description="where to write the UDIM tiles, next to the .blend file by default", subtype="DIR_PATH", default="")
     cageRatio: bpy.props.FloatProperty(name="cageRatio",     description="baking cage size as a ratio", default=0.02, min=0.00001, max=5)
     bake_albedo: bpy.props.BoolProperty(name="bake_albedo",    description="albedo", default=True)
     bake_ao: bpy.props.BoolProperty(name="bake_ao",        description="ambient occlusion", default=False)
@@ -88,6 +87,11 @@ class bake_cycles_textures(bpy.types.Operator):
         box = self.layout.box()
         box.prop(self, "resolution", text="Image resolution")
         box.prop(self, "cageRatio",  text="Relative cage size")
+        box.prop(self, "adaptive_cage", text="Adaptive cage")
+        box.prop(self, "tiles",      text="UDIM tiles per side")
+        if self.tiles > 1:
+            box.prop(self, "tiles_directory", text="Tiles directory")
+        box.prop(self, "incremental", text="Skip unchanged channels")
         box = self.layout.box()
         box.label(text="PBR channels")
         box.prop(self, "bake_albedo",    text="Albedo")
@@ -136,6 +140,140 @@ class bake_cycles_textures(bpy.types.Operator):
             return 0
         return 1
 
+    def bake_images(self, sources, originals, variants, channels, todo, targetMat, prefix, timings):
+        """Bakes the channels and the slots in todo into images of the operator resolution, returns them by channel"""
+
+        #Keep track of the baked images
+        baked = {}
+
+        #Bake the Principled shader slots by swapping in their emission variants
+        for baketype in channels:
+            print("Baking the channel: %s" % baketype)
+            t = time.time()
+            fn_bake.assign_baking_materials(sources, originals, variants, baketype)
+
+            #Add an image node to the material with the baked result image assigned
+            suffix     = baketype.replace(" ", "").lower()
+            imgNode    = addImageNode(targetMat, prefix + "_" + suffix, self.resolution)
+
+            #If we are in normal baking, make the background neutral and do no use clear
+            if baketype == "Normal":
+                bpy.data.scenes["Scene"].render.bake.use_clear = False
+                fn_io.fill_pixels(imgNode.image, (0.5, 0.5, 1, 1))
+
+            #Do the baking and keep the image
+            bpy.ops.object.bake(type="EMIT")
+            baked[baketype] = imgNode.image
+
+            #Do some clean up
+            targetMat.node_tree.nodes.remove(imgNode)
+            bpy.data.scenes["Scene"].render.bake.use_clear = True
+            timings[baketype] = timings.get(baketype, 0.) + time.time() - t
+
+        #Bake the geometric passes without materials, so that the source normal maps are ignored
+        fn_bake.assign_baking_materials(sources, originals, variants, False)
+
+        #Bake the AO
+        if self.bake_ao and "ao" in todo:
+            print("Baking the ao")
+            t = time.time()
+            baked["AO"] = bakePass(targetMat, prefix + "_ao", self.resolution, _type="AO", samples=AO_SAMPLES)
+            timings["AO"] = timings.get("AO", 0.) + time.time() - t
+
+        #Bake and mix the normal maps
+        if self.bake_geometry and "normal" in todo:
+            print("Baking the geometric normals")
+            t = time.time()
+            if self.bake_surface:
+                baked["Geometry"] = bakePass(targetMat, prefix + "_geometry", self.resolution)
+                print("Mixing geometric and surface normals")
+                baked["Normals"] = fn_bake.overlay_normals(baked["Geometry"], baked["Normal"], prefix + "_normals")
+                bpy.data.images.remove(baked["Geometry"])
+                bpy.data.images.remove(baked["Normal"])
+            else:
+                baked["Normals"] = bakePass(targetMat, prefix + "_normals", self.resolution)
+            timings["Geometry"] = timings.get("Geometry", 0.) + time.time() - t
+        else:
+            if "Normal" in baked:
+                baked["Normals"] = baked["Normal"]
+                baked["Normals"].name = prefix + "_normals"
+
+        #Restore the original materials, the temporary ones stay cached for the next bakes
+        fn_bake.assign_baking_materials(sources, originals, variants)
+
+        return baked
+
+    def outputs(self, baked):
+        """Returns the baked images by material slot, None for the ones not baked"""
+        return {
+            "albedo":    baked.get("Base Color"),
+            "ao":        baked.get("AO"),
+            "metallic":  baked.get("Metallic"),
+            "roughness": baked.get("Roughness"),
+            "normal":    baked.get("Normals"),
+            "transmission": baked.get("Transmission"),
+            "subsurface": baked.get("Subsurface"),
+            "emission":  baked.get("Emission"),
+            "opacity":   baked.get("Opacity")
+        }
+
+    def slot_hashes(self, target, sources, channels):
+        """Hashes the inputs of each enabled slot: geometries, target UVs, bake settings and the channel subgraphs of the source materials with their images"""
+        common    = [fn_bake.object_hash(target, uvs=True), sorted([fn_bake.object_hash(s) for s in sources]), self.resolution, self.tiles, self.cageRatio, self.adaptive_cage]
+        materials = set([m for materials in fn_bake.source_materials(sources) for m in materials if m is not None])
+        subgraphs = {c: sorted([fn_bake.channel_hash(m, c) for m in materials]) for c in channels}
+        inputs    = {CHANNEL_SLOTS[c]: [c, subgraphs[c]] for c in channels if c != "Normal"}
+        if self.bake_ao:
+            inputs["ao"] = ["AO"]
+        if self.bake_geometry or self.bake_surface:
+            inputs["normal"] = ["Normal", self.bake_geometry, subgraphs.get("Normal")]
+        return {slot: fn_bake.inputs_hash(common + inputs[slot]) for slot in inputs}
+
+    def bake_tiles(self, target, bakeArgs):
+        """Bakes tiles x tiles UDIM tiles by offsetting the target UVs, saving and freeing each tile before the next one"""
+        n         = self.tiles
+        directory = bpy.path.abspath(self.tiles_directory) if self.tiles_directory else os.path.dirname(bpy.data.filepath) if bpy.data.filepath else tempfile.gettempdir()
+        uvs       = target.data.uv_layers.active
+        coords    = np.empty(2 * len(uvs.data), dtype=np.float32)
+        uvs.data.foreach_get("uv", coords)
+        coords    = coords.reshape((-1,2))
+
+        #Bake the tiles, the UVs of tile (i,j) being moved to the unit square
+        names = {}
+        try:
+            for j in range(n):
+                for i in range(n):
+                    udim = 1001 + i + 10 * j
+                    print("Baking the tile %d" % udim)
+                    uvs.data.foreach_set("uv", np.ravel(coords * n - np.array([i, j], dtype=np.float32)))
+                    for slot, img in self.outputs(self.bake_images(*bakeArgs)).items():
+                        if img is not None:
+                            names[slot]      = img.name
+                            img.filepath_raw = os.path.join(directory, "%s.%d.png" % (img.name, udim))
+                            img.file_format  = "PNG"
+                            img.save()
+                            bpy.data.images.remove(img)
+        finally:
+            uvs.data.foreach_set("uv", np.ravel(coords))
+
+        #Add a UV layout spanning the tiles and use it for rendering
+        layer = target.data.uv_layers.get("UDIM")
+        if layer is None:
+            layer = target.data.uv_layers.new(name="UDIM")
+        layer.data.foreach_set("uv", np.ravel(coords * n))
+        layer.active_render = True
+
+        #Load the tiles back as UDIM images, named like the single images
+        tiled = {}
+        for slot in names:
+            if bpy.data.images.get(names[slot]):
+                bpy.data.images.remove(bpy.data.images.get(names[slot]))
+            tiled[slot]        = bpy.data.images.load(os.path.join(directory, "%s.1001.png" % names[slot]))
+            tiled[slot].source = "TILED"
+            tiled[slot].name   = names[slot]
+        print("UDIM tiles written to %s" % directory)
+        return tiled
+
     def execute(self, context):
 
         #Find which object is the source and which is the target
@@ -163,94 +301,64 @@ class bake_cycles_textures(bpy.types.Operator):
         toBake["Emission"]   = self.bake_emission
         toBake["Opacity"]    = self.bake_opacity
 
-        #Keep track of the baked images
-        baked = {}
         #Give a prefix to the image names
         prefix = target.name.replace("_","").replace(" ","").replace(".","").replace("-","").lower() + "_baked"
 
         t0 = time.time()
-
-        #Bake the Principled shader slots by transforming them to temporary emission shaders
-        for baketype in toBake:
-            if toBake[baketype]:
-
-                print("Baking the channel: %s" % baketype)
-
-                #Copy all the objects' materials, and modify them them
-                MATERIALS = []
-                for source in sources:
-                    MATS = [None for i in range(len(source.material_slots))]
-                    for i, slot in enumerate(source.material_slots):
-                        if slot.material is not None:
-                            if slot.material.use_nodes:
-                                MATS[i] = slot.material
-                                tmpMat      = fn_bake.create_source_baking_material(slot.material, baketype)
-                                tmpMat.name = slot.material.name + "_" + baketype
-                                source.material_slots[i].material = tmpMat
-                    MATERIALS.append(MATS)
-
-                #Create a material for the target
-                targetMat = fn_bake.create_target_baking_material(target)
-
-                #Add an image node to the material with the baked result image assigned
-                suffix     = baketype.replace(" ", "").lower()
-                imgNode    = addImageNode(targetMat, prefix + "_" + suffix, self.resolution)
-
-                #If we are in normal baking, make the background neutral and do no use clear
-                if baketype == "Normal":
-                    bpy.data.scenes["Scene"].render.bake.use_clear = False
-                    pixels = np.zeros((self.resolution, self.resolution, 4))
-                    pixels[:,:,:] = [0.5, 0.5, 1, 1]
-                    imgNode.image.pixels = np.ravel(pixels)
-
-                #Do the baking and keep the image
-                bpy.ops.object.bake(type="EMIT")
-                baked[baketype] = imgNode.image
-
-                #Restore the original materials
-                for i, source in enumerate(sources):
-                    for j, slot in enumerate(source.material_slots):
-                        if MATERIALS[i][j] is not None:
-                            if baketype != "Roughness": #DEBUG
-                                bpy.data.materials.remove(source.material_slots[j].material)
-                            source.material_slots[j].material = MATERIALS[i][j]
-
-                #Do some clean up
-                targetMat.node_tree.nodes.remove(imgNode)
-                bpy.data.scenes["Scene"].render.bake.use_clear = True
-
-        #Bake the AO
-        if self.bake_ao:
-            print("Baking the ao")
-            baked["AO"] = bakeWithBlender(targetMat, prefix + "_ao", self.resolution, _type="AO")
-
-        #Bake and mix the normal maps
-        if self.bake_geometry:
-            print("Baking the geometric normals")
-            if self.bake_surface:
-                baked["Geometry"] = bakeWithBlender(targetMat, prefix + "_geometry", self.resolution)
-                print("Mixing geometric and surface normals")
-                baked["Normals"] = fn_bake.overlay_normals(baked["Geometry"], baked["Normal"], prefix + "_normals")
-                bpy.data.images.remove(baked["Geometry"])
-                bpy.data.images.remove(baked["Normal"])
-            else:
-                baked["Normals"] = bakeWithBlender(targetMat, prefix + "_normals", self.resolution)
+        timings = collections.OrderedDict()
+
+        #Reuse the images of the slots whose inputs did not change since the last bake
+        channels = [c for c in toBake if toBake[c]]
+        t = time.time()
+        hashes   = self.slot_hashes(target, sources, channels)
+        manifest = fn_bake.load_manifest(target) if self.incremental else {}
+        reused   = {}
+        for slot in hashes:
+            entry = manifest.get(slot, {})
+            image = bpy.data.images.get(entry.get("image", ""))
+            if image is not None and entry.get("hash") == hashes[slot]:
+                reused[slot] = image
+        if len(reused):
+            print("Reusing the unchanged channels: %s" % ", ".join(reused))
+        todo     = [slot for slot in hashes if slot not in reused]
+        channels = [c for c in channels if CHANNEL_SLOTS[c] in todo]
+        timings["Hashing"] = time.time() - t
+
+        #Get the temporary emission materials of the channels to bake up front, once per source material and channel
+        t = time.time()
+        originals, variants = fn_bake.create_baking_materials(sources, channels)
+        timings["Materials setup"] = time.time() - t
+
+        #Replace the global extrusion by a cage fitted to the sources
+        cage = None
+        if self.adaptive_cage and len(todo):
+            t = time.time()
+            cage, longest = fn_bake.create_adaptive_cage(target, sources, self.cageRatio * maxdim, prefix + "_cage")
+            bpy.data.scenes["Scene"].render.bake.cage_object = cage
+            if hasattr(bpy.data.scenes["Scene"].render.bake, "max_ray_distance"):
+                bpy.data.scenes["Scene"].render.bake.max_ray_distance = longest
+            timings["Cage"] = time.time() - t
+
+        #Create a single material for the target
+        targetMat = fn_bake.create_target_baking_material(target)
+
+        #Bake single images, or UDIM tiles streamed to disk one at a time
+        bakeArgs = (sources, originals, variants, channels, todo, targetMat, prefix, timings)
+        if self.tiles == 1:
+            importSettings = self.outputs(self.bake_images(*bakeArgs))
         else:
-            if self.bake_surface:
-                baked["Normals"] = baked["Normal"]
-                baked["Normals"].name = prefix + "_normals"
-
-        importSettings = {
-            "albedo":    baked["Base Color"] if self.bake_albedo else None,
-            "ao":        baked["AO"]         if self.bake_ao else None,
-            "metallic":  baked["Metallic"]   if self.bake_metallic else None,
-            "roughness": baked["Roughness"]  if self.bake_roughness else None,
-            "normal":    baked["Normals"]    if self.bake_geometry or self.bake_surface else None,
-            "transmission": baked["Transmission"] if self.bake_transmission else None,
-            "subsurface": baked["Subsurface"] if self.bake_subsurface else None,
-            "emission":  baked["Emission"]   if self.bake_emission else None,
-            "opacity":   baked["Opacity"]    if self.bake_opacity else None
-        }
+            importSettings = self.bake_tiles(target, bakeArgs)
+        importSettings.update(reused)
+
+        #Remove the cage
+        if cage is not None:
+            bpy.data.scenes["Scene"].render.bake.cage_object = None
+            if hasattr(bpy.data.scenes["Scene"].render.bake, "max_ray_distance"):
+                bpy.data.scenes["Scene"].render.bake.max_ray_distance = 0.
+            mesh = cage.data
+            bpy.data.objects.remove(cage)
+            bpy.data.meshes.remove(mesh)
+        fn_bake.save_manifest(target, {slot: {"hash": hashes[slot], "image": importSettings[slot].name} for slot in hashes if importSettings.get(slot) is not None})
 
         #Init the material
         for o in context.selected_objects:
@@ -261,6 +369,8 @@ class bake_cycles_textures(bpy.types.Operator):
             if importSettings[_type] is not None:
                 bpy.ops.bakemyscan.assign_texture(slot=_type, filepath=importSettings[_type].name, byname=True)
 
+        for channel in timings:
+            print("%s: %f s" % (channel.ljust(20), timings[channel]))
         print("Baking finished in %f seconds." % (time.time() - t0))
         self.report({'INFO'}, "Baking successful")
         return{'FINISHED'}
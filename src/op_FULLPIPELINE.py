@@ -1,6 +1,9 @@
 import bpy
 import os
+import collections
 import time
+from . import fn_soft
+from . import op_REMESHERS_BASE
 
 def available_methods_callback(scene, context):
     items= [
@@ -23,6 +26,14 @@ def available_methods_callback(scene, context):
 
     return items
 
+#External remeshers which can run at once, and their operators
+PARALLEL_METHODS = collections.OrderedDict([
+    ("mmgs",          "remesh_mmgs"),
+    ("instant",       "remesh_instant"),
+    ("quadriflow",    "remesh_quadriflow"),
+    ("meshlabserver", "remesh_meshlab"),
+])
+
 class full_pipeline(bpy.types.Operator):
     bl_idname = "bakemyscan.full_pipeline"
     bl_label  = "Retopology"
@@ -98,6 +109,17 @@ class full_pipeline(bpy.types.Operator):
         description="Remeshing method",
     )
 
+    #Parallel mode
+    parallel: bpy.props.BoolProperty(description="Run several external remeshers at once", default=False)
+    parallel_methods: bpy.props.EnumProperty(
+        items = (('mmgs', 'Mmgs', ''), ('instant', 'Instant Meshes', ''), ('quadriflow', 'Quadriflow', ''), ('meshlabserver', 'Meshlab', '')),
+        description="Remeshers to run at once",
+        options={"ENUM_FLAG"},
+        default={"instant", "quadriflow"}
+    )
+    parallel_workers: bpy.props.IntProperty(description="Maximum number of remeshers running at once (0 for the number of cores)", default=0, min=0, max=64)
+    parallel_timeout: bpy.props.FloatProperty(description="Time limit of each remesher in seconds (0 for none)", default=0, min=0)
+
     def invoke(self, context, event):
         return context.window_manager.invoke_props_dialog(self)
 
@@ -106,30 +128,40 @@ class full_pipeline(bpy.types.Operator):
 
     def draw(self, context):
         box = self.layout.box()
-        box.prop(self, "remeshing_method", text="Retopology method")
-
-        box = self.layout.box()
-
-        if self.remeshing_method == "decimate":
+        box.prop(self, "parallel", text="Run several remeshers at once")
+        if self.parallel:
+            box.prop(self, "parallel_methods", text="Remeshers")
+            box.prop(self, "parallel_workers", text="Maximum running at once")
+            box.prop(self, "parallel_timeout", text="Time limit (s)")
+            for method in [m for m in PARALLEL_METHODS if m in self.parallel_methods]:
+                box = self.layout.box()
+                box.label(text=method)
+                self.draw_method(box, method)
+        else:
+            box.prop(self, "remeshing_method", text="Retopology method")
+            self.draw_method(self.layout.box(), self.remeshing_method)
+
+    def draw_method(self, box, method):
+        if method == "decimate":
             box.prop(self, "decim_limit", text="Number of faces")
             box.prop(self, "decim_vertex_group", text="Use weights")
             if self.decim_vertex_group:
                 box.prop(self, "decim_factor", text="Weight factor")
 
-        elif self.remeshing_method == "iterative":
+        elif method == "iterative":
             box.prop(self, "iter_limit", text="Number of faces")
             box.prop(self, "iter_vertex_group", text="Use weights")
             if self.iter_vertex_group:
                 box.prop(self, "iter_factor", text="Weight factor")
 
-        elif self.remeshing_method == "quads":
+        elif method == "quads":
             box.prop(self, "quads_nfaces",  text="Number of quads (min)")
             box.prop(self, "quads_smooth", text="Relaxation steps")
             box.prop(self, "quads_vertex_group", text="Use weights")
             if self.quads_vertex_group:
                 box.prop(self, "quads_factor", text="Weight factor")
 
-        elif self.remeshing_method == "quadriflow":
+        elif method == "quadriflow":
             box.prop(self, "quadriflow_resolution", text="Resolution")
             box = box.box()
             box.prop(self, "quadriflow_advanced", text="Advanced options")
@@ -141,7 +173,7 @@ class full_pipeline(bpy.types.Operator):
                     if self.quadriflow_satflip:
                         box.label('"minisat" and "timeout" need to be installed!')
 
-        elif self.remeshing_method == "meshlabserver":
+        elif method == "meshlabserver":
             box.prop(self, "meshlab_facescount",  text="Number of faces")
             box1 = box.box()
             box1.prop(self, "meshlab_advanced", text="Advanced options")
@@ -156,7 +188,7 @@ class full_pipeline(bpy.types.Operator):
                 if self.meshlab_boundaries:
                     box1.prop(self, "meshlab_weight", text="Boundary preserving weight")
 
-        elif self.remeshing_method == "instant":
+        elif method == "instant":
             box.prop(self, "instant_interactive", text="Interactive mode")
             if not self.instant_interactive:
                 box.prop(self, "instant_method", text="Remesh according to")
@@ -180,7 +212,7 @@ class full_pipeline(bpy.types.Operator):
                     box2.prop(self, "instant_p", text="Position symmetry type")
 
 
-        elif self.remeshing_method == "mmgs":
+        elif method == "mmgs":
             box.prop(self, "mmgs_hausd",  text="Haussdorf distance (ratio)")
             box.prop(self, "mmgs_smooth", text="Ignore angle detection (smooth)")
 
@@ -223,42 +255,40 @@ class full_pipeline(bpy.types.Operator):
                 return 0
         return 1
 
-    def execute(self, context):
-
-
-
-        if self.remeshing_method == "decimate":
-            bpy.ops.bakemyscan.remesh_decimate(
+    def method_operator(self, method):
+        """Returns the name and the arguments of the remeshing operator for a method"""
+        if method == "decimate":
+            return "remesh_decimate", dict(
                 limit=self.decim_limit,
                 vertex_group=self.decim_vertex_group,
                 factor=self.decim_factor
             )
 
-        elif self.remeshing_method == "iterative":
-            bpy.ops.bakemyscan.remesh_iterative(
+        elif method == "iterative":
+            return "remesh_iterative", dict(
                 limit=self.iter_limit,
                 vertex_group=self.iter_vertex_group,
                 factor=self.iter_factor
             )
 
-        elif self.remeshing_method == "quads":
-            bpy.ops.bakemyscan.remesh_quads(
+        elif method == "quads":
+            return "remesh_quads", dict(
                 nfaces=self.quads_nfaces,
                 smooth=self.quads_smooth,
                 vertex_group=self.quads_vertex_group,
                 factor=self.quads_factor
             )
 
-        elif self.remeshing_method == "quadriflow":
-            bpy.ops.bakemyscan.remesh_quadriflow(
+        elif method == "quadriflow":
+            return "remesh_quadriflow", dict(
                 resolution=self.quadriflow_resolution,
                 sharp=self.quadriflow_sharp,
                 mincost=self.quadriflow_mincost,
                 satflip=self.quadriflow_satflip
             )
 
-        elif self.remeshing_method == "meshlabserver":
-            bpy.ops.bakemyscan.remesh_meshlab(
+        elif method == "meshlabserver":
+            return "remesh_meshlab", dict(
                 facescount=self.meshlab_facescount,
                 quality=self.meshlab_quality,
                 boundaries=self.meshlab_boundaries,
@@ -270,8 +300,8 @@ class full_pipeline(bpy.types.Operator):
                 post=self.meshlab_post,
             )
 
-        elif self.remeshing_method == "instant":
-            bpy.ops.bakemyscan.remesh_instant(
+        elif method == "instant":
+            return "remesh_instant", dict(
                 interactive=self.instant_interactive,
                 method=self.instant_method,
                 facescount=self.instant_facescount,
@@ -288,8 +318,8 @@ class full_pipeline(bpy.types.Operator):
                 p=self.instant_p,
             )
 
-        elif self.remeshing_method == "mmgs":
-            bpy.ops.bakemyscan.remesh_mmgs(
+        elif method == "mmgs":
+            return "remesh_mmgs", dict(
                 smooth=self.mmgs_smooth,
                 hausd=self.mmgs_hausd,
                 angle=self.mmgs_angle,
@@ -301,6 +331,60 @@ class full_pipeline(bpy.types.Operator):
                 weight=self.mmgs_weight,
             )
 
+    def activate(self, context, obj):
+        """Makes obj the only selected and active object"""
+        bpy.ops.object.select_all(action='DESELECT')
+        obj.select_set(True)
+        context.view_layer.objects.active = obj
+
+    def execute_parallel(self, context):
+        original  = context.active_object
+        available = [m[0] for m in available_methods_callback(context.scene, context)]
+        methods   = [m for m in PARALLEL_METHODS if m in self.parallel_methods and m in available]
+        if len(methods) == 0:
+            self.report({'ERROR'}, 'No configured remesher selected')
+            return{'CANCELLED'}
+
+        #Export and start every remesher, then import their results in order
+        pool    = fn_soft.Pool(self.parallel_workers, self.parallel_timeout if self.parallel_timeout > 0 else None)
+        results = []
+        t       = time.time()
+        with op_REMESHERS_BASE.launching():
+            try:
+                with fn_soft.submitting(pool):
+                    for method in methods:
+                        self.activate(context, original)
+                        name, args = self.method_operator(method)
+                        if method == "instant":
+                            args["interactive"] = False
+                        getattr(bpy.ops.bakemyscan, name)(stage="launch", **args)
+                for method in methods:
+                    self.activate(context, original)
+                    name, args = self.method_operator(method)
+                    if method == "instant":
+                        args["interactive"] = False
+                    getattr(bpy.ops.bakemyscan, name)(stage="collect", **args)
+                    if context.active_object != original:
+                        context.active_object.name = original.name + "." + method
+                        results.append(context.active_object)
+            finally:
+                pool.shutdown(cancel=True)
+
+        #Select all the results, the first one being active
+        bpy.ops.object.select_all(action='DESELECT')
+        for obj in results:
+            obj.select_set(True)
+        if len(results):
+            context.view_layer.objects.active = results[0]
+        print("%d remeshers ran in %.2fs" % (len(methods), time.time() - t))
+        self.report({'INFO'}, '%d out of %d remeshers succeeded' % (len(results), len(methods)))
+        return{'FINISHED'}
+
+    def execute(self, context):
+        if self.parallel:
+            return self.execute_parallel(context)
+        name, args = self.method_operator(self.remeshing_method)
+        getattr(bpy.ops.bakemyscan, name)(**args)
         return{'FINISHED'}
 
 def register() :
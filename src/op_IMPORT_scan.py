@@ -2,6 +2,8 @@ import bpy
 from   bpy_extras.io_utils import ImportHelper
 import os
 
+from . import fn_io
+
 class import_scan(bpy.types.Operator, ImportHelper):
     bl_idname = "bakemyscan.import_scan"
     bl_label  = "Import"
@@ -10,6 +12,7 @@ class import_scan(bpy.types.Operator, ImportHelper):
         default="*.obj;*.ply;*.stl;*.fbx;*.dae;*.x3d;*.wrl",
         options={'HIDDEN'},
     )
+    fast: bpy.props.BoolProperty(name="fast", description="Read binary .stl and .ply with NumPy", default=True)
 
     @classmethod
     def poll(cls, context):
@@ -36,8 +39,14 @@ class import_scan(bpy.types.Operator, ImportHelper):
         #Get a list of the current objects in the scene, to remove the unused ones later
         oldObjects = [o for o in bpy.data.objects]
 
+        #Import binary .stl and .ply files directly from NumPy arrays
+        data = fn_io.read_scan(path) if self.fast else None
+
         #Import the object with the appropriate function
-        if ext==".obj":
+        if data is not None:
+            obj = bpy.data.objects.new(name, fn_io.mesh_from_arrays(name, *data))
+            context.collection.objects.link(obj)
+        elif ext==".obj":
             bpy.ops.import_scene.obj(filepath=path)
         elif ext==".ply":
             bpy.ops.import_mesh.ply(filepath=path)
@@ -14,10 +14,18 @@ class create_library(bpy.types.Operator):
         description="Filepath used for importing the file",
         maxlen=1024,
         subtype='DIR_PATH')
+    full: bpy.props.BoolProperty(
+        name="full",
+        description="Read every file again, not only the ones in modified directories",
+        default=False)
 
     def execute(self, context):
 
-        materials = fn_match.findMaterials(os.path.dirname(self.properties.filepath))
+        #Index kept next to materials.json, to only read what changed since the last scan
+        index = os.path.join(bpy.utils.resource_path('USER'), "materials.db")
+        if not os.path.isdir(os.path.dirname(index)):
+            index = None
+        materials = fn_match.findMaterials(os.path.dirname(self.properties.filepath), index=index, full=self.full)
 
         bpy.types.Scene.pbrtextures = materials
         for m in materials:
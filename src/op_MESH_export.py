@@ -4,6 +4,7 @@ import bmesh
 import os
 
 from . import fn_msh
+from . import fn_io
 
 class export_mesh(bpy.types.Operator, ExportHelper):
 
@@ -13,7 +14,7 @@ class export_mesh(bpy.types.Operator, ExportHelper):
 
     #ExportHelper settings
     filter_glob: bpy.props.StringProperty(
-        default="*.mesh",
+        default="*.mesh;*.meshb",
         options={'HIDDEN'},
     )
     check_extension = True
@@ -60,32 +61,30 @@ class export_mesh(bpy.types.Operator, ExportHelper):
         mesh.transform(obj.matrix_world)
 
         #Get the relevant mesh information
-        verts     = [[v.co[0], v.co[1], v.co[2], 0] for v in mesh.vertices[:]]
-        triangles = [ [v for v in f.vertices] + [f.material_index + 1] for f in mesh.polygons if len(f.vertices) == 3 ]
-        quads     = [ [v for v in f.vertices] + [f.material_index + 1]  for f in mesh.polygons if len(f.vertices) == 4 ]
-        edges     = [ [e.vertices[0], e.vertices[1], 0] for e in mesh.edges if e.use_edge_sharp]
+        verts, loops, starts, sizes, materials = fn_io.mesh_to_arrays(mesh)
+        isTri, triangles = fn_io.polygons_with_sides(loops, starts, sizes, 3)
+        isQuad, quads    = fn_io.polygons_with_sides(loops, starts, sizes, 4)
+        edges            = fn_io.sharp_edges(mesh)
 
-        #Prepare the mesh to export
+        #Prepare the mesh to export, with the material indices as references
         exportMesh = fn_msh.Mesh()
-        exportMesh.verts = fn_msh.np.array(verts)
-        exportMesh.tris  = fn_msh.np.array(triangles)
-        exportMesh.quads = fn_msh.np.array(quads)
-        exportMesh.edges = fn_msh.np.array(edges)
+        exportMesh.verts = fn_msh.np.insert(verts, 3, 0, axis=1).astype(float)
+        exportMesh.tris  = fn_msh.np.insert(triangles, 3, materials[isTri] + 1, axis=1)
+        exportMesh.quads = fn_msh.np.insert(quads, 4, materials[isQuad] + 1, axis=1)
+        exportMesh.edges = fn_msh.np.insert(edges, 2, 0, axis=1)
         exportMesh.write(self.filepath)
 
         #Write a solution file according to the weight paint mode
         vgrp = bpy.context.active_object.vertex_groups.keys()
         if len(vgrp)>0 and self.writeSol:
             GROUP = bpy.context.active_object.vertex_groups.active
-            cols = [0.0] * len(verts)
-            for i,t in enumerate(mesh.polygons):
-                for j,v in enumerate(t.vertices):
-                    try:
-                        cols[v] = 1.0 - float(GROUP.weight(v))
-                    except:
-                        cols[v] = 1.0
-            exportMesh.scalars = fn_msh.np.array(cols)*(self.maxiSol - self.miniSol) + self.miniSol
-            exportMesh.writeSol(self.filepath.replace(".mesh", ".sol"))
+            #Vertices of the polygons get 1-weight, the others 0
+            used = fn_msh.np.zeros(len(verts), dtype=bool)
+            used[loops] = True
+            cols = fn_msh.np.where(used, 1.0 - fn_io.vertex_group_weights(mesh, GROUP.index), 0.0)
+            exportMesh.scalars = cols*(self.maxiSol - self.miniSol) + self.miniSol
+            solExtension = ".solb" if self.filepath.endswith(".meshb") else ".sol"
+            exportMesh.writeSol(os.path.splitext(self.filepath)[0] + solExtension)
 
         #Delete the copy of the original mesh
         bpy.ops.object.delete()
@@ -13,6 +13,7 @@ from . import op_REMESHERS_BASE as base
 class Quadriflow(base.BaseRemesher):
     bl_idname = "bakemyscan.remesh_quadriflow"
     bl_label  = "Quadriflow"
+    tmp       = tempfile.TemporaryDirectory()
 
     resolution: bpy.props.IntProperty( name="resolution", description="Resolution", default=1000, min=10, max=100000 )
 
@@ -40,12 +41,9 @@ class Quadriflow(base.BaseRemesher):
     def setexe(self, context):
         self.executable = bpy.types.Scene.executables["quadriflow"]
     def export(self, context):
-        bpy.ops.export_scene.obj(
-            filepath      = os.path.join(self.tmp.name, "tmp.obj"),
-            use_selection = True
-        )
+        self.export_geometry(context, os.path.join(self.tmp.name, "tmp.obj"))
     def reimport(self, context):
-        bpy.ops.import_scene.obj(filepath=os.path.join(self.tmp.name, "tmp.o.obj"))
+        self.import_geometry(context, os.path.join(self.tmp.name, "tmp.o.obj"))
     def remesh(self, context):
         self.results = fn_soft.quadriflow(
             executable  = self.executable,
@@ -60,6 +58,7 @@ class Quadriflow(base.BaseRemesher):
 class Instant(base.BaseRemesher):
     bl_idname = "bakemyscan.remesh_instant"
     bl_label  = "Instant Meshes"
+    tmp       = tempfile.TemporaryDirectory()
 
     interactive: bpy.props.BoolProperty(  name="interactive", description="Interactive", default=False)
     method: bpy.props.EnumProperty(items= ( ('faces', 'Number of faces', 'Number of faces'), ("verts", "Number of verts", "Number of verts"), ("edges", "Edge length", "Edge length")) , name="Remesh according to", description="Remesh according to", default="faces")
@@ -115,10 +114,7 @@ class Instant(base.BaseRemesher):
     def setexe(self, context):
         self.executable = bpy.types.Scene.executables["instant"]
     def export(self, context):
-        bpy.ops.export_scene.obj(
-            filepath      = os.path.join(self.tmp.name, "tmp.obj"),
-            use_selection = True
-        )
+        self.export_geometry(context, os.path.join(self.tmp.name, "tmp.ply"))
     def reimport(self, context):
         #Get the mesh the user saved
         toreimport = ""
@@ -128,7 +124,7 @@ class Instant(base.BaseRemesher):
                     toreimport = l.split('"')[1]
         else:
             toreimport = os.path.join(self.tmp.name, "tmp.o.obj")
-        bpy.ops.import_scene.obj(filepath=toreimport)
+        self.import_geometry(context, toreimport)
         os.remove(toreimport)
     def remesh(self, context):
         obj    = context.active_object
@@ -136,12 +132,12 @@ class Instant(base.BaseRemesher):
         if self.interactive:
             self.results = fn_soft.instant_meshes_gui(
                 executable  = self.executable,
-                input_mesh  = os.path.join(self.tmp.name, "tmp.obj"),
+                input_mesh  = os.path.join(self.tmp.name, "tmp.ply"),
             )
         else:
             self.results = fn_soft.instant_meshes_cmd(
                 executable  = self.executable,
-                input_mesh  = os.path.join(self.tmp.name, "tmp.obj"),
+                input_mesh  = os.path.join(self.tmp.name, "tmp.ply"),
                 output_mesh = os.path.join(self.tmp.name, "tmp.o.obj"),
                 face_count   = self.facescount if self.method=="faces" else None,
                 vertex_count = self.vertscount if self.method=="verts" else None,
@@ -160,6 +156,7 @@ class Instant(base.BaseRemesher):
 class Mmgs(base.BaseRemesher):
     bl_idname = "bakemyscan.remesh_mmgs"
     bl_label  = "Mmgs"
+    tmp       = tempfile.TemporaryDirectory()
 
     #Basic options
     smooth: bpy.props.BoolProperty(  name="smooth", description="Ignore angle detection (smooth)", default=True)
@@ -213,18 +210,19 @@ class Mmgs(base.BaseRemesher):
         obj    = context.active_object
         self.maxDim = max( max( obj.dimensions[0], obj.dimensions[1]) , obj.dimensions[2] )
         bpy.ops.bakemyscan.export_mesh(
-            filepath=os.path.join(self.tmp.name, "tmp.mesh"),
+            filepath=os.path.join(self.tmp.name, "tmp.meshb"),
             writeSol=self.weight,
             miniSol=self.hmin * self.maxDim,
             maxiSol=self.hmax * self.maxDim
         )
     def reimport(self, context):
-        bpy.ops.bakemyscan.import_mesh(filepath=os.path.join(self.tmp.name, "tmp.o.mesh"))
+        bpy.ops.bakemyscan.import_mesh(filepath=os.path.join(self.tmp.name, "tmp.o.meshb"))
     def remesh(self, context):
         self.results = fn_soft.mmgs(
             executable  = self.executable,
-            input_mesh  = os.path.join(self.tmp.name, "tmp.mesh"),
-            output_mesh = os.path.join(self.tmp.name, "tmp.o.mesh"),
+            input_mesh  = os.path.join(self.tmp.name, "tmp.meshb"),
+            output_mesh = os.path.join(self.tmp.name, "tmp.o.meshb"),
+            input_sol   = os.path.join(self.tmp.name, "tmp.solb") if self.weight else None,
             hausd       = self.hausd * self.maxDim,
             hgrad       = self.hgrad,
             hmin        = self.hmin * self.maxDim,
@@ -240,6 +238,7 @@ class Mmgs(base.BaseRemesher):
 class Meshlab(base.BaseRemesher):
     bl_idname = "bakemyscan.remesh_meshlab"
     bl_label  = "Meshlab"
+    tmp       = tempfile.TemporaryDirectory()
 
     facescount: bpy.props.IntProperty( name="facescount", description="Number of faces", default=5000, min=10, max=1000000 )
     advanced: bpy.props.BoolProperty(  name="advanced", description="advanced properties", default=False)
@@ -277,10 +276,7 @@ class Meshlab(base.BaseRemesher):
     def setexe(self, context):
         self.executable = bpy.types.Scene.executables["meshlabserver"]
     def export(self, context):
-        bpy.ops.export_scene.obj(
-            filepath      = os.path.join(self.tmp.name, "tmp.obj"),
-            use_selection = True
-        )
+        self.export_geometry(context, os.path.join(self.tmp.name, "tmp.ply"))
     def remesh(self, context):
         #Create a temporary meshlab script with custom variables
         original_script = os.path.join(os.path.dirname(__file__), os.path.pardir, "scripts_meshlab", "quadricedgecollapse.mlx")
@@ -305,12 +301,12 @@ class Meshlab(base.BaseRemesher):
         #remesh
         self.results  = fn_soft.meshlabserver(
             executable  = self.executable,
-            input_mesh  = os.path.join(self.tmp.name, "tmp.obj"),
-            output_mesh = os.path.join(self.tmp.name, "tmp.o.obj"),
+            input_mesh  = os.path.join(self.tmp.name, "tmp.ply"),
+            output_mesh = os.path.join(self.tmp.name, "tmp.o.ply"),
             script_file = new_script,
         )
     def reimport(self, context):
-        bpy.ops.import_scene.obj(filepath=os.path.join(self.tmp.name, "tmp.o.obj"))
+        self.import_geometry(context, os.path.join(self.tmp.name, "tmp.o.ply"))
 
 # Custom methods
 
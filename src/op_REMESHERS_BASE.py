@@ -1,18 +1,41 @@
 import bpy
 import os
 from . import fn_soft
+from . import fn_io
 import tempfile
 import time
+import concurrent.futures
+import contextlib
 from mathutils import Vector
 import numpy as np
 
+#Temporary directories and results of the remeshers launched but not collected yet, queued by run and operator
+LAUNCHED = {}
+#Token of the current run of launches, see launching()
+RUN = None
+
+@contextlib.contextmanager
+def launching():
+    """Within this context, the remeshers launched get queued under a token of their own, the ones not collected being dropped on exit"""
+    global RUN
+    previous, RUN = RUN, object()
+    try:
+        yield RUN
+    finally:
+        for key in [k for k in LAUNCHED if k[0] is RUN]:
+            for tmp, results in LAUNCHED.pop(key):
+                if isinstance(results, concurrent.futures.Future):
+                    results.cancel()
+                tmp.cleanup()
+        RUN = previous
+
 class BaseRemesher(bpy.types.Operator):
     bl_idname = "bakemyscan.empty_remesher"
     bl_label  = "Empty remersher structure"
 
     bl_options = {"REGISTER", "UNDO"}
 
-    #For executable remeshers
+    #For executable remeshers (each one overrides tmp, and each launch gets its own)
     tmp        = tempfile.TemporaryDirectory()
     executable = None
     results    = []
@@ -22,6 +45,12 @@ class BaseRemesher(bpy.types.Operator):
     workonduplis = False
     hide_old     = False
 
+    #"launch" exports and starts the external remesher (in fn_soft.POOL if set), "collect" waits for it and imports its result
+    stage: bpy.props.EnumProperty(
+        items=(("all", "All", "Export, remesh and import"), ("launch", "Launch", "Export and start the remesher"), ("collect", "Collect", "Wait for the remesher and import")),
+        name="stage", description="Part of the remeshing to run", default="all", options={"HIDDEN", "SKIP_SAVE"}
+    )
+
 
     @classmethod
     def poll(self, context):
@@ -54,6 +83,33 @@ class BaseRemesher(bpy.types.Operator):
             print("OUTPUT:\n%s\nERROR:\n%s\CODE:\n%s" % self.results)
             return{"CANCELLED"}
 
+    #Geometry exchange with the external remeshers
+    def export_geometry(self, context, path):
+        """Writes the world space geometry of the active object as a binary .ply or a .obj"""
+        obj       = context.active_object
+        evaluated = obj.evaluated_get(context.evaluated_depsgraph_get())
+        verts, loops, starts, sizes, materials = fn_io.mesh_to_arrays(evaluated.to_mesh())
+        evaluated.to_mesh_clear()
+        matrix = np.array(obj.matrix_world)
+        verts  = verts.dot(matrix[:3,:3].T) + matrix[:3,3]
+        faces  = fn_io.polygons_by_sides(loops, starts, sizes)
+        if path.lower().endswith(".obj"):
+            fn_io.write_obj(path, verts, faces)
+        else:
+            fn_io.write_ply(path, verts, faces)
+    def import_geometry(self, context, path):
+        """Reads a remeshed .ply or .obj into a new object, with the import operators as a fallback"""
+        ext  = os.path.splitext(path)[1].lower()
+        data = fn_io.read_obj(path) if ext==".obj" else fn_io.read_ply(path) if ext==".ply" else None
+        if data is not None:
+            name = self.initialobject.name
+            obj  = bpy.data.objects.new(name, fn_io.mesh_from_arrays(name, *data))
+            context.collection.objects.link(obj)
+        elif ext==".obj":
+            bpy.ops.import_scene.obj(filepath=path)
+        else:
+            bpy.ops.import_mesh.ply(filepath=path)
+
     def preprocess(self, context):
         self.initialobject   = context.active_object
         self.existingobjects = [o for o in bpy.data.objects]
@@ -104,14 +160,27 @@ class BaseRemesher(bpy.types.Operator):
         #Preprocess
         self.preprocess(context)
         #Export
-        if self.executable is not None:
+        self.exporttime = 0
+        if self.executable is not None and self.stage == "launch":
+            self.tmp = tempfile.TemporaryDirectory()
+        if self.executable is not None and self.stage != "collect":
             self.exporttime = time.time()
             self.export(context)
             self.exporttime = time.time() - self.exporttime
-        #Remesh
+        #Remesh, or wait for the remesher launched before
         self.remeshtime = time.time()
-        self.remesh(context)
+        if self.executable is not None and self.stage == "collect":
+            self.tmp, self.results = LAUNCHED[(RUN, self.bl_idname)].pop(0)
+            if isinstance(self.results, concurrent.futures.Future):
+                self.results = self.results.result()
+        else:
+            self.remesh(context)
         self.remeshtime = time.time() - self.remeshtime
+        #Leave the remesher running, to be collected later
+        if self.executable is not None and self.stage == "launch":
+            LAUNCHED.setdefault((RUN, self.bl_idname), []).append((self.tmp, self.results))
+            self.report({'INFO'}, '%s launched' % self.bl_label)
+            return{'FINISHED'}
         #Check the output
         if self.executable is not None:
             self.status(context)
@@ -130,6 +199,8 @@ class BaseRemesher(bpy.types.Operator):
         #context.object.show_wire = True
         #context.object.show_all_edges = True
         #Report
+        if self.executable is not None:
+            print("Export: %.2fs, remesh: %.2fs, import: %.2fs" % (self.exporttime, self.remeshtime, self.importtime))
         self.report({'INFO'}, 'Remeshed to %d polygons' % len(context.active_object.data.polygons))
         return{'FINISHED'}
 
@@ -0,0 +1,219 @@
+import bpy
+import os
+import time
+from . import fn_soft
+from . import op_FULLPIPELINE
+from . import op_REMESHERS_BASE
+
+#Remeshing operators able to target a number of faces, and the name of this argument
+LOD_OPERATORS = {
+    "decimate":      ("remesh_decimate",   "limit"),
+    "iterative":     ("remesh_iterative",  "limit"),
+    "quads":         ("remesh_quads",      "nfaces"),
+    "quadriflow":    ("remesh_quadriflow", "resolution"),
+    "instant":       ("remesh_instant",    "facescount"),
+    "meshlabserver": ("remesh_meshlab",    "facescount"),
+}
+EXTERNAL = ["quadriflow", "instant", "meshlabserver"]
+
+def available_lod_methods_callback(scene, context):
+    return [m for m in op_FULLPIPELINE.available_methods_callback(scene, context) if m[0] in LOD_OPERATORS]
+
+class lod_chain(bpy.types.Operator):
+    bl_idname = "bakemyscan.lod_chain"
+    bl_label  = "LOD chain"
+    bl_options = {"REGISTER", "UNDO"}
+
+    method: bpy.props.EnumProperty(items=available_lod_methods_callback, description="Remeshing method")
+    levels: bpy.props.IntProperty(description="Number of levels", default=3, min=2, max=8)
+    limit: bpy.props.IntProperty(description="Number of faces of the first level", default=6000, min=50, max=500000)
+    ratio: bpy.props.FloatProperty(description="Ratio of faces kept from one level to the next", default=0.5, min=0.05, max=0.95)
+    parallel: bpy.props.BoolProperty(description="Run the external remeshers of all the levels at once, each from the full resolution", default=True)
+
+    textures: bpy.props.EnumProperty(
+        items= (
+            ("none",     "None",     "Do not bake"),
+            ("shared",   "Shared",   "Unwrap and bake the first level, the others reusing its textures"),
+            ("separate", "Separate", "Unwrap and bake every level")
+        ),
+        description="Baking of the levels",
+        default="shared"
+    )
+    resolution: bpy.props.IntProperty(description="Image resolution", default=2048, min=128, max=8192)
+    filepath: bpy.props.StringProperty(description="Export all the levels to a .fbx, .glb or .gltf file (optional)", subtype="FILE_PATH", default="")
+
+    @classmethod
+    def poll(self, context):
+        if len(context.selected_objects)!=1 or context.active_object is None:
+            return 0
+        if context.active_object.type != "MESH":
+            return 0
+        if context.mode!="OBJECT":
+            return 0
+        return 1
+
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+
+    def draw(self, context):
+        box = self.layout.box()
+        box.prop(self, "method", text="Retopology method")
+        box.prop(self, "levels", text="Levels")
+        box.prop(self, "limit", text="LOD0 faces")
+        box.prop(self, "ratio", text="Ratio between levels")
+        if self.method in EXTERNAL:
+            box.prop(self, "parallel", text="Remesh the levels at once")
+        box = self.layout.box()
+        box.prop(self, "textures", text="Textures")
+        if self.textures != "none":
+            box.prop(self, "resolution", text="Resolution")
+        box.prop(self, "filepath", text="Export")
+
+    def activate(self, context, obj, others=[]):
+        """Makes obj active and the only selected object along with others"""
+        bpy.ops.object.select_all(action='DESELECT')
+        for o in others:
+            o.select_set(True)
+        obj.select_set(True)
+        context.view_layer.objects.active = obj
+
+    def remesh(self, context, source, faces, stage="all"):
+        """Remeshes source to a number of faces, returning the new object (None if launching or on failure)"""
+        self.activate(context, source)
+        name, arg = LOD_OPERATORS[self.method]
+        args = {arg: faces, "stage": stage}
+        if self.method == "instant":
+            args["interactive"] = False
+        getattr(bpy.ops.bakemyscan, name)(**args)
+        return context.active_object if stage != "launch" and context.active_object != source else None
+
+    def bake(self, context, original, lod):
+        self.activate(context, lod)
+        bpy.ops.bakemyscan.unwrap(method="smarter")
+        bpy.ops.object.shade_smooth()
+        self.activate(context, lod, [original])
+        bpy.ops.bakemyscan.bake_textures(resolution=self.resolution)
+
+    def transfer_uvs(self, context, source, lod):
+        """Projects the uv coordinates of source on lod, which then shares its materials"""
+        self.activate(context, lod)
+        lod.data.uv_layers.new(name=source.data.uv_layers.active.name)
+        modifier = lod.modifiers.new("uvs", type="DATA_TRANSFER")
+        modifier.object           = source
+        modifier.use_loop_data    = True
+        modifier.data_types_loops = {"UV"}
+        modifier.loop_mapping     = "POLYINTERP_NEAREST"
+        bpy.ops.object.modifier_apply(modifier=modifier.name)
+        bpy.ops.object.shade_smooth()
+        for material in source.data.materials:
+            lod.data.materials.append(material)
+
+    def export(self, context, lods):
+        """Writes the levels and their images to filepath"""
+        path      = bpy.path.abspath(self.filepath)
+        directory = os.path.dirname(path)
+        name      = os.path.splitext(os.path.basename(path))[0]
+        #Save the images which were baked but never written
+        saved = set()
+        for lod in lods:
+            for material in lod.data.materials:
+                if material is None or not material.use_nodes:
+                    continue
+                for node in material.node_tree.nodes:
+                    if node.type=="TEX_IMAGE" and node.image is not None and node.image.name not in saved:
+                        if node.image.source == "GENERATED" or node.image.filepath_raw == "":
+                            node.image.filepath_raw = os.path.join(directory, name + "_" + node.name.lower() + ".png")
+                            node.image.file_format  = "PNG"
+                            node.image.save()
+                        saved.add(node.image.name)
+        #Export the levels alone
+        self.activate(context, lods[0], lods[1:])
+        ext = os.path.splitext(path)[1].lower()
+        if ext == ".fbx":
+            bpy.ops.export_scene.fbx(filepath=path, use_selection=True)
+        elif ext in [".glb", ".gltf"]:
+            selection = "use_selection" if "use_selection" in bpy.ops.export_scene.gltf.get_rna_type().properties.keys() else "export_selected"
+            bpy.ops.export_scene.gltf(filepath=path, export_format="GLB" if ext==".glb" else "GLTF_SEPARATE", **{selection: True})
+        else:
+            self.report({'ERROR'}, 'File format not supported: %s' % ext)
+            return False
+        return True
+
+    def execute(self, context):
+        original = context.active_object
+        faces    = [max(50, int(self.limit * self.ratio**i)) for i in range(self.levels)]
+        timings  = {}
+
+        #Shared preprocessing: one copy of the original, with its modifiers and transformations applied
+        t = time.time()
+        self.activate(context, original)
+        bpy.ops.object.duplicate()
+        shared = context.active_object
+        for m in shared.modifiers:
+            bpy.ops.object.modifier_apply(modifier=m.name)
+        bpy.ops.object.transform_apply(location=False, rotation=True, scale=True)
+        timings["preprocess"] = time.time() - t
+
+        #Remesh the levels, at once from the shared copy or each one from the previous level
+        t = time.time()
+        lods = []
+        if self.method in EXTERNAL and self.parallel:
+            pool = fn_soft.Pool()
+            with op_REMESHERS_BASE.launching():
+                try:
+                    with fn_soft.submitting(pool):
+                        for f in faces:
+                            self.remesh(context, shared, f, stage="launch")
+                    for f in faces:
+                        lods.append(self.remesh(context, shared, f, stage="collect"))
+                finally:
+                    pool.shutdown(cancel=True)
+        else:
+            source = shared
+            for f in faces:
+                lod = self.remesh(context, source, f)
+                lods.append(lod)
+                if lod is None:
+                    break
+                source = lod
+        bpy.data.objects.remove(shared)
+        timings["remesh"] = time.time() - t
+
+        if None in lods:
+            for lod in lods:
+                if lod is not None:
+                    bpy.data.objects.remove(lod)
+            self.activate(context, original)
+            self.report({'ERROR'}, 'Remeshing failed, look in the console')
+            return{'CANCELLED'}
+        for i, lod in enumerate(lods):
+            lod.name = original.name + "_LOD%d" % i
+
+        #Unwrap and bake once for all the levels, or once per level
+        t = time.time()
+        if self.textures == "shared":
+            self.bake(context, original, lods[0])
+            for lod in lods[1:]:
+                self.transfer_uvs(context, lods[0], lod)
+        elif self.textures == "separate":
+            for lod in lods:
+                self.bake(context, original, lod)
+        timings["bake"] = time.time() - t
+
+        #Export
+        if self.filepath != "":
+            t = time.time()
+            if not self.export(context, lods):
+                return{'CANCELLED'}
+            timings["export"] = time.time() - t
+
+        self.activate(context, lods[0], lods[1:])
+        print(", ".join("%s: %.2fs" % (k, v) for k, v in timings.items()))
+        self.report({'INFO'}, 'LODs of %s faces' % ", ".join(str(len(lod.data.polygons)) for lod in lods))
+        return{'FINISHED'}
+
+def register() :
+    bpy.utils.register_class(lod_chain)
+
+def unregister() :
+    bpy.utils.unregister_class(lod_chain)
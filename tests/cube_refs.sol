@@ -0,0 +1,15 @@
+MeshVersionFormatted 2
+Dimension 3
+
+SolAtVertices
+8
+1 1
+1.00000000
+5.00000000
+1.00000000
+5.00000000
+1.00000000
+5.00000000
+1.00000000
+5.00000000
+ 
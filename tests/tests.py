@@ -11,6 +11,7 @@ import os
 import time
 import sys
 import json
+import numpy as np
 
 import argparse
 
@@ -198,6 +199,10 @@ if __name__ == "__main__":
         bpy.ops.mesh.primitive_monkey_add(calc_uvs=True)
         target = bpy.context.active_object
         source.select_set(True)
+    _BAKED = {}
+    def prepare_for_rebaking():
+        bpy.data.objects["Suzanne"].select_set(True)
+        _BAKED["albedo"] = bpy.data.images["suzanne001_baked_basecolor"].as_pointer()
 
     def assert_model_imported():
         assert(len(bpy.data.objects) == 1)
@@ -208,8 +213,42 @@ if __name__ == "__main__":
         assert(bpy.context.active_object is not None)
         assert(bpy.context.active_object.name != "Suzanne")
         assert(len(bpy.context.active_object.data.polygons)!=len(bpy.data.objects["Suzanne"].data.polygons))
+    def assert_suzanne_lods():
+        lods = [bpy.data.objects["Suzanne_LOD%d" % i] for i in range(3)]
+        assert(len(bpy.data.objects) == 4)
+        assert(len(lods[0].data.polygons) > len(lods[1].data.polygons) > len(lods[2].data.polygons))
     def assert_pbr_library_non_empty():
         assert(len(bpy.types.Scene.pbrtextures.keys())>0)
+    def write_png(path, size):
+        image = bpy.data.images.new(os.path.basename(path), size, size)
+        image.filepath_raw = path
+        image.file_format  = "PNG"
+        image.save()
+        bpy.data.images.remove(image)
+    def rewrite_library_image():
+        fn_match  = sys.modules["BakeMyScan.src.fn_match"]
+        directory = _PATH("rewritten")
+        if not os.path.isdir(directory):
+            os.mkdir(directory)
+        write_png(os.path.join(directory, "wood_albedo.png"), 64)
+        write_png(os.path.join(directory, "wood_normal.png"), 64)
+        fn_match.findMaterials(directory, index=_PATH("rewritten.db"))
+        #Overwrite the albedo, leaving the mtime of the directory as it was
+        st = os.stat(directory)
+        write_png(os.path.join(directory, "wood_albedo.png"), 128)
+        os.utime(directory, ns=(st.st_atime_ns, st.st_mtime_ns))
+    def assert_rewritten_image_sniffed():
+        fn_match  = sys.modules["BakeMyScan.src.fn_match"]
+        directory = _PATH("rewritten")
+        fn_match.findMaterials(directory, index=_PATH("rewritten.db"))
+        library = fn_match.LibraryIndex(_PATH("rewritten.db"))
+        images  = library.images(directory)
+        library.close()
+        for f in os.listdir(directory):
+            os.remove(os.path.join(directory, f))
+        os.rmdir(directory)
+        os.remove(_PATH("rewritten.db"))
+        assert(images[os.path.join(directory, "wood_albedo.png")]["width"] == 128)
     def assert_json_non_empty():
         with open(_PATH("test.json"), 'r') as fp:
             bpy.types.Scene.pbrtextures = json.load(fp)
@@ -234,12 +273,56 @@ if __name__ == "__main__":
         assert(bpy.data.images.get("suzanne001_baked_roughness") is not None)
         assert(bpy.data.images.get("suzanne001_baked_metallic") is not None)
         assert(bpy.data.images.get("suzanne001_baked_normals") is not None)
+    def assert_unchanged_channels_reused():
+        active = bpy.context.active_object
+        assert("bakemyscan_manifest" in active.keys())
+        assert(bpy.data.images["suzanne001_baked_basecolor"].as_pointer() == _BAKED["albedo"])
+    def assert_baked_tiles():
+        active = bpy.context.active_object
+        assert(active.data.uv_layers.get("UDIM") is not None)
+        for channel in ["basecolor", "roughness", "normals", "ao"]:
+            assert(bpy.data.images.get("suzanne002_baked_" + channel).source == "TILED")
+            for udim in [1001, 1002, 1011, 1012]:
+                path = _PATH("suzanne002_baked_%s.%d.png" % (channel, udim))
+                assert(os.path.exists(path))
+                os.remove(path)
+    def assert_adaptive_cage_ao_unoccluded():
+        def mean(name):
+            return np.array(bpy.data.images[name].pixels[:]).reshape((-1,4))[:,:3].mean()
+        adaptive = mean("suzanne003_baked_ao")
+        #Bake the same AO without the cage, which must not darken it
+        bpy.data.objects["Suzanne"].select_set(True)
+        bpy.ops.bakemyscan.bake_textures(resolution=64, bake_ao=True, bake_albedo=False, bake_geometry=False, incremental=False)
+        reference = mean("suzanne003_baked_ao")
+        assert(abs(adaptive - reference) < 0.1 * reference + 0.01)
     def assert_mesh_file_created():
         assert(os.path.exists(_PATH("suzanne.mesh")))
         os.remove(_PATH("suzanne.mesh"))
     def assert_cube_read():
         assert( len(bpy.data.objects) == 1 )
         assert( len(bpy.context.active_object.data.polygons) == 12 )
+    def assert_cube_refs_read():
+        assert_cube_read()
+        assert( len(bpy.context.active_object.data.materials) == 6 )
+        assert( len(bpy.context.active_object.vertex_groups) == 1 )
+        assert( len(bpy.context.active_object.data.vertex_colors) == 1 )
+    def create_trailing_section_mesh():
+        with open(_PATH("cube.mesh")) as f:
+            content = f.read().replace("End", "")
+        with open(_PATH("cube_trailing.mesh"), "w") as f:
+            f.write(content + "Normals\n2000000\n" + "0 0 1\n" * 2000000 + "End\n")
+    def assert_trailing_section_skipped():
+        assert_cube_read()
+        fn_msh = sys.modules["BakeMyScan.src.fn_msh"]
+        durations = {}
+        for f in ["cube.mesh", "cube_trailing.mesh"]:
+            t = time.time()
+            sections = fn_msh.Mesh().readSections(_PATH(f), ["Vertices", "Triangles"])
+            durations[f] = time.time() - t
+            assert( len(sections["Triangles"]) == 12 )
+        os.remove(_PATH("cube_trailing.mesh"))
+        #The reader stops after the last wanted section instead of scanning the normals
+        assert( durations["cube_trailing.mesh"] < durations["cube.mesh"] + 0.1 )
     def assert_fbx_file_and_textures():
         assert(os.path.exists(_PATH("model.fbx")))
         os.remove(_PATH("model.fbx"))
@@ -293,6 +376,22 @@ if __name__ == "__main__":
         after = assert_model_imported
     )
 
+    #Import a .stl through the import operator
+    TESTS.add_operator(
+        name="import_stl_operator",
+        operator="import_scan",
+        args = {"filepath": _PATH( "cube.stl"), "fast": False},
+        after = assert_model_imported
+    )
+
+    #Import a binary .ply
+    TESTS.add_operator(
+        name="import_ply_binary",
+        operator="import_scan",
+        args = {"filepath": _PATH( "cube_binary.ply")},
+        after = assert_model_imported
+    )
+
     #Import a .fbx
     TESTS.add_operator(
         name="import_fbx",
@@ -362,6 +461,16 @@ if __name__ == "__main__":
         args={"limit":500}
     )
 
+    #Remesh suzanne to three levels of detail, each from the previous one
+    TESTS.add_operator(
+        name="lod_chain",
+        operator="lod_chain",
+        before=create_suzanne,
+        after=assert_suzanne_lods,
+        reset=True,
+        args={"method":"iterative", "levels":3, "limit":2000, "ratio":0.5, "textures":"none"}
+    )
+
     ############################################################################
     # 2.4 - External remeshing methods
     ############################################################################
@@ -397,6 +506,16 @@ if __name__ == "__main__":
             reset=True,
             args={"facescount":1500}
         )
+
+    #Remesh suzanne with mmgs and Instant Meshes running at once
+    TESTS.add_operator(
+        name="remesh_parallel",
+        operator="full_pipeline",
+        before=create_suzanne,
+        after=assert_suzanne_remeshed,
+        reset=True,
+        args={"parallel":True, "parallel_methods":{"mmgs", "instant"}, "parallel_workers":2, "parallel_timeout":600}
+    )
     """
     ############################################################################
     # 2.5 - PBR textures library operators
@@ -411,6 +530,15 @@ if __name__ == "__main__":
         reset=True
     )
 
+    #Read them again, only looking at what changed through the index
+    TESTS.add_operator(
+        name="update_library",
+        operator="create_library",
+        args={"filepath":_DIR},
+        after=assert_pbr_library_non_empty,
+        reset=True
+    )
+
     #Import a material which was read previously
     TESTS.add_operator(
         name="material_from_library",
@@ -450,6 +578,16 @@ if __name__ == "__main__":
         reset=False,
     )
 
+    #Read a library again after one of its images was overwritten in place
+    TESTS.add_operator(
+        name="update_library_rewritten",
+        operator="create_library",
+        args={"filepath":_PATH("rewritten") + os.sep},
+        before=rewrite_library_image,
+        after=assert_rewritten_image_sniffed,
+        reset=True
+    )
+
     ############################################################################
     # 2.6 - Other material operators
     ############################################################################
@@ -526,6 +664,60 @@ if __name__ == "__main__":
         reset=False,
     )
 
+    #Bake again without changes, the images should be reused
+    TESTS.add_operator(
+        name="rebake_textures",
+        operator="bake_textures",
+        args={
+            "resolution": 64,
+            "bake_albedo": True,
+            "bake_geometry": True,
+            "bake_surface": True,
+            "bake_roughness": True,
+            "bake_metallic": True
+        },
+        before=prepare_for_rebaking,
+        after=assert_unchanged_channels_reused,
+        reset=False,
+    )
+
+    #Bake the textures as 2x2 UDIM tiles, with a cage fitted to the source
+    TESTS.add_operator(
+        name="bake_textures_tiled",
+        operator="bake_textures",
+        args={
+            "resolution": 64,
+            "tiles": 2,
+            "adaptive_cage": True,
+            "tiles_directory": _PATH(""),
+            "bake_albedo": True,
+            "bake_ao": True,
+            "bake_geometry": True,
+            "bake_surface": True,
+            "bake_roughness": True
+        },
+        before=prepare_for_baking,
+        after=assert_baked_tiles,
+        reset=False,
+    )
+
+    #Bake the AO with a cage fitted to the source, which must not occlude it
+    TESTS.add_operator(
+        name="bake_ao_adaptive_cage",
+        operator="bake_textures",
+        args={
+            "resolution": 64,
+            "adaptive_cage": True,
+            "incremental": False,
+            "bake_albedo": False,
+            "bake_ao": True,
+            "bake_geometry": False
+        },
+        before=prepare_for_baking,
+        after=assert_adaptive_cage_ao_unoccluded,
+        reset=False,
+    )
+
     ############################################################################
     # 2.9 - Export operators
     ############################################################################
@@ -599,6 +791,31 @@ if __name__ == "__main__":
         after=assert_cube_read
     )
 
+    #Imports the binary version of the cube
+    TESTS.add_operator(
+        name="import_meshb",
+        operator="import_mesh",
+        args={"filepath":_PATH("cube.meshb")},
+        after=assert_cube_read
+    )
+
+    #Imports a cube with one reference per side and a .sol as a single object
+    TESTS.add_operator(
+        name="import_mesh_refs",
+        operator="import_mesh",
+        args={"filepath":_PATH("cube_refs.mesh")},
+        after=assert_cube_refs_read
+    )
+
+    #Imports a cube followed by a large unwanted section, which the reader must not scan
+    TESTS.add_operator(
+        name="import_mesh_trailing_section",
+        operator="import_mesh",
+        args={"filepath":_PATH("cube_trailing.mesh")},
+        before=create_trailing_section_mesh,
+        after=assert_trailing_section_skipped
+    )
+
     ############################################################################
     # 2.8 - Symmetry and mesh relaxation
     ############################################################################